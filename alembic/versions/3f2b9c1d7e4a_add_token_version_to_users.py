@@ -0,0 +1,26 @@
+"""add token_version to users
+
+Revision ID: 3f2b9c1d7e4a
+Revises: 8f1a9e4422ec
+Create Date: 2026-10-19 09:12:41.208733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f2b9c1d7e4a'
+down_revision: Union[str, None] = '8f1a9e4422ec'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,40 @@
+"""add sequence to outbox_events
+
+Revision ID: a7c3e9d5b2f8
+Revises: f6d2b8c4e1a7
+Create Date: 2026-10-19 22:41:05.918224
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9d5b2f8'
+down_revision: Union[str, None] = 'f6d2b8c4e1a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('outbox_events', sa.Column('sequence', sa.BigInteger(), nullable=True))
+    # the stock events already there are all committed, their id order is their commit order
+    op.execute(
+        "UPDATE outbox_events SET sequence = id "
+        "WHERE topic IN ('product.low_stock', 'product.restocked')"
+    )
+    op.create_index('ix_outbox_events_sequence', 'outbox_events', ['sequence'], unique=True,
+                    postgresql_where=sa.text('sequence IS NOT NULL'), sqlite_where=sa.text('sequence IS NOT NULL'))
+    op.execute(
+        "INSERT INTO row_versions (table_name, version) "
+        "SELECT 'stock_events', COALESCE(MAX(sequence), 0) FROM outbox_events"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM row_versions WHERE table_name = 'stock_events'")
+    op.drop_index('ix_outbox_events_sequence', table_name='outbox_events',
+                  postgresql_where=sa.text('sequence IS NOT NULL'), sqlite_where=sa.text('sequence IS NOT NULL'))
+    op.drop_column('outbox_events', 'sequence')
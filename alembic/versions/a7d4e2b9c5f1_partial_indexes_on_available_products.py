@@ -0,0 +1,30 @@
+"""partial indexes on available products
+
+Revision ID: a7d4e2b9c5f1
+Revises: f2c6a9d3b817
+Create Date: 2026-10-19 18:52:41.086235
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d4e2b9c5f1'
+down_revision: Union[str, None] = 'f2c6a9d3b817'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_products_available_id', 'products', ['id'], unique=False, postgresql_where=sa.text('available = true'), sqlite_where=sa.text('available = 1'))
+    op.create_index('ix_products_available_expiration_date', 'products', ['expiration_date'], unique=False, postgresql_where=sa.text('available = true'), sqlite_where=sa.text('available = 1'))
+    op.create_index('ix_products_available_initial_stock', 'products', ['initial_stock'], unique=False, postgresql_where=sa.text('available = true'), sqlite_where=sa.text('available = 1'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_available_initial_stock', table_name='products', postgresql_where=sa.text('available = true'), sqlite_where=sa.text('available = 1'))
+    op.drop_index('ix_products_available_expiration_date', table_name='products', postgresql_where=sa.text('available = true'), sqlite_where=sa.text('available = 1'))
+    op.drop_index('ix_products_available_id', table_name='products', postgresql_where=sa.text('available = true'), sqlite_where=sa.text('available = 1'))
@@ -0,0 +1,31 @@
+"""add reorder_threshold and low_stock to products
+
+Revision ID: b3e8f1c6d2a4
+Revises: a7d4e2b9c5f1
+Create Date: 2026-10-19 19:31:17.604512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8f1c6d2a4'
+down_revision: Union[str, None] = 'a7d4e2b9c5f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('reorder_threshold', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('products', sa.Column('low_stock', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.execute(sa.text("UPDATE products SET low_stock = :low WHERE initial_stock <= reorder_threshold").bindparams(low=True))
+    op.create_index('ix_products_low_stock_id', 'products', ['id'], unique=False, postgresql_where=sa.text('low_stock = true'), sqlite_where=sa.text('low_stock = 1'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_low_stock_id', table_name='products', postgresql_where=sa.text('low_stock = true'), sqlite_where=sa.text('low_stock = 1'))
+    op.drop_column('products', 'low_stock')
+    op.drop_column('products', 'reorder_threshold')
@@ -0,0 +1,30 @@
+"""add retired_reason to products
+
+Revision ID: b9d2f4a6c8e1
+Revises: a7c3e9d5b2f8
+Create Date: 2026-10-19 23:58:12.604317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9d2f4a6c8e1'
+down_revision: Union[str, None] = 'a7c3e9d5b2f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('retired_reason', sa.String(), nullable=True))
+    # the products retired before have no reason: whether the job or an admin
+    # took them out is unknown, they stay out until put back by hand
+    op.create_index('ix_products_out_of_stock_id', 'products', ['id'], unique=False, postgresql_where=sa.text("retired_reason = 'out_of_stock'"), sqlite_where=sa.text("retired_reason = 'out_of_stock'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_out_of_stock_id', table_name='products', postgresql_where=sa.text("retired_reason = 'out_of_stock'"), sqlite_where=sa.text("retired_reason = 'out_of_stock'"))
+    op.drop_column('products', 'retired_reason')
@@ -0,0 +1,79 @@
+"""money as numeric(12, 2)
+
+Revision ID: c0e47a95b1d3
+Revises: 5d7e0b3a9c12
+Create Date: 2026-10-19 13:48:05.331672
+
+Every amount of money becomes an exact NUMERIC(12, 2). order_items.subtotal
+was an INTEGER (truncated), so it is recomputed from the product prices,
+and the order totals are summed again from the items.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c0e47a95b1d3'
+down_revision: Union[str, None] = '5d7e0b3a9c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONEY = sa.Numeric(12, 2)
+
+
+def upgrade() -> None:
+    op.alter_column('products', 'sale_price',
+               existing_type=sa.DOUBLE_PRECISION(precision=53),
+               type_=MONEY,
+               postgresql_using='round(sale_price::numeric, 2)',
+               existing_nullable=False)
+    op.alter_column('order_items', 'subtotal',
+               existing_type=sa.Integer(),
+               type_=MONEY,
+               existing_nullable=True)
+    op.alter_column('orders', 'total_order_price',
+               existing_type=sa.Numeric(10, 2),
+               type_=MONEY,
+               existing_nullable=True)
+    op.alter_column('orders', 'subtotal',
+               existing_type=sa.DOUBLE_PRECISION(precision=53),
+               type_=MONEY,
+               postgresql_using='round(subtotal::numeric, 2)',
+               existing_nullable=False)
+
+    op.execute("""
+        UPDATE order_items SET subtotal = quantity * (
+            SELECT products.sale_price FROM products WHERE products.id = order_items.product_id
+        )
+    """)
+    op.execute("""
+        UPDATE orders SET total_order_price = totals.total, subtotal = totals.total
+        FROM (
+            SELECT orders.id, COALESCE(SUM(order_items.subtotal), 0) AS total
+            FROM orders LEFT JOIN order_items ON order_items.order_id = orders.id
+            GROUP BY orders.id
+        ) AS totals
+        WHERE totals.id = orders.id
+    """)
+
+
+def downgrade() -> None:
+    op.alter_column('orders', 'subtotal',
+               existing_type=MONEY,
+               type_=sa.DOUBLE_PRECISION(precision=53),
+               existing_nullable=False)
+    op.alter_column('orders', 'total_order_price',
+               existing_type=MONEY,
+               type_=sa.Numeric(10, 2),
+               existing_nullable=True)
+    op.alter_column('order_items', 'subtotal',
+               existing_type=MONEY,
+               type_=sa.Integer(),
+               existing_nullable=True)
+    op.alter_column('products', 'sale_price',
+               existing_type=MONEY,
+               type_=sa.DOUBLE_PRECISION(precision=53),
+               existing_nullable=False)
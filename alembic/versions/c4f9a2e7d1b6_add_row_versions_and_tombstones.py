@@ -0,0 +1,50 @@
+"""add row_version to products and clients, row_versions and tombstones
+
+Revision ID: c4f9a2e7d1b6
+Revises: b3e8f1c6d2a4
+Create Date: 2026-10-19 20:12:44.208391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f9a2e7d1b6'
+down_revision: Union[str, None] = 'b3e8f1c6d2a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('row_versions',
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('row_version', sa.BigInteger(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_table_name_row_version', 'tombstones', ['table_name', 'row_version'], unique=False)
+    for table in ('products', 'clients'):
+        op.add_column(table, sa.Column('row_version', sa.BigInteger(), server_default='0', nullable=False))
+        # the existing rows get distinct versions, a first sync from 0 returns all of them
+        op.execute(f"UPDATE {table} SET row_version = id")
+        op.create_index(op.f(f'ix_{table}_row_version'), table, ['row_version'], unique=False)
+        op.execute(f"INSERT INTO row_versions (table_name, version) SELECT '{table}', COALESCE(MAX(id), 0) FROM {table}")
+
+
+def downgrade() -> None:
+    for table in ('clients', 'products'):
+        op.drop_index(op.f(f'ix_{table}_row_version'), table_name=table)
+        op.drop_column(table, 'row_version')
+    op.drop_index('ix_tombstones_table_name_row_version', table_name='tombstones')
+    op.drop_table('tombstones')
+    op.drop_table('row_versions')
@@ -0,0 +1,38 @@
+"""owner-leading indexes on clients, owner_id on tombstones
+
+Revision ID: d8b1e5f3a9c2
+Revises: c4f9a2e7d1b6
+Create Date: 2026-10-19 20:47:03.551826
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8b1e5f3a9c2'
+down_revision: Union[str, None] = 'c4f9a2e7d1b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_clients_owner_id_name', 'clients', ['owner_id', 'name'], unique=False)
+    op.create_index('ix_clients_owner_id_email', 'clients', ['owner_id', 'email'], unique=False)
+    op.create_index('ix_clients_owner_id_cpf', 'clients', ['owner_id', 'cpf'], unique=False)
+    op.drop_index(op.f('ix_clients_name'), table_name='clients')
+    op.drop_index(op.f('ix_clients_email'), table_name='clients')
+    op.drop_index(op.f('ix_clients_cpf'), table_name='clients')
+    op.add_column('tombstones', sa.Column('owner_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tombstones', 'owner_id')
+    op.create_index(op.f('ix_clients_cpf'), 'clients', ['cpf'], unique=False)
+    op.create_index(op.f('ix_clients_email'), 'clients', ['email'], unique=False)
+    op.create_index(op.f('ix_clients_name'), 'clients', ['name'], unique=False)
+    op.drop_index('ix_clients_owner_id_cpf', table_name='clients')
+    op.drop_index('ix_clients_owner_id_email', table_name='clients')
+    op.drop_index('ix_clients_owner_id_name', table_name='clients')
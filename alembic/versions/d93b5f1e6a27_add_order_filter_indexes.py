@@ -0,0 +1,38 @@
+"""add order filter indexes
+
+Revision ID: d93b5f1e6a27
+Revises: c0e47a95b1d3
+Create Date: 2026-10-19 15:20:44.118906
+
+Indexes for the filters of crud.build_orders_query (created_at range,
+status, client_id, section through order_items.product_id) and for the
+order_items foreign keys, which had none.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd93b5f1e6a27'
+down_revision: Union[str, None] = 'c0e47a95b1d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_orders_created_at', 'orders', ['created_at'], unique=False)
+    op.create_index('ix_orders_status_created_at', 'orders', ['status', 'created_at'], unique=False)
+    op.create_index('ix_orders_client_id_created_at', 'orders', ['client_id', 'created_at'], unique=False)
+    op.create_index(op.f('ix_order_items_order_id'), 'order_items', ['order_id'], unique=False)
+    op.create_index('ix_order_items_product_id_order_id', 'order_items', ['product_id', 'order_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_order_items_product_id_order_id', table_name='order_items')
+    op.drop_index(op.f('ix_order_items_order_id'), table_name='order_items')
+    op.drop_index('ix_orders_client_id_created_at', table_name='orders')
+    op.drop_index('ix_orders_status_created_at', table_name='orders')
+    op.drop_index('ix_orders_created_at', table_name='orders')
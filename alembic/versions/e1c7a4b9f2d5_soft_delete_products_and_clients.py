@@ -0,0 +1,84 @@
+"""soft delete for products and clients, archive tables
+
+Revision ID: e1c7a4b9f2d5
+Revises: d8b1e5f3a9c2
+Create Date: 2026-10-19 21:23:38.914027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1c7a4b9f2d5'
+down_revision: Union[str, None] = 'd8b1e5f3a9c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LIVE = dict(postgresql_where=sa.text('deleted_at IS NULL'), sqlite_where=sa.text('deleted_at IS NULL'))
+DELETED = dict(postgresql_where=sa.text('deleted_at IS NOT NULL'), sqlite_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('clients', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    op.drop_index(op.f('ix_products_barcode'), table_name='products')
+    op.create_index('ix_products_barcode', 'products', ['barcode'], unique=True, **LIVE)
+    op.create_index('ix_products_live_id', 'products', ['id'], unique=False, **LIVE)
+    op.create_index('ix_products_deleted_at', 'products', ['deleted_at'], unique=False, **DELETED)
+
+    for column in ('name', 'email', 'cpf'):
+        op.drop_index(f'ix_clients_owner_id_{column}', table_name='clients')
+        op.create_index(f'ix_clients_owner_id_{column}', 'clients', ['owner_id', column], unique=False, **LIVE)
+    op.create_index('ix_clients_deleted_at', 'clients', ['deleted_at'], unique=False, **DELETED)
+
+    op.create_table('products_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('sale_price', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('barcode', sa.String(), nullable=True),
+    sa.Column('session', sa.String(), nullable=True),
+    sa.Column('initial_stock', sa.Integer(), nullable=True),
+    sa.Column('expiration_date', sa.DateTime(), nullable=True),
+    sa.Column('images', sa.String(), nullable=True),
+    sa.Column('available', sa.Boolean(), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=True),
+    sa.Column('reorder_threshold', sa.Integer(), nullable=True),
+    sa.Column('low_stock', sa.Boolean(), nullable=True),
+    sa.Column('row_version', sa.BigInteger(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('clients_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=True),
+    sa.Column('email', sa.String(), nullable=True),
+    sa.Column('cpf', sa.String(), nullable=True),
+    sa.Column('row_version', sa.BigInteger(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('clients_archive')
+    op.drop_table('products_archive')
+
+    op.drop_index('ix_clients_deleted_at', table_name='clients', **DELETED)
+    for column in ('name', 'email', 'cpf'):
+        op.drop_index(f'ix_clients_owner_id_{column}', table_name='clients', **LIVE)
+        op.create_index(f'ix_clients_owner_id_{column}', 'clients', ['owner_id', column], unique=False)
+
+    op.drop_index('ix_products_deleted_at', table_name='products', **DELETED)
+    op.drop_index('ix_products_live_id', table_name='products', **LIVE)
+    op.drop_index('ix_products_barcode', table_name='products', **LIVE)
+    op.create_index(op.f('ix_products_barcode'), 'products', ['barcode'], unique=True)
+
+    op.drop_column('clients', 'deleted_at')
+    op.drop_column('products', 'deleted_at')
@@ -0,0 +1,186 @@
+"""partition orders and order_items by month
+
+Revision ID: e5a8c2d4f719
+Revises: d93b5f1e6a27
+Create Date: 2026-10-19 17:02:36.457310
+
+PostgreSQL only, other databases keep plain tables.
+
+orders and order_items become RANGE partitioned on created_at, one
+partition per month (<table>_pYYYYMM) plus a DEFAULT partition for rows
+without a date. app/partitions.py creates the partitions of the coming
+months and detaches the old ones.
+
+A primary key or unique constraint of a partitioned table must contain
+the partition key, so the primary keys become (id, created_at) and
+order_items.order_id can no longer be a foreign key to orders: the
+application keeps that relation (ids still come from the same sequence).
+
+The data is copied, so run it in a maintenance window on big tables.
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a8c2d4f719'
+down_revision: Union[str, None] = 'd93b5f1e6a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+ORDERS_COLUMNS = "id, client_id, status, total_order_price, subtotal, created_at"
+ORDER_ITEMS_COLUMNS = "id, order_id, product_id, quantity, subtotal, created_at, updated_at"
+
+ORDERS_INDEXES = [
+    "CREATE INDEX ix_orders_id ON orders (id)",
+    "CREATE INDEX ix_orders_created_at ON orders (created_at)",
+    "CREATE INDEX ix_orders_status_created_at ON orders (status, created_at)",
+    "CREATE INDEX ix_orders_client_id_created_at ON orders (client_id, created_at)",
+]
+ORDER_ITEMS_INDEXES = [
+    "CREATE INDEX ix_order_items_id ON order_items (id)",
+    "CREATE INDEX ix_order_items_order_id ON order_items (order_id)",
+    "CREATE INDEX ix_order_items_product_id_order_id ON order_items (product_id, order_id)",
+]
+
+
+def _month(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _create_month_partitions(conn, table, first, last):
+    month = _month(first)
+    while month <= last:
+        conn.exec_driver_sql(
+            f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+        )
+        month = _next_month(month)
+
+
+def partition_tables(conn):
+    """Plain orders/order_items -> partitioned, keeping rows, ids and sequences."""
+    first = conn.exec_driver_sql("SELECT MIN(created_at) FROM orders").scalar() or datetime.utcnow()
+    first_item = conn.exec_driver_sql("SELECT MIN(created_at) FROM order_items").scalar() or first
+    first = min(first, first_item)
+    last = datetime.utcnow()
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+
+    for table in ("orders", "order_items"):
+        conn.exec_driver_sql(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+        # the sequence would be dropped with its old table
+        conn.exec_driver_sql(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+    conn.exec_driver_sql("""
+        CREATE TABLE orders (
+            id INTEGER NOT NULL DEFAULT nextval('orders_id_seq'),
+            client_id INTEGER REFERENCES clients (id),
+            status VARCHAR,
+            total_order_price NUMERIC(12, 2),
+            subtotal NUMERIC(12, 2) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+        ) PARTITION BY RANGE (created_at)
+    """)
+    conn.exec_driver_sql("""
+        CREATE TABLE order_items (
+            id INTEGER NOT NULL DEFAULT nextval('order_items_id_seq'),
+            order_id INTEGER,
+            product_id INTEGER REFERENCES products (id),
+            quantity INTEGER,
+            subtotal NUMERIC(12, 2),
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            updated_at TIMESTAMP WITHOUT TIME ZONE
+        ) PARTITION BY RANGE (created_at)
+    """)
+    for table in ("orders", "order_items"):
+        conn.exec_driver_sql(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        _create_month_partitions(conn, table, first, last)
+
+    # rows without a date land in the DEFAULT partition
+    conn.exec_driver_sql(f"""
+        INSERT INTO orders ({ORDERS_COLUMNS})
+        SELECT id, client_id, status, total_order_price, subtotal, COALESCE(created_at, '1970-01-01')
+        FROM orders_unpartitioned
+    """)
+    conn.exec_driver_sql(f"""
+        INSERT INTO order_items ({ORDER_ITEMS_COLUMNS})
+        SELECT id, order_id, product_id, quantity, subtotal, COALESCE(created_at, '1970-01-01'), updated_at
+        FROM order_items_unpartitioned
+    """)
+    conn.exec_driver_sql("DROP TABLE order_items_unpartitioned")
+    conn.exec_driver_sql("DROP TABLE orders_unpartitioned")
+
+    # keys and indexes after the copy, the bulk load is faster without them
+    conn.exec_driver_sql("ALTER TABLE orders ADD PRIMARY KEY (id, created_at)")
+    conn.exec_driver_sql("ALTER TABLE order_items ADD PRIMARY KEY (id, created_at)")
+    for statement in ORDERS_INDEXES + ORDER_ITEMS_INDEXES:
+        conn.exec_driver_sql(statement)
+    for table in ("orders", "order_items"):
+        conn.exec_driver_sql(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+
+def unpartition_tables(conn):
+    for table in ("orders", "order_items"):
+        conn.exec_driver_sql(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+        conn.exec_driver_sql(f"ALTER TABLE {table}_partitioned DROP CONSTRAINT {table}_pkey")
+        conn.exec_driver_sql(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        for name in conn.exec_driver_sql(
+            "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname LIKE 'ix_%%'",
+            (f"{table}_partitioned",),
+        ).scalars().all():
+            conn.exec_driver_sql(f"DROP INDEX {name}")
+
+    conn.exec_driver_sql("""
+        CREATE TABLE orders (
+            id INTEGER NOT NULL DEFAULT nextval('orders_id_seq') PRIMARY KEY,
+            client_id INTEGER REFERENCES clients (id),
+            status VARCHAR,
+            total_order_price NUMERIC(12, 2),
+            subtotal NUMERIC(12, 2) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """)
+    conn.exec_driver_sql("""
+        CREATE TABLE order_items (
+            id INTEGER NOT NULL DEFAULT nextval('order_items_id_seq') PRIMARY KEY,
+            order_id INTEGER REFERENCES orders (id),
+            product_id INTEGER REFERENCES products (id),
+            quantity INTEGER,
+            subtotal NUMERIC(12, 2),
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            updated_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """)
+    conn.exec_driver_sql(f"INSERT INTO orders ({ORDERS_COLUMNS}) SELECT {ORDERS_COLUMNS} FROM orders_partitioned")
+    conn.exec_driver_sql(
+        f"INSERT INTO order_items ({ORDER_ITEMS_COLUMNS}) SELECT {ORDER_ITEMS_COLUMNS} FROM order_items_partitioned"
+    )
+    conn.exec_driver_sql("DROP TABLE order_items_partitioned")
+    conn.exec_driver_sql("DROP TABLE orders_partitioned")
+    for statement in ORDERS_INDEXES + ORDER_ITEMS_INDEXES:
+        conn.exec_driver_sql(statement)
+    for table in ("orders", "order_items"):
+        conn.exec_driver_sql(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        partition_tables(conn)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        unpartition_tables(conn)
@@ -0,0 +1,42 @@
+"""create table order_sections
+
+Revision ID: f2c6a9d3b817
+Revises: e5a8c2d4f719
+Create Date: 2026-10-19 18:14:09.532871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c6a9d3b817'
+down_revision: Union[str, None] = 'e5a8c2d4f719'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    constraints = [sa.PrimaryKeyConstraint('order_id', 'section')]
+    if op.get_bind().dialect.name != 'postgresql':
+        # orders is partitioned on Postgres (e5a8c2d4f719), its id alone is not unique there
+        constraints.append(sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ))
+    op.create_table('order_sections',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('section', sa.String(), nullable=False),
+    *constraints
+    )
+    op.create_index('ix_order_sections_section_order_id', 'order_sections', ['section', 'order_id'], unique=False)
+    op.execute("""
+        INSERT INTO order_sections (order_id, section)
+        SELECT DISTINCT order_items.order_id, products.session
+        FROM order_items JOIN products ON products.id = order_items.product_id
+        WHERE order_items.order_id IS NOT NULL AND products.session IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_order_sections_section_order_id', table_name='order_sections')
+    op.drop_table('order_sections')
@@ -0,0 +1,38 @@
+"""add bootstrap_claims
+
+Revision ID: f6d2b8c4e1a7
+Revises: e1c7a4b9f2d5
+Create Date: 2026-10-19 21:58:12.370415
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6d2b8c4e1a7'
+down_revision: Union[str, None] = 'e1c7a4b9f2d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('bootstrap_claims',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('claimed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # a database with users already has its first admin, no signup may claim it again
+    op.execute(
+        "INSERT INTO bootstrap_claims (name, user_id, claimed_at) "
+        "SELECT 'first_admin', (SELECT MIN(id) FROM users WHERE role = 'admin'), CURRENT_TIMESTAMP "
+        "WHERE EXISTS (SELECT 1 FROM users)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('bootstrap_claims')
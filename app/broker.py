@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+from typing import Callable, Optional, Set
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+
+"""
+    ORDER EVENTS BROKER - push channel behind /ws/orders and /orders/events
+
+    order.created / order.updated messages are published once the
+    transaction that wrote them commits, and fanned out to every subscriber
+    (one per open WebSocket or SSE stream) of the worker process.
+
+    BROKER_BACKEND:
+        memory    (default) publish inside the process that made the change,
+                  enough with a single worker
+        postgres  NOTIFY in the writing transaction, every worker LISTENs
+                  and feeds its own subscribers, so a change made on any
+                  worker reaches the streams of all of them
+
+    Slow consumers never block the publisher: every subscriber has a queue of
+    BROKER_QUEUE_SIZE messages, when it is full the oldest message is dropped
+    and counted, and the stream tells the client it lagged (it should
+    re-read the orders it watches).
+"""
+logger = logging.getLogger(__name__)
+
+BACKEND = os.getenv("BROKER_BACKEND", "memory")
+QUEUE_SIZE = int(os.getenv("BROKER_QUEUE_SIZE", "100"))
+CHANNEL = "order_events"
+# NOTIFY payloads are limited to 8000 bytes
+MAX_NOTIFY_BYTES = 7900
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, accept: Callable[[dict], bool], maxsize: int):
+        self.loop = loop
+        self.accept = accept
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, message: dict):
+        """Runs on the subscriber's loop."""
+        if not self.accept(message):
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self) -> dict:
+        message = await self.queue.get()
+        if self.dropped:
+            message = {**message, "dropped": self.dropped}
+            self.dropped = 0
+        return message
+
+
+class Broker:
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, accept: Optional[Callable[[dict], bool]] = None) -> Subscription:
+        """Call from the event loop that will consume the subscription."""
+        subscription = Subscription(asyncio.get_running_loop(), accept or (lambda message: True), self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, message: dict):
+        """Thread-safe, never blocks: each subscriber gets the message on its own loop."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                # its loop is closed, the stream is gone
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+def order_filter(order_id: Optional[int] = None, client_id: Optional[int] = None):
+    def accept(message: dict):
+        return (order_id is None or message.get("order_id") == order_id) and \
+            (client_id is None or message.get("client_id") == client_id)
+    return accept
+
+
+def format_sse(message: dict) -> str:
+    return f"event: {message['type']}\ndata: {json.dumps(message, default=str)}\n\n"
+
+
+def publish_after_commit(db: Session, message: dict):
+    """Deliver message to the subscribers if and when db's transaction commits."""
+    if BACKEND == "postgres":
+        payload = json.dumps(message, default=str)
+        if len(payload.encode()) > MAX_NOTIFY_BYTES:
+            logger.warning("order event too large for NOTIFY, not published: %s", message.get("order_id"))
+            return
+        # NOTIFY is transactional: delivered on commit, dropped on rollback
+        db.execute(func.pg_notify(CHANNEL, payload).select())
+        return
+
+    db.connection()  # ties the message to the transaction, even if nothing ran in it yet
+    settled = []  # a rolled back message is never delivered by a later commit
+
+    def deliver(session):
+        if not settled:
+            settled.append(True)
+            broker.publish(message)
+
+    def discard(session):
+        settled.append(True)
+
+    event.listen(db, "after_commit", deliver, once=True)
+    event.listen(db, "after_rollback", discard, once=True)
+
+
+class PostgresListener:
+    """Thread LISTENing on CHANNEL and republishing every notification to the local broker."""
+
+    def __init__(self, engine, poll_seconds: float = 1.0):
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="order-events-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_seconds * 2)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("order events listener failed, reconnecting")
+                self._stop.wait(self.poll_seconds)
+
+    def _listen(self):
+        raw = self.engine.raw_connection()
+        try:
+            connection = raw.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            while not self._stop.is_set():
+                if select.select([connection], [], [], self.poll_seconds) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    broker.publish(json.loads(notify.payload))
+        finally:
+            raw.invalidate()  # a LISTENing connection must not go back to the pool
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Hashable
+
+
+"""
+    Small in-process caches
+
+    Per worker process and lost on restart: only for data that may be a few
+    seconds stale, never for anything that has to be consistent between
+    workers.
+"""
+class TTLCache:
+    """Thread-safe mapping whose entries expire ttl seconds after being set."""
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return default
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    # still full of live entries, drop the oldest one
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (now + self.ttl, value)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+        Concurrent calls with the same key share one execution of fn: the
+        first caller runs it, the ones arriving meanwhile wait for its result
+        (or its exception). Nothing is kept once it returns, a call arriving
+        after that runs fn again. For the threadpool, not the event loop.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._requests = Counter()
+        self._executions = Counter()
+
+    def do(self, name: str, key: Hashable, fn: Callable[[], Any]):
+        with self._lock:
+            self._requests[name] += 1
+            flight = self._flights.get((name, key))
+            leader = flight is None
+            if leader:
+                flight = self._flights[(name, key)] = _Flight()
+                self._executions[name] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[(name, key)]
+            flight.done.set()
+        return flight.result
+
+    def stats(self):
+        """Per name: requests, executions and the share of requests that joined another one."""
+        with self._lock:
+            return {
+                name: {
+                    "requests": requests,
+                    "executions": self._executions[name],
+                    "collapse_ratio": round(1 - self._executions[name] / requests, 4),
+                }
+                for name, requests in self._requests.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._executions.clear()
@@ -0,0 +1,173 @@
+import os
+import threading
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+"""
+    In-process views of the product catalog
+
+    BarcodeIndex answers the checkout scanners (GET /products/by-barcode)
+    from a dict instead of a query. It is loaded at startup, kept current by
+    the product writes committed through any Session of this process, and
+    reloaded in full every BARCODE_INDEX_REFRESH_SECONDS to pick up the
+    writes of the other workers. A barcode it doesn't know is looked up
+    through the unique barcode index and remembered.
+"""
+REFRESH_SECONDS = int(os.getenv("BARCODE_INDEX_REFRESH_SECONDS", "60"))
+ENABLED = os.getenv("BARCODE_INDEX", "on") == "on"
+
+
+class ScannedProduct:
+    """What the till needs of a product, without an ORM object behind it."""
+    __slots__ = ("id", "barcode", "description", "sale_price", "initial_stock", "available")
+
+    def __init__(self, id: int, barcode: str, description: Optional[str], sale_price: Decimal,
+                 initial_stock: int, available: Optional[bool]):
+        self.id = id
+        self.barcode = barcode
+        self.description = description
+        self.sale_price = sale_price
+        self.initial_stock = initial_stock
+        self.available = available
+
+    @classmethod
+    def from_product(cls, product: models.Product):
+        return cls(product.id, product.barcode, product.description, product.sale_price,
+                   product.initial_stock, product.available)
+
+
+COLUMNS = [getattr(models.Product, name) for name in ScannedProduct.__slots__]
+
+
+class BarcodeIndex:
+    def __init__(self):
+        self._by_barcode: Dict[str, ScannedProduct] = {}
+        self._barcode_of: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._by_barcode)
+
+    def load(self, db: Session):
+        """Replace the whole index with the current catalog."""
+        by_barcode, barcode_of = {}, {}
+        for row in db.query(*COLUMNS).filter(models.Product.barcode.isnot(None)).yield_per(10000):
+            product = ScannedProduct(*row)
+            by_barcode[product.barcode] = product
+            barcode_of[product.id] = product.barcode
+        with self._lock:
+            self._by_barcode, self._barcode_of = by_barcode, barcode_of
+            self.loaded = True
+
+    def put(self, product: ScannedProduct):
+        with self._lock:
+            previous = self._barcode_of.get(product.id)
+            if previous is not None and previous != product.barcode:
+                self._by_barcode.pop(previous, None)
+            if product.barcode is None:
+                self._barcode_of.pop(product.id, None)
+                return
+            self._by_barcode[product.barcode] = product
+            self._barcode_of[product.id] = product.barcode
+
+    def forget(self, product_ids: Iterable[int]):
+        with self._lock:
+            for product_id in product_ids:
+                barcode = self._barcode_of.pop(product_id, None)
+                if barcode is not None:
+                    self._by_barcode.pop(barcode, None)
+
+    def set_stock(self, product_id: int, stock: int):
+        with self._lock:
+            barcode = self._barcode_of.get(product_id)
+            if barcode is not None:
+                self._by_barcode[barcode].initial_stock = stock
+
+    def clear(self):
+        with self._lock:
+            self._by_barcode.clear()
+            self._barcode_of.clear()
+            self.loaded = False
+
+    def lookup(self, db: Session, barcodes: List[str]) -> Dict[str, ScannedProduct]:
+        """Known barcodes from memory, the others in one query; unknown ones are left out."""
+        found = {code: self._by_barcode[code] for code in barcodes if code in self._by_barcode}
+        missing = [code for code in dict.fromkeys(barcodes) if code not in found]
+        if missing:
+            for row in db.query(*COLUMNS).filter(models.Product.barcode.in_(missing)):
+                product = ScannedProduct(*row)
+                found[product.barcode] = product
+                if ENABLED:
+                    self.put(product)
+        return found
+
+
+barcodes = BarcodeIndex()
+
+
+def refresh_barcodes(session_factory=None):
+    from .database import SessionLocal
+    db = (session_factory or SessionLocal)()
+    try:
+        barcodes.load(db)
+    finally:
+        db.close()
+
+
+def record_stock(db: Session, stock: Dict[int, int]):
+    """
+        Stock written by a bulk UPDATE, which the ORM events below don't see;
+        applied to the in-process views when db commits.
+    """
+    if ENABLED:
+        db.info.setdefault("catalog_stock", {}).update(stock)
+
+
+def retire(product_ids: List[int]):
+    """Products a committed bulk UPDATE made unavailable."""
+    barcodes.forget(product_ids)
+
+
+"""
+    Product writes reach the in-process views on commit: after_flush records
+    what each flush wrote (new, changed and deleted products, soft deleted
+    included), after_commit applies it and a rollback drops it.
+"""
+@event.listens_for(Session, "after_flush")
+def _record_product_writes(session, flush_context):
+    if not ENABLED:
+        return
+    written = session.info.setdefault("catalog_written", {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Product):
+            written[obj.id] = ScannedProduct.from_product(obj) if obj.deleted_at is None else None
+    for obj in session.deleted:
+        if isinstance(obj, models.Product):
+            written[obj.id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_product_writes(session):
+    written = session.info.pop("catalog_written", None) or {}
+    stock = session.info.pop("catalog_stock", None) or {}
+    deleted = [product_id for product_id, product in written.items() if product is None]
+    products = [product for product in written.values() if product is not None]
+    if ENABLED:
+        barcodes.forget(deleted)
+        for product in products:
+            barcodes.put(product)
+        for product_id, value in stock.items():
+            barcodes.set_stock(product_id, value)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_product_writes(session):
+    session.info.pop("catalog_written", None)
+    session.info.pop("catalog_stock", None)
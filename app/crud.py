@@ -1,14 +1,45 @@
+import os
+import uuid
 from datetime import datetime
+from decimal import Decimal
 from typing import Optional
-from sqlalchemy import or_
-from sqlalchemy.orm import Session
-from . import models, schemas
+from sqlalchemy import delete, func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session, selectinload
+from . import broker, catalog, models, schemas, sync
 from passlib.context import CryptContext
 from sqlalchemy.exc import IntegrityError
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+"""
+    MULTI-GET
+"""
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", "100"))
+
+
+def parse_ids(ids: str):
+    """ "3,1,2" -> [3, 1, 2], in the order asked, between 1 and BATCH_MAX_IDS of them."""
+    try:
+        parsed = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise ValueError("ids must be a comma separated list of integers")
+    if not parsed:
+        raise ValueError("ids must not be empty")
+    if len(parsed) > BATCH_MAX_IDS:
+        raise ValueError(f"At most {BATCH_MAX_IDS} ids per request")
+    return parsed
+
+
+def get_many(db: Session, model, ids, *options, owner_id: Optional[int] = None):
+    """Rows of model by id in one IN query, in the order of ids, plus the ids not found (or not owned)."""
+    query = db.query(model).options(*options).filter(model.id.in_(set(ids)))
+    if owner_id is not None:
+        query = query.filter(model.owner_id == owner_id)
+    found = {row.id: row for row in query}
+    return [found[id] for id in ids if id in found], [id for id in ids if id not in found]
+
+
 """
     USERS
 """
@@ -16,32 +47,85 @@ def get_user(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 
+def get_user_by_id(db: Session, user_id: int):
+    return db.query(models.User).filter(models.User.id == user_id).first()
+
+
+def get_user_token_version(db: Session, user_id: int):
+    return db.query(models.User.token_version).filter(models.User.id == user_id).scalar()
+
+
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 
 def create_user(db: Session, user: schemas.UserCreate):
+    """
+        One INSERT, the unique indexes on username and email reject the
+        duplicates (ValueError with the message of the column). No count of
+        the users table: the first user becomes admin by claiming
+        first_admin, see claim_first_admin.
+    """
     hashed_password = pwd_context.hash(user.password)
-    
-    existing_users = db.query(models.User).count()
-    
-    role = "admin" if existing_users == 0 else "regular"
-    
-    db_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password, role=role)
+    db_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password, role="regular")
+    db.add(db_user)
     try:
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-        return db_user
-    except IntegrityError:
+        db.flush()
+    except IntegrityError as exc:
         db.rollback()
-        return None
+        raise ValueError(duplicate_user_message(exc))
+
+    claimed = claim_first_admin(db, db_user)
+    db.commit()
+    if claimed:
+        first_admin.claimed = True
+    db.refresh(db_user)
+    return db_user
+
+
+def duplicate_user_message(exc: IntegrityError) -> str:
+    # the constraint name (Postgres) or "UNIQUE constraint failed: users.email"
+    # (sqlite), never the offending value, which could contain anything
+    violated = getattr(getattr(exc.orig, "diag", None), "constraint_name", None) or str(exc.orig)
+    return "Email already registered" if "email" in violated else "Username already registered"
+
+
+class FirstAdmin:
+    # once first_admin is known to be taken this process stops trying
+    claimed = False
+
+
+first_admin = FirstAdmin()
+
+
+def claim_first_admin(db: Session, db_user: models.User) -> bool:
+    """
+        Make db_user admin if nobody claimed first_admin yet. Race free: two
+        signups can't both insert the claim row, the loser stays regular.
+        Runs until this process sees the claim taken, then costs nothing.
+        Returns whether this call inserted the claim row.
+    """
+    if first_admin.claimed:
+        return False
+    try:
+        with db.begin_nested():
+            # a database that had users before the claims existed: nobody gets promoted
+            first = db.query(models.User.id).filter(models.User.id != db_user.id).limit(1).first() is None
+            db.add(models.BootstrapClaim(name="first_admin", user_id=db_user.id if first else None))
+    except IntegrityError:
+        first_admin.claimed = True
+        return False
+    if first:
+        db_user.role = "admin"
+    return True
 
 
 def update_user_role(db: Session, user_id: int, new_role: str):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if user:
         user.role = new_role
+        # tokens issued with the old role claim stop being accepted
+        user.token_version = models.User.token_version + 1
         db.commit()
         db.refresh(user)
     return user
@@ -51,6 +135,56 @@ def get_all_users(db: Session):
     return db.query(models.User).all()
 
 
+"""
+    REFRESH TOKENS
+"""
+def create_refresh_token(db: Session, user_id: int, family_id: str, expires_at: datetime):
+    db_token = models.RefreshToken(jti=uuid.uuid4().hex, user_id=user_id, family_id=family_id, expires_at=expires_at)
+    db.add(db_token)
+    return db_token
+
+
+def get_refresh_token(db: Session, jti: str):
+    return db.query(models.RefreshToken).filter(models.RefreshToken.jti == jti).first()
+
+
+def rotate_refresh_token(db: Session, jti: str) -> bool:
+    """
+        Revoke the refresh token being exchanged, False if it was revoked
+        already. Conditional UPDATE: of two concurrent refreshes with the same
+        token only one gets the row, the other one is a reuse.
+    """
+    result = db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.jti == jti, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def revoke_refresh_token_family(db: Session, family_id: str):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.family_id == family_id,
+        models.RefreshToken.revoked_at.is_(None)
+    ).update({models.RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
+
+def purge_expired_refresh_tokens(db: Session, batch_size: int = 1000):
+    """Delete expired tokens (revoked or not) in small batches walking the expires_at index."""
+    now = datetime.utcnow()
+    purged = 0
+    while True:
+        expired = select(models.RefreshToken.jti).where(models.RefreshToken.expires_at < now).limit(batch_size)
+        deleted = db.execute(
+            delete(models.RefreshToken).where(models.RefreshToken.jti.in_(expired.scalar_subquery()))
+        ).rowcount
+        db.commit()
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+
+
 """
     CLIENT
 """
@@ -58,12 +192,18 @@ def get_clients_by_owner(db: Session, owner_id: int):
     return db.query(models.Client).filter(models.Client.owner_id == owner_id).all()
 
 
-def get_client_by_id(db: Session, client_id: int):
-    return db.query(models.Client).filter(models.Client.id == client_id).first()
+def scope_clients(query, owner_id: Optional[int]):
+    """
+        The clients of one seller; owner_id None (admins) sees every seller.
+        Served by the (owner_id, ...) indexes of clients.
+    """
+    if owner_id is None:
+        return query
+    return query.filter(models.Client.owner_id == owner_id)
 
 
-# def get_client_by_id(db: Session, client_id: int, owner_id: int):
-#     return db.query(models.Client).filter(models.Client.id == client_id, models.Client.owner_id == owner_id).first()
+def get_client_by_id(db: Session, client_id: int, owner_id: Optional[int] = None):
+    return scope_clients(db.query(models.Client), owner_id).filter(models.Client.id == client_id).first()
 
 
 def create_client(db: Session, client: schemas.ClientCreate, owner_id: int):
@@ -81,17 +221,17 @@ def create_client(db: Session, client: schemas.ClientCreate, owner_id: int):
     if existing_client_email:
         raise ValueError(f"Client with email {client.email} already exists for this user")
     
-    db_client = models.Client(**client.dict(), owner_id=owner_id)
+    db_client = models.Client(**client.model_dump(), owner_id=owner_id)
     db.add(db_client)
     db.commit()
     db.refresh(db_client)
     return db_client
 
 
-def update_client(db: Session, client_id: int, client_update: schemas.ClientUpdate):
-    db_client = db.query(models.Client).filter(models.Client.id == client_id).first()
+def update_client(db: Session, client_id: int, client_update: schemas.ClientUpdate, owner_id: Optional[int] = None):
+    db_client = get_client_by_id(db, client_id, owner_id)
     if db_client:
-        for key, value in client_update.dict(exclude_unset=True).items():
+        for key, value in client_update.model_dump(exclude_unset=True).items():
             setattr(db_client, key, value)
         db.commit()
         db.refresh(db_client)
@@ -99,10 +239,11 @@ def update_client(db: Session, client_id: int, client_update: schemas.ClientUpda
     return None
 
 
-def delete_client(db: Session, client_id: int):
-    db_client = db.query(models.Client).filter(models.Client.id == client_id).first()
+def delete_client(db: Session, client_id: int, owner_id: Optional[int] = None):
+    db_client = get_client_by_id(db, client_id, owner_id)
     if db_client:
-        db.delete(db_client)
+        # soft delete, its orders still point at it
+        db_client.deleted_at = datetime.utcnow()
         db.commit()
         return True
     return False
@@ -127,8 +268,10 @@ def get_products(db: Session, skip: int = 0, limit: int = 10, name: str = None,
 
 
 def create_product(db: Session, product: schemas.ProductCreate):
-    db_product = models.Product(**product.dict())
+    db_product = models.Product(**product.model_dump())
     db.add(db_product)
+    db.flush()
+    sync_low_stock(db, db_product)
     db.commit()
     db.refresh(db_product)
     return db_product
@@ -137,25 +280,167 @@ def create_product(db: Session, product: schemas.ProductCreate):
 def update_product(db: Session, product_id: int, product: schemas.ProductUpdate):
     db_product = get_product(db, product_id)
     if db_product:
-        for key, value in product.dict(exclude_unset=True).items():
+        changes = product.model_dump(exclude_unset=True)
+        previous_section = db_product.session
+        for key, value in changes.items():
             setattr(db_product, key, value)
+        if db_product.available:
+            # put back by hand, the availability job has no say in it anymore
+            db_product.retired_reason = None
+        if "session" in changes and changes["session"] != previous_section:
+            db.flush()
+            rebuild_order_sections(db, product_id=product_id)
+        sync_low_stock(db, db_product)
         db.commit()
         db.refresh(db_product)
     return db_product
 
 
+def sync_low_stock(db: Session, db_product: models.Product):
+    """
+        Recompute low_stock after a change of stock or threshold; crossing the
+        threshold either way queues product.low_stock / product.restocked.
+    """
+    db_product.low_stock = low_stock_crossing(
+        db, db_product.id, db_product.initial_stock, db_product.reorder_threshold, db_product.low_stock
+    )
+
+
+def low_stock_crossing(db: Session, product_id: int, stock: int, threshold: Optional[int], was_low: Optional[bool]):
+    """sync_low_stock on plain values, for the bulk stock updates. Returns the new low_stock."""
+    low = stock <= (threshold or 0)
+    if low != bool(was_low):
+        sync.stamp_stock_event(db, add_outbox_event(db, "product.low_stock" if low else "product.restocked", {
+            "product_id": product_id,
+            "initial_stock": stock,
+            "reorder_threshold": threshold,
+        }))
+    return low
+
+
+def get_low_stock_products(db: Session, after_id: int = 0, limit: int = 100):
+    """Keyset page of the low stock products, served by the partial index on low_stock."""
+    return (
+        db.query(models.Product)
+        .filter(models.Product.low_stock == True, models.Product.id > after_id)
+        .order_by(models.Product.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def get_stock_events(db: Session, after: int = 0, limit: int = 100):
+    """
+        Threshold crossings committed after the sequence after, in commit
+        order, from the outbox table (only stock events have a sequence).
+    """
+    return (
+        db.query(models.OutboxEvent)
+        .filter(models.OutboxEvent.sequence > after)
+        .order_by(models.OutboxEvent.sequence)
+        .limit(limit)
+        .all()
+    )
+
+
+def retire_unavailable_products(db: Session, now: Optional[datetime] = None, batch_size: int = 1000):
+    """
+        Mark expired and out of stock products as unavailable, and make the
+        ones it retired for lack of stock available again once restocked
+        (and still not expired). batch_size rows per transaction so no lock
+        is held for long, every pass walks a partial index. A product hidden
+        by hand (PUT available false) has no retired_reason and stays hidden.
+        Returns how many changed.
+    """
+    now = now or datetime.utcnow()
+    changed = 0
+    passes = (
+        ((models.Product.available == True, models.Product.expiration_date <= now),
+         {"available": False, "retired_reason": "expired"}),
+        ((models.Product.available == True, models.Product.initial_stock <= 0),
+         {"available": False, "retired_reason": "out_of_stock"}),
+        ((models.Product.retired_reason == "out_of_stock", models.Product.available == False,
+          models.Product.initial_stock > 0,
+          or_(models.Product.expiration_date.is_(None), models.Product.expiration_date > now)),
+         {"available": True, "retired_reason": None}),
+    )
+    for conditions, values in passes:
+        while True:
+            # lock the version counter before the products, the order of every
+            # ORM write (before_flush stamps the version, then the UPDATE runs)
+            sync.next_versions(db, "products", 0)
+            ids = db.scalars(
+                select(models.Product.id)
+                .where(*conditions)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if ids:
+                # stamped by hand, a bulk UPDATE skips the flush that versions the rows
+                version = sync.next_versions(db, "products", len(ids))
+                db.execute(update(models.Product), [
+                    {"id": product_id, **values, "row_version": version + n}
+                    for n, product_id in enumerate(ids)
+                ])
+            db.commit()
+            # a bulk UPDATE skips the ORM events that keep the in-process catalog
+            # current; forgotten, a product is read again on its next scan
+            catalog.retire(ids)
+            changed += len(ids)
+            if len(ids) < batch_size:
+                break
+    return changed
+
+
 def delete_product(db: Session, product_id: int):
     db_product = get_product(db, product_id)
     if db_product:
-        db.delete(db_product)
+        # soft delete, the order items still point at it
+        db_product.deleted_at = datetime.utcnow()
         db.commit()
     return db_product
 
 
+def purge_deleted(db: Session, model, older_than: datetime, batch_size: int = 500):
+    """
+        Move the rows of model (Product or Client) deleted before older_than
+        to its archive table, batch_size rows per transaction so no lock is
+        held for long. Rows an order still references stay where they are,
+        soft deleted. Returns how many moved.
+    """
+    table = model.__table__
+    archive = models.Base.metadata.tables[f"{table.name}_archive"]
+    if model is models.Product:
+        referenced = select(models.OrderItem.product_id).where(models.OrderItem.product_id == model.id)
+    else:
+        referenced = select(models.Order.client_id).where(models.Order.client_id == model.id)
+    columns = [table.c[column.name] for column in archive.columns if column.name in table.c]
+    moved = 0
+    while True:
+        ids = db.scalars(
+            select(model.id)
+            .where(model.deleted_at <= older_than, ~referenced.exists())
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .execution_options(include_deleted=True)
+        ).all()
+        if ids:
+            now = datetime.utcnow()
+            db.execute(insert(archive).from_select(
+                [column.name for column in columns] + ["archived_at"],
+                select(*columns, literal(now)).where(table.c.id.in_(ids)),
+            ))
+            db.execute(delete(table).where(table.c.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+        if len(ids) < batch_size:
+            return moved
+
+
 """
     ORDER
 """
-def get_orders(
+def build_orders_query(
     db: Session,
     skip: int = 0,
     limit: int = 10,
@@ -166,6 +451,7 @@ def get_orders(
     status: Optional[str] = None,
     client_id: Optional[int] = None
 ):
+    """The query behind get_orders, also EXPLAINed by tests/test_query_plans.py."""
     query = db.query(models.Order)
 
     if start_date:
@@ -173,7 +459,11 @@ def get_orders(
     if end_date:
         query = query.filter(models.Order.created_at <= end_date)
     if section:
-        query = query.join(models.Order.items).join(models.OrderItem.product).filter(models.Product.session == section)
+        # semi-join on order_sections: one row per order whatever the number of
+        # matching items, so limit returns full pages without DISTINCT
+        query = query.filter(models.Order.id.in_(
+            select(models.OrderSection.order_id).where(models.OrderSection.section == section)
+        ))
     if order_id:
         query = query.filter(models.Order.id == order_id)
     if status:
@@ -183,45 +473,126 @@ def get_orders(
 
     query = query.order_by(models.Order.id.asc())
 
-    query = query.offset(skip).limit(limit)
+    return query.offset(skip).limit(limit)
+
 
-    return query.all()
+def get_orders(db: Session, **filters):
+    return build_orders_query(db, **filters).all()
 
 
 def get_order(db: Session, order_id: int):
     return db.query(models.Order).filter(models.Order.id == order_id).first()
 
 
+def get_orders_by_ids(db: Session, order_ids):
+    # the items of every order in one more query, not one per order
+    return get_many(db, models.Order, order_ids, selectinload(models.Order.items))
+
+
 def create_order(db: Session, order: schemas.OrderCreate):
-    db_order = models.Order(client_id=order.client_id, status="pending")
+    """
+        Order, items, stock and the order.created event are committed together or not at all.
+
+        The lines are validated and priced in bulk: one SELECT ... FOR UPDATE
+        of the plain columns of every product in the basket and one UPDATE of
+        their stock, no Product object is loaded, whatever the basket size.
+        Prices and stock come from those locked rows, never from an in-process
+        copy of the catalog that another worker may have changed since.
+    """
+    quantities = {}
+    for item in order.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    Product = models.Product
+    rows = {
+        row.id: row for row in db.execute(
+            select(Product.id, Product.sale_price, Product.initial_stock, Product.reorder_threshold, Product.low_stock)
+            .where(Product.id.in_(quantities))
+            .order_by(Product.id)  # same lock order in every transaction
+            .with_for_update()
+        )
+    }
+    for product_id, quantity in quantities.items():
+        if product_id not in rows:
+            db.rollback()
+            raise ValueError(f"Product with id {product_id} not found")
+        if rows[product_id].initial_stock < quantity:
+            db.rollback()
+            raise ValueError(f"Not enough stock available for product with id {product_id}")
+
+    # one timestamp for the order and its items, they land in the same monthly partition
+    now = datetime.utcnow()
+    db_order = models.Order(client_id=order.client_id, status="pending", created_at=now)
     db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
-
-    # add items order
     for item in order.items:
-        product = db.query(models.Product).get(item.product_id)
-        subtotal = item.quantity * product.sale_price
-
-        if product.initial_stock < item.quantity:
-            raise ValueError(f"Not enough stock available for product with id {item.product_id}")
-
-        db_item = models.OrderItem(
-            order_id=db_order.id,
+        db_order.items.append(models.OrderItem(
             product_id=item.product_id,
             quantity=item.quantity,
-            subtotal=subtotal,
-            created_at=datetime.now(),
-            updated_at=datetime.now()
-        )
-        db.add(db_item)
-    product.initial_stock -= item.quantity
+            subtotal=item.quantity * rows[item.product_id].sale_price,
+            created_at=now,
+            updated_at=now
+        ))
+    db_order.total_order_price = db_order.subtotal = sum((db_item.subtotal for db_item in db_order.items), Decimal(0))
+
+    stock = {}
+    for product_id, quantity in quantities.items():
+        row = rows[product_id]
+        stock[product_id] = {
+            "id": product_id,
+            "initial_stock": row.initial_stock - quantity,
+            "low_stock": low_stock_crossing(
+                db, product_id, row.initial_stock - quantity, row.reorder_threshold, row.low_stock
+            ),
+        }
+    db.execute(update(Product), list(stock.values()))
+    catalog.record_stock(db, {product_id: values["initial_stock"] for product_id, values in stock.items()})
+
+    db_order.update_sections()
+    db.flush()
+    add_order_event(db, "order.created", db_order)
     db.commit()
 
     db.refresh(db_order)
     return db_order
 
 
+def create_order_item(db: Session, order_id: int, order_item: schemas.OrderItemCreate):
+    product = db.get(models.Product, order_item.product_id)
+    if product is None:
+        raise ValueError(f"Product with id {order_item.product_id} not found")
+    db_item = models.OrderItem(order_id=order_id, product=product, quantity=order_item.quantity)
+    db_item.reprice()
+    db.add(db_item)
+    return db_item
+
+
+def rebuild_order_sections(db, product_id: Optional[int] = None):
+    """
+        Recompute order_sections in bulk, for the orders containing product_id
+        or for every order. Works on a Session or a Connection.
+    """
+    order_ids = select(models.OrderItem.order_id).where(models.OrderItem.order_id.isnot(None))
+    if product_id is not None:
+        order_ids = order_ids.where(models.OrderItem.product_id == product_id)
+    db.execute(delete(models.OrderSection).where(models.OrderSection.order_id.in_(order_ids)))
+    db.execute(insert(models.OrderSection).from_select(
+        ["order_id", "section"],
+        select(models.OrderItem.order_id, models.Product.session).distinct()
+        .join(models.Product, models.Product.id == models.OrderItem.product_id)
+        .where(models.OrderItem.order_id.in_(order_ids), models.Product.session.isnot(None)),
+    ))
+
+
+def get_orders_total(db: Session, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+    """Revenue over a period, summed by the database."""
+    query = db.query(func.coalesce(func.sum(models.Order.total_order_price), 0))
+    if start_date:
+        query = query.filter(models.Order.created_at >= start_date)
+    if end_date:
+        query = query.filter(models.Order.created_at <= end_date)
+    return query.scalar()
+
+
 def update_order(db: Session, order_id: int, order_update: schemas.OrderUpdate):
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if db_order:
@@ -238,9 +609,12 @@ def update_order(db: Session, order_id: int, order_update: schemas.OrderUpdate):
                 ).first()
                 if db_item:
                     db_item.quantity = item_update.quantity
+                    db_item.reprice()
                     db_item.updated_at = datetime.utcnow()
         
         db_order.update_total_order_price()
+        db_order.update_sections()
+        add_order_event(db, "order.updated", db_order)
         db.commit()
         db.refresh(db_order)
     return db_order
@@ -253,3 +627,26 @@ def delete_order(db: Session, order_id: int) -> Optional[schemas.Order]:
         db.commit()
         return db_order
     return None
+
+
+"""
+    OUTBOX
+"""
+def add_outbox_event(db: Session, topic: str, payload: dict):
+    """Queue a side effect in the caller's transaction, app/outbox.py runs it after commit."""
+    db_event = models.OutboxEvent(topic=topic, payload=payload)
+    db.add(db_event)
+    return db_event
+
+
+def add_order_event(db: Session, topic: str, db_order: models.Order, **extra):
+    """Outbox event for the side effects, plus a message for the live order feeds once committed."""
+    payload = {
+        "order_id": db_order.id,
+        "client_id": db_order.client_id,
+        "status": db_order.status,
+        "total_order_price": str(db_order.total_order_price),
+        **extra,
+    }
+    broker.publish_after_commit(db, {"type": topic, **payload})
+    return add_outbox_event(db, topic, payload)
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+from datetime import datetime
+from functools import partial
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import crud, models, schemas
+from .cache import TTLCache
+
+
+"""
+    DASHBOARD - every widget of the back-office home page in one request
+
+    The widgets are independent queries: with a session bound to the engine
+    each one runs in the threadpool on a connection of its own, so the
+    response takes as long as the slowest widget, not their sum. A session
+    bound to a single connection (the tests' transaction) runs them one
+    after the other on it.
+
+    The fan-out borrows from the same pool as every request of the worker
+    (about 12 connections per worker with DB_MAX_CONNECTIONS=100 over 8
+    workers, see database.pool_budget): the request's own session gives its
+    connection back first, and at most DASHBOARD_MAX_CONNECTIONS widgets of
+    all the dashboards being built in this process hold one at a time, the
+    others wait for a turn without one.
+
+    The client count is scoped like the client endpoints: a seller counts
+    their own clients, an admin everybody's. Every other widget is the same
+    for everybody, so the result is cached per scope (one entry per seller,
+    one shared by the admins) for DASHBOARD_CACHE_SECONDS (0 disables it).
+"""
+CACHE_SECONDS = float(os.getenv("DASHBOARD_CACHE_SECONDS", "10"))
+RECENT_ORDERS = 10
+LOW_STOCK_LIMIT = 10
+MAX_CONNECTIONS = int(os.getenv("DASHBOARD_MAX_CONNECTIONS", "3"))
+
+connections = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+cache = TTLCache(ttl=CACHE_SECONDS)
+
+
+def counts(db: Session, owner_id: Optional[int] = None):
+    return {
+        "orders": db.query(func.count(models.Order.id)).scalar(),
+        "clients": crud.scope_clients(db.query(func.count(models.Client.id)), owner_id).scalar(),
+        "products": db.query(func.count(models.Product.id)).scalar(),
+        "available_products": db.query(func.count(models.Product.id)).filter(models.Product.available == True).scalar(),
+    }
+
+
+def orders_by_status(db: Session):
+    return dict(db.query(models.Order.status, func.count(models.Order.id)).group_by(models.Order.status).all())
+
+
+def recent_orders(db: Session):
+    return db.query(models.Order).order_by(models.Order.id.desc()).limit(RECENT_ORDERS).all()
+
+
+def low_stock(db: Session):
+    return (
+        db.query(models.Product)
+        .filter(models.Product.low_stock == True, models.Product.available == True)
+        .order_by(models.Product.initial_stock - models.Product.reorder_threshold, models.Product.id)
+        .limit(LOW_STOCK_LIMIT)
+        .all()
+    )
+
+
+def revenue(db: Session, now: datetime = None):
+    now = now or datetime.utcnow()
+    return {
+        "today": crud.get_orders_total(db, start_date=datetime(now.year, now.month, now.day)),
+        "month_to_date": crud.get_orders_total(db, start_date=datetime(now.year, now.month, 1)),
+        "year_to_date": crud.get_orders_total(db, start_date=datetime(now.year, 1, 1)),
+    }
+
+
+WIDGETS = {
+    "counts": counts,
+    "orders_by_status": orders_by_status,
+    "recent_orders": recent_orders,
+    "low_stock": low_stock,
+    "revenue": revenue,
+}
+# widgets taking the owner_id of crud.scope_clients
+OWNER_SCOPED = {"counts"}
+
+
+def widgets_for(owner_id: Optional[int]):
+    return [partial(widget, owner_id=owner_id) if name in OWNER_SCOPED else widget for name, widget in WIDGETS.items()]
+
+
+def _run_alone(bind, widget):
+    with connections, Session(bind=bind) as session:
+        return widget(session)
+
+
+async def build_dashboard(db: Session, owner_id: Optional[int] = None):
+    bind = db.get_bind()
+    widgets = widgets_for(owner_id)
+    if isinstance(bind, Engine):
+        db.close()  # the connection of get_token_data, if it took one, back to the pool
+        results = await asyncio.gather(*(run_in_threadpool(_run_alone, bind, widget) for widget in widgets))
+    else:
+        results = [await run_in_threadpool(widget, db) for widget in widgets]
+    return schemas.Dashboard.model_validate(
+        {**dict(zip(WIDGETS, results)), "generated_at": datetime.utcnow()}, from_attributes=True
+    )
+
+
+async def get_dashboard(db: Session, owner_id: Optional[int] = None) -> schemas.Dashboard:
+    key = ("owner", owner_id)
+    cached = cache.get(key)
+    if cached is None:
+        cached = await build_dashboard(db, owner_id)
+        if CACHE_SECONDS > 0:
+            cache.set(key, cached)
+    return cached
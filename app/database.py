@@ -2,7 +2,7 @@ from sqlalchemy import create_engine, Column, Integer, String, ForeignKey
 # from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from databases import Database
+from sqlalchemy.pool import StaticPool
 from dotenv import load_dotenv
 import os
 
@@ -11,8 +11,60 @@ load_dotenv()
 
 DATABASE_URL=os.getenv('DATABASE_URL')
 
-database = Database(DATABASE_URL)
-engine = create_engine(DATABASE_URL)
+
+"""
+    Connection pool budget
+
+    Every worker process (WEB_CONCURRENCY, see app/serve.py) has its own
+    pool, so the connections the app may open are workers x (pool_size +
+    max_overflow). With DB_MAX_CONNECTIONS set (the share of the server's
+    max_connections given to this app) the budget is split between the
+    workers, after DB_RESERVED_CONNECTIONS for migrations, cron jobs and
+    psql. DB_POOL_SIZE / DB_MAX_OVERFLOW override the split.
+
+    A request waiting for a connection gives up after DB_POOL_TIMEOUT seconds.
+"""
+def pool_budget(max_connections: int, workers: int, reserved: int = 0):
+    """(pool_size, max_overflow) of one worker; half of its share kept open, the rest for bursts."""
+    share = (max_connections - reserved) // workers
+    if share < 1:
+        raise ValueError(
+            f"{max_connections} connections ({reserved} reserved) can't be split between {workers} workers"
+        )
+    pool_size = (share + 1) // 2
+    return pool_size, share - pool_size
+
+
+def pool_options():
+    options = {
+        "pool_pre_ping": True,
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    }
+    max_connections = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+    if max_connections:
+        options["pool_size"], options["max_overflow"] = pool_budget(
+            max_connections,
+            workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+            reserved=int(os.getenv("DB_RESERVED_CONNECTIONS", "0")),
+        )
+    if os.getenv("DB_POOL_SIZE"):
+        options["pool_size"] = int(os.getenv("DB_POOL_SIZE"))
+    if os.getenv("DB_MAX_OVERFLOW"):
+        options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW"))
+    return options
+
+
+engine_options = {}
+if DATABASE_URL.startswith("sqlite"):
+    # sqlite (benchmarks and tests) needs the connection shared with the threadpool
+    engine_options["connect_args"] = {"check_same_thread": False}
+    if DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+        # one in-memory database for the whole process, not one per connection
+        engine_options["poolclass"] = StaticPool
+else:
+    engine_options.update(pool_options())
+
+engine = create_engine(DATABASE_URL, **engine_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
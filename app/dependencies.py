@@ -3,6 +3,8 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
+import time
+import uuid
 from . import crud, models, schemas
 from .database import get_db
 import os
@@ -13,9 +15,17 @@ load_dotenv()
 SECRET_KEY=os.getenv('SECRET_KEY')
 ALGORITHM=os.getenv('ALGORITHM')
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', '7'))
+
+# how long a worker trusts its copy of a user's token_version; a revocation
+# is seen at once by the worker that made it and after this delay by the others
+TOKEN_VERSION_CACHE_SECONDS = int(os.getenv('TOKEN_VERSION_CACHE_SECONDS', '30'))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# user id -> (token_version, loaded at)
+_token_versions = {}
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
@@ -26,7 +36,66 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+
+def create_user_access_token(user: models.User, expires_delta: timedelta = None):
+    """Access token carrying the claims needed to authorize without the users table."""
+    return create_access_token(
+        data={"sub": user.username, "uid": user.id, "role": user.role, "ver": user.token_version},
+        expires_delta=expires_delta,
+    )
+
+
+def issue_tokens(db: Session, user: models.User, family_id: str = None):
+    """
+        Access token + a new refresh token of the given family (a new family
+        on login). The refresh token row is added to the session, the caller
+        commits.
+    """
+    expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    db_token = crud.create_refresh_token(
+        db, user_id=user.id, family_id=family_id or uuid.uuid4().hex, expires_at=expires_at
+    )
+    refresh_token = jwt.encode(
+        {
+            "sub": user.username, "uid": user.id, "ver": user.token_version, "type": "refresh",
+            "jti": db_token.jti, "fam": db_token.family_id, "exp": expires_at,
+        },
+        SECRET_KEY, algorithm=ALGORITHM,
+    )
+    access_token = create_user_access_token(user, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+def decode_refresh_token(token: str):
+    """Refresh token payload, or None when the signature, expiry or type is wrong."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != "refresh" or not payload.get("jti"):
+        return None
+    return payload
+
+
+def get_token_version(db: Session, user_id: int):
+    cached = _token_versions.get(user_id)
+    now = time.monotonic()
+    if cached and now - cached[1] < TOKEN_VERSION_CACHE_SECONDS:
+        return cached[0]
+    version = crud.get_user_token_version(db, user_id)
+    _token_versions[user_id] = (version, now)
+    return version
+
+
+def forget_token_version(user_id: int):
+    _token_versions.pop(user_id, None)
+
+
+async def get_token_data(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """
+        Authenticate from the token claims alone. The only database access is
+        the token_version check, cached per user for TOKEN_VERSION_CACHE_SECONDS.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -35,18 +104,39 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("type") == "refresh":
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = crud.get_user(db, username=username)
-    if user is None:
+
+    if payload.get("uid") is None:
+        # token issued before the claims existed, look the user up once more
+        user = crud.get_user(db, username=username)
+        if user is None:
+            raise credentials_exception
+        return schemas.TokenData(id=user.id, username=user.username, role=user.role, token_version=user.token_version)
+
+    token_data = schemas.TokenData(
+        id=payload["uid"], username=username, role=payload.get("role", "regular"), token_version=payload.get("ver", 0)
+    )
+    if get_token_version(db, token_data.id) != token_data.token_version:
         raise credentials_exception
+    return token_data
+
+
+async def get_current_user(token_data: schemas.TokenData = Depends(get_token_data), db: Session = Depends(get_db)):
+    """For the endpoints that need the User entity itself, not just who is calling."""
+    user = crud.get_user_by_id(db, user_id=token_data.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 
-async def get_current_active_user(current_user: schemas.User = Depends(get_current_user)):
+async def get_current_active_user(current_user: schemas.TokenData = Depends(get_token_data)):
     if current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient privileges")
     return current_user
-
@@ -0,0 +1,62 @@
+from typing import Dict, List, Optional, Sequence, Type
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, noload, selectinload
+
+from .schemas import list_adapter
+
+
+"""
+    Sparse fieldsets for the list endpoints
+
+        GET /?fields=id,status,total_order_price
+
+    The selected fields become the SQL projection (load_only), relationships
+    left out are never loaded (noload) and the ones asked for are loaded in
+    one extra query for the whole page (selectinload) instead of one per
+    row. Without fields the endpoints answer exactly as before.
+"""
+ORDER_FIELDS = ("id", "client_id", "status", "total_order_price", "items")
+PRODUCT_FIELDS = (
+    "id", "description", "sale_price", "barcode", "session", "initial_stock", "expiration_date", "images", "available",
+    "reorder_threshold", "low_stock",
+)
+
+
+def parse_fields(value: Optional[str], allowed: Sequence[str]) -> Optional[List[str]]:
+    """Requested field names in the allowed order, None when fields was not sent."""
+    if value is None:
+        return None
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown or not requested:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}")
+    return [name for name in allowed if name in requested]
+
+
+def loader_options(model, fields: List[str]):
+    mapper = inspect(model)
+    columns = [getattr(model, name) for name in fields if name in mapper.column_attrs]
+    options = [load_only(*columns)] if columns else [load_only(*mapper.primary_key)]
+    for name in mapper.relationships.keys():
+        relationship = getattr(model, name)
+        options.append(selectinload(relationship) if name in fields else noload(relationship))
+    return options
+
+
+def sparse_rows(rows, fields: List[str], nested: Optional[Dict[str, Type[BaseModel]]] = None):
+    """JSON-ready dicts holding only the fields; nested maps a relationship to its schema."""
+    nested = nested or {}
+    result = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            value = getattr(row, name)
+            if name in nested:
+                adapter = list_adapter(nested[name])
+                value = adapter.dump_python(adapter.validate_python(value), mode="json")
+            item[name] = value
+        result.append(item)
+    return jsonable_encoder(result)
@@ -1,4 +1,9 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import datetime, timedelta
@@ -7,7 +12,14 @@ from .crud import pwd_context
 from . import crud, models, schemas
 from passlib.context import CryptContext
 from .database import SessionLocal, engine, get_db
-from .dependencies import create_access_token, get_current_active_user, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
+from .dependencies import (
+    decode_refresh_token, forget_token_version, get_current_active_user, get_token_data, issue_tokens
+)
+from . import broker, catalog, dashboard, fields as sparse, outbox, partitions, provision, scheduler, sync
+from .cache import SingleFlight
+import asyncio
+import json
+import os
 from .sentry_setup import init_sentry
 from .exception_handlers import sentry_exception_handler, http_exception_handler
 
@@ -31,6 +43,63 @@ async def custom_sentry_exception_handler(request: Request, exc: Exception):
 async def custom_http_exception_handler(request: Request, exc: HTTPException):
     return await http_exception_handler(request, exc)
 
+"""
+    Compression of the responses larger than COMPRESSION_MINIMUM_SIZE bytes,
+    brotli when brotli-asgi is installed (gzip for the clients without br),
+    gzip otherwise. COMPRESSION=off leaves it to a proxy in front.
+"""
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+COMPRESSION = os.getenv("COMPRESSION", "auto")
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1000"))
+
+if COMPRESSION == "auto" and BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE, gzip_fallback=True)
+elif COMPRESSION in ("auto", "gzip"):
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+
+"""
+    Request coalescing for the hot catalog reads (GET /products/{id} and
+    GET /products/ during promotions): identical requests arriving while
+    one is running wait for it and get the same JSON, one query and one
+    serialization for all of them. The key is the normalized parameters
+    plus the role of the caller. SINGLE_FLIGHT=off runs every request.
+"""
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "on") == "on"
+reads = SingleFlight()
+
+
+def coalesced(name: str, key, render):
+    """JSON response of render(), shared with the identical requests in flight."""
+    body = reads.do(name, key, render) if SINGLE_FLIGHT else render()
+    return Response(body, media_type="application/json")
+
+
+def render_json(content) -> bytes:
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def client_owner(current_user: schemas.TokenData) -> Optional[int]:
+    """Sellers see their own clients, admins everybody's."""
+    return None if current_user.role == "admin" else current_user.id
+
+
+def parse_ids_or_400(ids: str):
+    try:
+        return crud.parse_ids(ids)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+
+def parse_fields_or_400(fields: Optional[str], allowed):
+    try:
+        return sparse.parse_fields(fields, allowed)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
 
 """
     Ensuring that the first user registered with the bank is an administrator
@@ -39,16 +108,132 @@ async def custom_http_exception_handler(request: Request, exc: HTTPException):
 def init_first_user():
     db = SessionLocal()
     try:
-        existing_users = db.query(models.User).count()
-        if existing_users == 0:
+        if db.get(models.BootstrapClaim, "first_admin") is None and db.query(models.User.id).first() is None:
             first_user = schemas.UserCreate(username="admin", email="admin@example.com", password="admin")
-            crud.create_user(db=db, user=first_user)
+            try:
+                crud.create_user(db=db, user=first_user)
+            except ValueError:
+                pass  # another worker got there first
+    finally:
+        db.close()
+
+"""
+    Expired refresh tokens are useless, revoked or not: sweep them every
+    REFRESH_TOKEN_SWEEP_SECONDS (0 disables it)
+"""
+def sweep_refresh_tokens():
+    db = SessionLocal()
+    try:
+        crud.purge_expired_refresh_tokens(db)
     finally:
         db.close()
 
+scheduler.schedule(sweep_refresh_tokens, int(os.getenv("REFRESH_TOKEN_SWEEP_SECONDS", "3600")))
+
+"""
+    Deleted products and clients nobody's order references move to the
+    archive tables DELETED_RETENTION_DAYS after their deletion, in batches
+    of PURGE_DELETED_BATCH_SIZE, every PURGE_DELETED_SECONDS (0 disables it)
+"""
+def purge_deleted_rows():
+    older_than = datetime.utcnow() - timedelta(days=int(os.getenv("DELETED_RETENTION_DAYS", "90")))
+    batch_size = int(os.getenv("PURGE_DELETED_BATCH_SIZE", "500"))
+    db = SessionLocal()
+    try:
+        for model in (models.Product, models.Client):
+            crud.purge_deleted(db, model, older_than, batch_size=batch_size)
+    finally:
+        db.close()
+
+scheduler.schedule(purge_deleted_rows, int(os.getenv("PURGE_DELETED_SECONDS", "3600")))
+
+"""
+    Expired or out of stock products leave the catalog every
+    PRODUCT_AVAILABILITY_SECONDS (0 disables it), in batches of
+    PRODUCT_AVAILABILITY_BATCH_SIZE. The out of stock ones come back on the
+    first run after a restock, unless expired meanwhile
+"""
+def retire_unavailable_products():
+    db = SessionLocal()
+    try:
+        crud.retire_unavailable_products(db, batch_size=int(os.getenv("PRODUCT_AVAILABILITY_BATCH_SIZE", "1000")))
+    finally:
+        db.close()
+
+scheduler.schedule(retire_unavailable_products, int(os.getenv("PRODUCT_AVAILABILITY_SECONDS", "300")))
+
+# the barcode index also reloads in full, for the writes made by the other workers
+scheduler.schedule(catalog.refresh_barcodes, catalog.REFRESH_SECONDS if catalog.ENABLED else 0)
+
+# small deployments drain the outbox here instead of running python -m app.outbox
+if os.getenv("OUTBOX_WORKER") == "inprocess":
+    scheduler.schedule(outbox.drain_pending, outbox.POLL_SECONDS)
+
+# monthly partitions of orders/order_items, a no-op outside Postgres
+scheduler.schedule(partitions.maintain_partitions, int(os.getenv("PARTITION_MAINTENANCE_SECONDS", "86400")))
+
+# with BROKER_BACKEND=postgres every worker listens to the order events of all of them
+order_events_listener = (
+    broker.PostgresListener(engine) if broker.BACKEND == "postgres" and engine.dialect.name == "postgresql" else None
+)
+
 @app.on_event("startup")
 async def startup_event():
     init_first_user()
+    partitions.maintain_partitions()
+    if catalog.ENABLED:
+        catalog.refresh_barcodes()
+    scheduler.start()
+    if order_events_listener:
+        order_events_listener.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await scheduler.stop()
+    if order_events_listener:
+        order_events_listener.stop()
+
+
+"""
+    HEALTH - for the load balancer / orchestrator, no authentication
+
+    /health/live answers as long as the worker serves requests, /health/ready
+    also needs a database connection (one SELECT 1 from the pool).
+
+    Example Response:
+    {
+        "status": "ok"
+    }
+"""
+@app.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def readiness(db: Session = Depends(get_db)):
+    try:
+        db.execute(text("SELECT 1"))
+    except SQLAlchemyError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database unavailable")
+    return {"status": "ok"}
+
+
+"""
+    Request coalescing metrics - User be logged in
+
+    Since the worker started, per coalesced read: requests served,
+    queries actually run and the share of requests that joined one already
+    in flight. Per worker process.
+
+    Example Response:
+    {
+        "product": {"requests": 1200, "executions": 85, "collapse_ratio": 0.9292},
+        "products": {"requests": 300, "executions": 41, "collapse_ratio": 0.8633}
+    }
+"""
+@app.get("/metrics/single-flight")
+def single_flight_metrics(current_user: schemas.TokenData = Depends(get_token_data)):
+    return reads.stats()
 
 
 """
@@ -63,7 +248,8 @@ async def startup_event():
     {
         "access_token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJzdWIiOiJtcmRpZ2l0YWwyIiwiZXhwIjoxNzE4ODI2Mjk3fQ.
         HY-acf3b6ytcILh_1Yj4RyvB2pNIx6_QAA0pjB2pTZM",
-        "token_type": "bearer"
+        "token_type": "bearer",
+        "refresh_token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9..."
     }
 """
 @app.post("/token", response_model=schemas.Token)
@@ -75,11 +261,83 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+    tokens = issue_tokens(db, user)
+    db.commit()
+    return tokens
+
+
+"""
+    TOKEN - Exchange a refresh token for a new access token, no password needed
+
+    The refresh token is rotated: the one sent is revoked and a new one is
+    returned. Sending an already rotated refresh token again revokes the
+    whole login (token family), since it means the token leaked.
+
+    Example Request:
+    {
+        "refresh_token": "string"
+    }
+
+    Example Response:
+    {
+        "access_token": "string",
+        "token_type": "bearer",
+        "refresh_token": "string"
+    }
+"""
+@app.post("/token/refresh", response_model=schemas.Token)
+def refresh_access_token(body: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    payload = decode_refresh_token(body.refresh_token)
+    if payload is None:
+        raise credentials_exception
+
+    db_token = crud.get_refresh_token(db, jti=payload["jti"])
+    if db_token is None:
+        raise credentials_exception
+    if db_token.revoked_at is not None:
+        crud.revoke_refresh_token_family(db, family_id=db_token.family_id)
+        db.commit()
+        raise credentials_exception
+
+    user = crud.get_user_by_id(db, user_id=db_token.user_id)
+    if user is None or user.token_version != payload.get("ver"):
+        raise credentials_exception
+
+    if not crud.rotate_refresh_token(db, jti=db_token.jti):
+        # rotated by a concurrent refresh since we read it: reuse all the same
+        crud.revoke_refresh_token_family(db, family_id=db_token.family_id)
+        db.commit()
+        raise credentials_exception
+    tokens = issue_tokens(db, user, family_id=db_token.family_id)
+    db.commit()
+    return tokens
+
+
+"""
+    TOKEN - Logout: revoke a refresh token and every token rotated from the same login
+
+    Example Request:
+    {
+        "refresh_token": "string"
+    }
+
+    Example Response:
+    {
+        "message": "Refresh token revoked"
+    }
+"""
+@app.post("/token/revoke", response_model=dict)
+def revoke_refresh_token(body: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    payload = decode_refresh_token(body.refresh_token)
+    if payload is not None and payload.get("fam"):
+        crud.revoke_refresh_token_family(db, family_id=payload["fam"])
+        db.commit()
+    return {"message": "Refresh token revoked"}
 
 
 """
@@ -107,18 +365,42 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 """
 @app.post("/users/", response_model=schemas.User)
-async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    # verify if a username exits
-    db_user_by_username = crud.get_user(db, username=user.username)
-    if db_user_by_username:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already registered")
-    
-    # Verify if an email exists
-    db_user_by_email = crud.get_user_by_email(db, email=user.email)
-    if db_user_by_email:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-    
-    return crud.create_user(db=db, user=user)
+def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    try:
+        # duplicated username or email: rejected by the unique indexes of the INSERT itself
+        return crud.create_user(db=db, user=user)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+
+"""
+    Bulk Create Users - The user must have the role of admin and be logged in
+    Every user is created as regular; the ones whose username or email is
+    taken come back in conflicts (index = position in users), the others
+    are created anyway. See app/provision.py, also for the CLI.
+    Example Request:
+    {
+        "users": [
+            {"username": "caixa1", "email": "caixa1@example.com", "password": "string"},
+            {"username": "caixa2", "email": "admin@example.com", "password": "string"}
+        ]
+    }
+
+    Example Response:
+    {
+        "created": [
+            {"id": 7, "username": "caixa1", "email": "caixa1@example.com", "role": "regular"}
+        ],
+        "conflicts": [
+            {"index": 1, "username": "caixa2", "email": "admin@example.com", "detail": "Email already registered"}
+        ]
+    }
+"""
+@app.post("/users/bulk", response_model=schemas.UserBulkResult)
+def bulk_create_users(
+    payload: schemas.UserBulkCreate, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_current_active_user)
+):
+    return provision.provision_users(db, payload.users)
 
 
 """
@@ -141,11 +423,12 @@ async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 """
 @app.put("/users/{user_id}/role/", response_model=schemas.User)
 async def update_user_role(
-    user_id: int, new_role: str, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)
+    user_id: int, new_role: str, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_current_active_user)
 ):
     updated_user = crud.update_user_role(db=db, user_id=user_id, new_role=new_role)
     if not updated_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    forget_token_version(user_id)
     return updated_user
 
 
@@ -163,9 +446,7 @@ async def update_user_role(
     ]
 """
 @app.get("/users/", response_model=List[schemas.User])
-async def read_users(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    if current_user.role != "admin":
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+async def read_users(db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_current_active_user)):
     return crud.get_all_users(db)
 
 
@@ -191,7 +472,7 @@ async def read_users(db: Session = Depends(get_db), current_user: models.User =
 """
 @app.post("/clients/", response_model=schemas.Client)
 async def create_client_for_user(
-    client: schemas.ClientCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)
+    client: schemas.ClientCreate, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_token_data)
 ):
     try:
         return crud.create_client(db=db, client=client, owner_id=current_user.id)
@@ -203,6 +484,8 @@ async def create_client_for_user(
 """
     List all clients - User be logged in
 
+    Only the clients of the logged in seller, admins see every seller's.
+
     - **skip**: Filter Number of results to skip (default: 0).
     - **limit**: Filter limit results for page (default: 10, max: 100).
     - **name**: Filter for name client (opcional).
@@ -226,9 +509,9 @@ async def read_clients(
     db: Session = Depends(get_db),
     name: str = Query(None, description="Filtrar cliente pelo nome"),
     email: str = Query(None, description="Filtrar cliente pelo email"),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.TokenData = Depends(get_token_data)
 ):
-    query = db.query(models.Client)
+    query = crud.scope_clients(db.query(models.Client), client_owner(current_user))
 
     if name:
         query = query.filter(models.Client.name.ilike(f"%{name}%"))
@@ -242,6 +525,64 @@ async def read_clients(
 
 
 
+"""
+    Clients by id, many at once - User be logged in
+
+    One IN query for the whole list instead of one request per
+    GET /clients/{client_id}. Same order as ids, unknown ids in missing.
+    Declared before /clients/{client_id}.
+
+    - **ids**: Comma separated ids, e.g. 3,1,2 (at most BATCH_MAX_IDS, default 100).
+
+    Example Response:
+    {
+        "clients": [
+            {"id": 3, "name": "Maria", "email": "maria@example.com", "cpf": "12345678900", "owner_id": 1}
+        ],
+        "missing": [1, 2]
+    }
+"""
+@app.get("/clients/batch", response_model=schemas.ClientBatch)
+def read_clients_batch(
+    ids: str = Query(..., description="Ids separados por vírgula"),
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    clients, missing = crud.get_many(db, models.Client, parse_ids_or_400(ids), owner_id=client_owner(current_user))
+    return {"clients": clients, "missing": missing}
+
+
+"""
+    Client changes - User be logged in
+
+    Delta sync for the POS terminals: the clients written and the ids
+    deleted after the version since, oldest first. Start with since=0 (the
+    whole list), then pass back the next of every answer; more says there
+    is another batch right away. Declared before /clients/{client_id}.
+
+    - **since**: Last version already applied (default: 0).
+    - **limit**: Changes per batch (default: 500, max: 5000).
+
+    Example Response:
+    {
+        "changes": [
+            {"id": 3, "name": "Maria", "email": "maria@example.com", "cpf": "12345678900", "owner_id": 1}
+        ],
+        "deleted": [8],
+        "next": 1042,
+        "more": false
+    }
+"""
+@app.get("/clients/changes", response_model=schemas.ClientChanges)
+def read_client_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, gt=0, le=5000),
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    return sync.get_changes(db, models.Client, since=since, limit=limit, owner_id=client_owner(current_user))
+
+
 """
     List one clients - User be logged in
 
@@ -260,8 +601,8 @@ async def read_clients(
     }
 """
 @app.get("/clients/{client_id}", response_model=schemas.Client)
-async def get_client(client_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    client = db.query(models.Client).filter(models.Client.id == client_id).first()
+async def get_client(client_id: int, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_token_data)):
+    client = crud.get_client_by_id(db, client_id, client_owner(current_user))
     if not client:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
     return client
@@ -270,6 +611,8 @@ async def get_client(client_id: int, db: Session = Depends(get_db), current_user
 """
     Update client - User be logged in
 
+    Only a client of the logged in seller, admins update any client.
+
     Example Request:
     {
         "id": 1,
@@ -285,9 +628,9 @@ async def get_client(client_id: int, db: Session = Depends(get_db), current_user
 @app.put("/clients/{client_id}", response_model=schemas.Client)
 def update_client(
     client_id: int, client_update: schemas.ClientUpdate, db: Session = Depends(get_db),
-    
+    current_user: schemas.TokenData = Depends(get_token_data)
 ):
-    updated_client = crud.update_client(db, client_id, client_update)
+    updated_client = crud.update_client(db, client_id, client_update, client_owner(current_user))
     if not updated_client:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found or not authorized")
     return updated_client
@@ -308,9 +651,9 @@ def update_client(
 """
 @app.delete("/clients/{client_id}", response_model=dict)
 async def delete_client(
-    client_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)
+    client_id: int, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_current_active_user)
 ):
-    success = crud.delete_client(db, client_id)
+    success = crud.delete_client(db, client_id, client_owner(current_user))
     if not success:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found or not authorized")
     return {"message": "Client deleted successfully"}
@@ -350,7 +693,7 @@ async def delete_client(
 def create_product(
     product: schemas.ProductCreate, 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.TokenData = Depends(get_token_data)
 ):
     return crud.create_product(db=db, product=product)
 
@@ -363,6 +706,7 @@ def create_product(
     - **description**: Filter for description of product (opcional).
     - **session**: Filter for session of product (opcional).
     - **available**: Filter for available of product (opcional).
+    - **fields**: Only these fields, comma separated, e.g. id,description,sale_price (opcional).
     
     Example Response:
     [
@@ -381,29 +725,220 @@ def create_product(
 
 """
 @app.get("/products/", response_model=List[schemas.Product])
-async def read_products(
+def read_products(
     skip: int = 0, 
     limit: int = 10,
     description: str = Query(None, description="Filtrar produto pelo nome"),
     session: str = Query(None, description="Filtrar produto pela sessão"),
     available: bool = Query(None, description="Filtrar por disponibilidade"),
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula"),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.TokenData = Depends(get_token_data)
 ):
-    query = db.query(models.Product)
+    selected = parse_fields_or_400(fields, sparse.PRODUCT_FIELDS)
 
-    if description:
-        query = query.filter(models.Product.description.ilike(f"%{description}%"))
-        
-    if session:
-        query = query.filter(models.Product.session.ilike(f"%{session}%"))
-    
-    if available is not None:
-        query = query.filter(models.Product.available == available)
+    def render():
+        query = db.query(models.Product)
 
-    products = query.offset(skip).limit(limit).all()
-    
-    return products
+        if description:
+            query = query.filter(models.Product.description.ilike(f"%{description}%"))
+
+        if session:
+            query = query.filter(models.Product.session.ilike(f"%{session}%"))
+
+        if available is not None:
+            query = query.filter(models.Product.available == available)
+
+        query = query.offset(skip).limit(limit)
+        if selected:
+            return render_json(sparse.sparse_rows(query.options(*sparse.loader_options(models.Product, selected)), selected))
+        adapter = schemas.list_adapter(schemas.Product)
+        return adapter.dump_json(adapter.validate_python(query.all()), by_alias=True)
+
+    key = (current_user.role, skip, limit, description, session, available, tuple(sorted(selected or ())))
+    return coalesced("products", key, render)
+
+
+"""
+    Low stock products - User be logged in
+
+    Products at or below their reorder_threshold, by id. Pass the last id
+    received as after_id to get the next page.
+    Declared before /products/{id}, like the other /products/<name> routes.
+
+    - **after_id**: Last product id of the previous page (default: 0).
+    - **limit**: Page size (default: 100, max: 1000).
+
+    Example Response:
+    [
+        {
+            "description": "Arroz 5kg",
+            "initial_stock": 2,
+            "reorder_threshold": 10,
+            "low_stock": true,
+            "id": 7,
+            ...
+        }
+    ]
+"""
+@app.get("/products/low-stock", response_model=List[schemas.Product])
+def read_low_stock_products(
+    after_id: int = 0,
+    limit: int = Query(100, gt=0, le=1000),
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    return crud.get_low_stock_products(db, after_id=after_id, limit=limit)
+
+
+"""
+    Low stock events - User be logged in
+
+    Every crossing of a reorder threshold after the sequence after, in the
+    order they were committed: a replenishment service polls it with the
+    last sequence it has seen. Unlike the ids, sequences are given at
+    commit, so an event committed late is never behind the cursor.
+    Outbox rows are never deleted; should a cleanup ever remove them, a
+    poller further behind than it must resync from /products/low-stock.
+
+    Example Response:
+    [
+        {
+            "id": 42,
+            "sequence": 17,
+            "topic": "product.low_stock",
+            "payload": {"product_id": 7, "initial_stock": 2, "reorder_threshold": 10},
+            "created_at": "2024-06-19T19:39:49.321000"
+        }
+    ]
+"""
+@app.get("/products/low-stock/events", response_model=List[schemas.StockEvent])
+def read_stock_events(
+    after: int = 0,
+    limit: int = Query(100, gt=0, le=1000),
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    return crud.get_stock_events(db, after=after, limit=limit)
+
+
+"""
+    Products by id, many at once - User be logged in
+
+    One IN query for the whole list instead of one request per
+    GET /products/{id}. Same order as ids, unknown ids in missing.
+
+    - **ids**: Comma separated ids, e.g. 7,9 (at most BATCH_MAX_IDS, default 100).
+
+    Example Response:
+    {
+        "products": [
+            {"id": 7, "description": "Arroz 5kg", "sale_price": 25.9, ...}
+        ],
+        "missing": [9]
+    }
+"""
+@app.get("/products/batch", response_model=schemas.ProductBatch)
+def read_products_batch(
+    ids: str = Query(..., description="Ids separados por vírgula"),
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    products, missing = crud.get_many(db, models.Product, parse_ids_or_400(ids))
+    return {"products": products, "missing": missing}
+
+
+"""
+    Product changes - User be logged in
+
+    Delta sync for the POS terminals: the products written and the ids
+    deleted after the version since, oldest first, instead of downloading
+    the catalog again through /products/. Start with since=0 (the whole
+    catalog), then pass back the next of every answer; more says there is
+    another batch right away. The changes carry no initial_stock nor
+    low_stock: stock sold through orders is not a change here (see
+    app/sync.py), so a copy of it would go stale; read the stock from
+    /products/batch when it matters.
+
+    - **since**: Last version already applied (default: 0).
+    - **limit**: Changes per batch (default: 500, max: 5000).
+
+    Example Response:
+    {
+        "changes": [
+            {"id": 7, "description": "Arroz 5kg", "sale_price": 25.9, "barcode": "7891000100103", ...}
+        ],
+        "deleted": [12, 13],
+        "next": 20931,
+        "more": true
+    }
+"""
+@app.get("/products/changes", response_model=schemas.ProductChanges)
+def read_product_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, gt=0, le=5000),
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    return sync.get_changes(db, models.Product, since=since, limit=limit)
+
+
+"""
+    Product by barcode - User be logged in
+
+    For the checkout scanners: price and stock from the in-process barcode
+    index (app/catalog.py), the database only for a barcode it doesn't know yet.
+
+    Example Response:
+    {
+        "id": 7,
+        "barcode": "7891000100103",
+        "description": "Arroz 5kg",
+        "sale_price": 25.9,
+        "initial_stock": 40,
+        "available": true
+    }
+"""
+@app.get("/products/by-barcode/{code}", response_model=schemas.BarcodeProduct)
+def read_product_by_barcode(
+    code: str,
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    product = catalog.barcodes.lookup(db, [code]).get(code)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product
+
+
+"""
+    Products by barcode, a whole basket at once - User be logged in
+
+    Example Request:
+    {
+        "barcodes": ["7891000100103", "7890000000000"]
+    }
+
+    Example Response:
+    {
+        "products": [
+            {"id": 7, "barcode": "7891000100103", "description": "Arroz 5kg", "sale_price": 25.9,
+             "initial_stock": 40, "available": true}
+        ],
+        "missing": ["7890000000000"]
+    }
+"""
+@app.post("/products/by-barcode", response_model=schemas.BarcodeLookupResult)
+def read_products_by_barcode(
+    lookup: schemas.BarcodeLookup,
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    found = catalog.barcodes.lookup(db, lookup.barcodes)
+    return {
+        "products": [found[code] for code in lookup.barcodes if code in found],
+        "missing": [code for code in lookup.barcodes if code not in found],
+    }
 
 
 """
@@ -431,17 +966,24 @@ async def read_products(
 def read_product(
     id: int, 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.TokenData = Depends(get_token_data)
 ):
-    db_product = crud.get_product(db, product_id=id)
-    if not db_product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return db_product
+    def render():
+        db_product = crud.get_product(db, product_id=id)
+        if not db_product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return render_json(schemas.Product.model_validate(db_product))
+
+    return coalesced("product", (current_user.role, id), render)
 
 
 """
     Update product - User be logged in
 
+    A product taken out of the catalog for lack of stock is available again
+    on the next run of the availability job after its initial_stock goes
+    above 0; "available": true puts any product back right away.
+
     Example Request:
     {
         "id": 1
@@ -464,7 +1006,7 @@ def update_product(
     id: int, 
     product: schemas.ProductUpdate, 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.TokenData = Depends(get_token_data)
 ):
     db_product = crud.get_product(db=db, product_id=id)
     if not db_product:
@@ -489,7 +1031,7 @@ def update_product(
 def delete_product(
     id: int, 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_active_user)
+    current_user: schemas.TokenData = Depends(get_current_active_user)
 ):
     db_product = crud.get_product(db=db, product_id=id)
     if not db_product:
@@ -498,6 +1040,115 @@ def delete_product(
     return {"detail": "Product deleted"}
 
 
+"""
+    Dashboard - User be logged in
+
+    Counts, orders by status, the last orders, low stock products and the
+    revenue of today / this month / this year in one request, a few seconds
+    stale at most (DASHBOARD_CACHE_SECONDS). counts.clients is the seller's
+    own clients, every client for an admin.
+    Declared before /{order_id}, which would take "dashboard" as an order id.
+
+    Example Response:
+    {
+        "counts": {"orders": 120, "clients": 30, "products": 80, "available_products": 75},
+        "orders_by_status": {"pending": 12, "delivered": 108},
+        "recent_orders": [
+            {"id": 120, "client_id": 3, "status": "pending", "total_order_price": 25.5,
+             "created_at": "2024-06-19T19:39:49.321000"}
+        ],
+        "low_stock": [{"id": 7, "description": "Arroz 5kg", "initial_stock": 2, "reorder_threshold": 10}],
+        "revenue": {"today": 25.5, "month_to_date": 1530.0, "year_to_date": 20410.9},
+        "generated_at": "2024-06-19T19:40:00.000000"
+    }
+"""
+@app.get("/dashboard", response_model=schemas.Dashboard)
+async def read_dashboard(db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_token_data)):
+    return await dashboard.get_dashboard(db, owner_id=client_owner(current_user))
+
+
+"""
+    Order feed - User be logged in
+
+    Order creations and status changes pushed as they are committed, instead
+    of polling GET /{order_id}. Optional filters: order_id, client_id.
+
+    WebSocket: ws://host/ws/orders?token=<access token>&order_id=1
+    (browsers can't send an Authorization header on a WebSocket). The first
+    message is {"type": "subscribed"}, then one message per event.
+
+    Server-Sent Events: GET /orders/events?order_id=1 with the usual
+    Authorization header, a comment line every SSE_HEARTBEAT_SECONDS keeps
+    proxies from closing the stream.
+
+    Example message:
+    {
+        "type": "order.updated",
+        "order_id": 1,
+        "client_id": 3,
+        "status": "shipped",
+        "previous_status": "paid",
+        "total_order_price": "25.50"
+    }
+    A message carrying "dropped": n means n older events were lost because
+    the client read too slowly, re-read the orders it watches.
+"""
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+@app.websocket("/ws/orders")
+async def order_feed_websocket(
+    websocket: WebSocket,
+    token: str,
+    order_id: Optional[int] = None,
+    client_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    try:
+        await get_token_data(token=token, db=db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    finally:
+        db.commit()  # ends the read transaction, the socket must not hold a connection
+
+    await websocket.accept()
+    subscription = broker.broker.subscribe(broker.order_filter(order_id=order_id, client_id=client_id))
+    try:
+        await websocket.send_json({"type": "subscribed"})
+        while True:
+            await websocket.send_text(json.dumps(await subscription.get(), default=str))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broker.broker.unsubscribe(subscription)
+
+@app.get("/orders/events")
+async def order_feed_sse(
+    request: Request,
+    order_id: Optional[int] = None,
+    client_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    db.commit()  # ends the read transaction, the stream must not hold a connection
+    subscription = broker.broker.subscribe(broker.order_filter(order_id=order_id, client_id=client_id))
+
+    async def stream():
+        try:
+            yield ": subscribed\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(subscription.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield broker.format_sse(message)
+        finally:
+            broker.broker.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 """
     SESSION ORDER
 
@@ -511,6 +1162,8 @@ def delete_product(
     - **order_id**: Filter by id id Order (opcional).
     - **status**: Filter by status Order (opcional).
     - **client_id**: Filter by id Client (opcional).
+    - **fields**: Only these fields, comma separated: id, client_id, status, total_order_price, items (opcional).
+      Without items the items are not even loaded.
     
     Example Response:
     {
@@ -534,12 +1187,18 @@ def read_orders(
     order_id: Optional[int] = None,
     status: Optional[str] = None,
     client_id: Optional[int] = None,
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula"),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.TokenData = Depends(get_token_data)
 ):
-    orders = crud.get_orders(db, skip=skip, limit=limit, start_date=start_date, end_date=end_date,
+    selected = parse_fields_or_400(fields, sparse.ORDER_FIELDS)
+    filters = dict(skip=skip, limit=limit, start_date=start_date, end_date=end_date,
         section=section, order_id=order_id, status=status, client_id=client_id
     )
+    if selected:
+        query = crud.build_orders_query(db, **filters).options(*sparse.loader_options(models.Order, selected))
+        return JSONResponse(sparse.sparse_rows(query, selected, nested={"items": schemas.OrderItem}))
+    orders = crud.get_orders(db, **filters)
     return orders
 
 
@@ -568,12 +1227,39 @@ def read_orders(
     }
 """
 @app.post("/", response_model=schemas.Order)
-def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_order = crud.create_order(db, order=order) # criando o pedido no bd
-    db_order.update_total_order_price() # atualizando o total
-    db.commit()
-    db.refresh(db_order) # atualizando o objeto
-    return db_order
+def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_token_data)):
+    try:
+        # pedido, itens, estoque e evento order.created na mesma transação
+        return crud.create_order(db, order=order)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+
+"""
+    Orders by id, many at once - User be logged in
+
+    The orders in one IN query and all of their items in one more, instead
+    of one request per GET /{order_id}. Same order as ids, unknown ids in
+    missing. Declared before /{order_id}.
+
+    - **ids**: Comma separated ids, e.g. 12,10 (at most BATCH_MAX_IDS, default 100).
+
+    Example Response:
+    {
+        "orders": [
+            {"client_id": 1, "status": "pending", "id": 12, "items": [...], "total_order_price": 51.8}
+        ],
+        "missing": [10]
+    }
+"""
+@app.get("/batch", response_model=schemas.OrderBatch)
+def read_orders_batch(
+    ids: str = Query(..., description="Ids separados por vírgula"),
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(get_token_data)
+):
+    orders, missing = crud.get_orders_by_ids(db, parse_ids_or_400(ids))
+    return {"orders": orders, "missing": missing}
 
 
 """
@@ -594,15 +1280,10 @@ def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db), curr
     }
 """
 @app.get("/{order_id}", response_model=schemas.Order)
-def read_order(order_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def read_order(order_id: int, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_token_data)):
     db_order = crud.get_order(db=db, order_id=order_id)
     if db_order is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    
-    # calc total_order_price based on orderitems
-    total_price = sum(item.total_price for item in db_order.items)
-    db_order.total_order_price = total_price
-    
     return db_order
 
 
@@ -628,12 +1309,13 @@ def read_order(order_id: int, db: Session = Depends(get_db), current_user: model
 """
 @app.put("/{order_id}", response_model=schemas.Order)
 def update_order(order_id: int, order_update: schemas.OrderUpdate, db: Session = Depends(get_db),
-                 current_user: models.User = Depends(get_current_user)):
+                 current_user: schemas.TokenData = Depends(get_token_data)):
    
     db_order = crud.get_order(db=db, order_id=order_id)
     if db_order is None:
         raise HTTPException(status_code=404, detail="Order not found")
 
+    previous_status = db_order.status
     if order_update.client_id:
         db_order.client_id = order_update.client_id
     if order_update.status:
@@ -646,11 +1328,16 @@ def update_order(order_id: int, order_update: schemas.OrderUpdate, db: Session =
         
         if db_item:
             db_item.quantity = item_update.quantity
+            db_item.reprice()
             db_item.updated_at = datetime.utcnow()
             updated_items.append(db_item)
         else:
-            new_item = schemas.OrderItemCreate(**item_update.dict(), order_id=order_id)
-            db_item = crud.create_order_item(db=db, order_id=order_id, order_item=new_item)
+            new_item = schemas.OrderItemCreate(**item_update.model_dump(), order_id=order_id)
+            try:
+                db_item = crud.create_order_item(db=db, order_id=order_id, order_item=new_item)
+            except ValueError as ve:
+                db.rollback()
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
             updated_items.append(db_item)
 
     items_to_remove = [item for item in db_order.items if item not in updated_items]
@@ -661,6 +1348,8 @@ def update_order(order_id: int, order_update: schemas.OrderUpdate, db: Session =
 
     # recalc total price order 
     db_order.update_total_order_price()
+    db_order.update_sections()
+    crud.add_order_event(db, "order.updated", db_order, previous_status=previous_status)
     db.commit()    
     db.refresh(db_order)
 
@@ -681,7 +1370,7 @@ def update_order(order_id: int, order_update: schemas.OrderUpdate, db: Session =
     }
 """
 @app.delete("/{order_id}", response_model=dict)
-def delete_order(order_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
+def delete_order(order_id: int, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(get_current_active_user)):
     db_order = crud.delete_order(db, order_id=order_id)
     if db_order is None:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -1,8 +1,13 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, DateTime, Float, Integer, Numeric, String, ForeignKey
-from sqlalchemy.orm import relationship
+from decimal import Decimal
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Index, Integer, JSON, Numeric, String, ForeignKey, Table, \
+    event, false, func
+from sqlalchemy.orm import Session, object_session, relationship, with_loader_criteria
 from .database import Base
 
+# every amount of money is an exact decimal with 2 places, end to end
+Money = Numeric(12, 2)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -10,37 +15,101 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     role = Column(String, default="regular")
+    # bumped to revoke every access token issued before (role changes, logout)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     clients = relationship("Client", back_populates="owner")
     products = relationship("Product", back_populates="owner")
 
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    jti = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # every token rotated out of the same login shares the family
+    family_id = Column(String, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Client(Base):
     __tablename__ = "clients"
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
+    name = Column(String)
     owner_id = Column(Integer, ForeignKey("users.id"))
-    email = Column(String, index=True)
-    cpf = Column(String, index=True)
+    email = Column(String)
+    cpf = Column(String)
+    # stamped on every write by app/sync.py, drives GET /clients/changes
+    row_version = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)
+    # soft delete, see SOFT DELETE below
+    deleted_at = Column(DateTime, nullable=True)
     
     owner = relationship("User", back_populates="clients")
     orders = relationship("Order", back_populates="client")
 
+    __table_args__ = (
+        # every client query is scoped to one seller (crud.scope_clients), the owner
+        # leads, and only ever reads the live clients
+        Index("ix_clients_owner_id_name", "owner_id", "name",
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        Index("ix_clients_owner_id_email", "owner_id", "email",
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        Index("ix_clients_owner_id_cpf", "owner_id", "cpf",
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        # the purge job's candidates, only the deleted rows
+        Index("ix_clients_deleted_at", "deleted_at",
+              postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
+    )
+
 class Product(Base):
     __tablename__ = 'products'
     
     id = Column(Integer, primary_key=True, index=True)
     description = Column(String, index=True)
-    sale_price = Column(Float, nullable=False)
-    barcode = Column(String, unique=True, index=True)
+    sale_price = Column(Money, nullable=False)
+    barcode = Column(String)  # unique among the live products, see ix_products_barcode
     session = Column(String, index=True)
     initial_stock = Column(Integer, nullable=False)
     expiration_date = Column(DateTime, nullable=True)
     images = Column(String, nullable=True)  # This will store image URLs or paths
     available = Column(Boolean, default=True)
+    # why crud.retire_unavailable_products took it out: "expired" or "out_of_stock",
+    # the latter come back once restocked; None for the products hidden by hand
+    retired_reason = Column(String, nullable=True)
     owner_id = Column(Integer, ForeignKey('users.id'))
+    reorder_threshold = Column(Integer, nullable=False, default=0, server_default="0")
+    # initial_stock <= reorder_threshold, kept by crud.sync_low_stock on every stock change
+    low_stock = Column(Boolean, nullable=False, default=False, server_default=false())
+    # stamped on every write by app/sync.py, drives GET /products/changes
+    row_version = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)
+    # soft delete, see SOFT DELETE below
+    deleted_at = Column(DateTime, nullable=True)
 
     owner = relationship("User", back_populates="products")
     order_items = relationship("OrderItem", back_populates="product")
+
+    # partial indexes over the live catalog only: the default listing and the
+    # expiry / out-of-stock sweep of crud.retire_unavailable_products
+    __table_args__ = (
+        Index("ix_products_available_id", "id",
+              postgresql_where=available == True, sqlite_where=available == True),
+        Index("ix_products_available_expiration_date", "expiration_date",
+              postgresql_where=available == True, sqlite_where=available == True),
+        Index("ix_products_available_initial_stock", "initial_stock",
+              postgresql_where=available == True, sqlite_where=available == True),
+        # the ones waiting for a restock to come back
+        Index("ix_products_out_of_stock_id", "id",
+              postgresql_where=retired_reason == "out_of_stock", sqlite_where=retired_reason == "out_of_stock"),
+        # the low stock list, a handful of rows out of the whole catalog
+        Index("ix_products_low_stock_id", "id",
+              postgresql_where=low_stock == True, sqlite_where=low_stock == True),
+        # a deleted product frees its barcode for a new one
+        Index("ix_products_barcode", "barcode", unique=True,
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        Index("ix_products_live_id", "id",
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        Index("ix_products_deleted_at", "deleted_at",
+              postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
+    )
     
 
 class Order(Base):
@@ -49,16 +118,47 @@ class Order(Base):
     id = Column(Integer, primary_key=True, index=True)
     client_id = Column(Integer, ForeignKey("clients.id"))
     status = Column(String)
-    total_order_price = Column(Numeric(10, 2), default=0.0)
-    subtotal = Column(Float, nullable=False, default=0.0)
+    total_order_price = Column(Money, default=0)
+    subtotal = Column(Money, nullable=False, default=0)
     created_at = Column(DateTime, nullable=True, default=datetime.utcnow)
     client = relationship("Client", back_populates="orders")
     items = relationship("OrderItem", back_populates="order")
+    sections = relationship("OrderSection", cascade="all, delete-orphan")
 
-    # calc total price order
+    # one per filter of crud.build_orders_query, the date range goes last
+    __table_args__ = (
+        Index("ix_orders_created_at", "created_at"),
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        Index("ix_orders_client_id_created_at", "client_id", "created_at"),
+    )
+
+    # calc total price order, summed by the database over the stored item subtotals
+    # (in Python over self.items for an order not in a session yet)
     def update_total_order_price(self):
-        total = sum(item.total_price for item in self.items)
-        self.total_order_price = total
+        session = object_session(self)
+        if session is None:
+            self.total_order_price = self.subtotal = sum((item.subtotal or 0 for item in self.items), Decimal(0))
+            return
+        session.flush()
+        total = session.query(func.coalesce(func.sum(OrderItem.subtotal), 0)).filter(
+            OrderItem.order_id == self.id
+        ).scalar()
+        self.total_order_price = self.subtotal = total
+
+    # keep order_sections in step with the items, call it after every item change;
+    # soft deleted products included, like crud.rebuild_order_sections: the order history keeps them
+    def update_sections(self):
+        session = object_session(self)
+        session.flush()
+        current = {
+            section for (section,) in session.query(Product.session).distinct()
+            .join(OrderItem, OrderItem.product_id == Product.id)
+            .filter(OrderItem.order_id == self.id, Product.session.isnot(None))
+            .execution_options(include_deleted=True)
+        }
+        kept = [row for row in self.sections if row.section in current]
+        stored = {row.section for row in kept}
+        self.sections = kept + [OrderSection(section=section) for section in sorted(current - stored)]
 
     def as_dict(self):
         return {
@@ -73,19 +173,28 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Integer)
-    subtotal = Column(Integer)
+    subtotal = Column(Money)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     order = relationship("Order", back_populates="items")
     product = relationship("Product")
 
+    __table_args__ = (
+        # product -> orders, for the section filter
+        Index("ix_order_items_product_id_order_id", "product_id", "order_id"),
+    )
+
+    # price of the line when it was sold, later product price changes don't rewrite history
     @property
     def total_price(self):
-        return self.quantity * self.product.sale_price
+        return self.subtotal
+
+    def reprice(self):
+        self.subtotal = self.quantity * self.product.sale_price
 
     def as_dict(self):
         return {
@@ -95,4 +204,124 @@ class OrderItem(Base):
             "quantity": self.quantity,
             "total_price": self.total_price,
             "created_at": self.created_at,
-        }
\ No newline at end of file
+        }
+
+class OrderSection(Base):
+    """
+        Distinct product sections of an order, denormalized from its items so
+        the section filter is Order.id IN (SELECT order_id FROM order_sections
+        WHERE section = ...), served by ix_order_sections_section_order_id,
+        instead of a join that repeats the order once per matching item.
+    """
+    __tablename__ = "order_sections"
+
+    order_id = Column(Integer, ForeignKey("orders.id"), primary_key=True)
+    section = Column(String, primary_key=True)
+
+    __table_args__ = (
+        # section -> orders, the primary key serves order -> sections
+        Index("ix_order_sections_section_order_id", "section", "order_id"),
+    )
+
+class OutboxEvent(Base):
+    """Side effect to run after commit, written in the same transaction as the change."""
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    topic = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, done or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+    # stock events only: their position in commit order, see sync.stamp_stock_event
+    sequence = Column(BigInteger, nullable=True)
+
+    __table_args__ = (
+        # the worker's polling query: pending events that are due, oldest first
+        Index("ix_outbox_events_status_available_at", "status", "available_at"),
+        Index("ix_outbox_events_sequence", "sequence", unique=True,
+              postgresql_where=sequence.isnot(None), sqlite_where=sequence.isnot(None)),
+    )
+
+
+class BootstrapClaim(Base):
+    """
+        One-time claims, made by inserting the row: the primary key lets
+        exactly one transaction win ("first_admin": the first user to sign up).
+    """
+    __tablename__ = "bootstrap_claims"
+
+    name = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    claimed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RowVersion(Base):
+    """Last row_version handed out for a table, the row lock orders the writers."""
+    __tablename__ = "row_versions"
+
+    table_name = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+class Tombstone(Base):
+    """A deleted product or client, for the change feeds."""
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    # the feed of one owner's clients leaves out the others' deletes
+    owner_id = Column(Integer, nullable=True)
+    row_version = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_tombstones_table_name_row_version", "table_name", "row_version"),
+    )
+
+
+"""
+    SOFT DELETE
+
+    Deleting a product or a client only sets deleted_at: orders keep
+    pointing at them. Every ORM SELECT of a session leaves the deleted rows
+    out, unless run with execution_options(include_deleted=True); the
+    relationships of the orders still load them, history stays whole.
+
+    crud.purge_deleted moves the rows deleted long ago and referenced by no
+    order to the *_archive tables.
+"""
+SOFT_DELETED = (Product, Client)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _hide_deleted_rows(execute_state):
+    if (
+        execute_state.is_select
+        # refreshing an object already loaded, or loading it through a relationship
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get("include_deleted", False)
+    ):
+        for model in SOFT_DELETED:
+            execute_state.statement = execute_state.statement.options(
+                with_loader_criteria(model, model.deleted_at.is_(None), propagate_to_loaders=False)
+            )
+
+
+def archive_table(table: Table) -> Table:
+    """Same columns as table, no constraints: rows only come in from crud.purge_deleted."""
+    return Table(
+        f"{table.name}_archive", Base.metadata,
+        *[Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False)
+          for column in table.columns],
+        Column("archived_at", DateTime, nullable=False, default=datetime.utcnow),
+    )
+
+
+products_archive = archive_table(Product.__table__)
+clients_archive = archive_table(Client.__table__)
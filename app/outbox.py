@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .database import SessionLocal
+
+
+"""
+    OUTBOX WORKER
+
+    crud.add_outbox_event writes events in the same transaction as the order,
+    this module runs their handlers after commit, so the request never waits
+    for invoices, emails or stock alerts.
+
+    Delivery is at least once: a handler may see the same event again after a
+    failure (of itself or of another handler of the same topic), so handlers
+    must be idempotent. A failed event is retried with exponential backoff
+    and parked as "failed" after OUTBOX_MAX_ATTEMPTS.
+
+    Run it as its own process:
+        python -m app.outbox
+    or inside the web process (small deployments) with OUTBOX_WORKER=inprocess.
+"""
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "2"))
+BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+
+Handler = Callable[[dict], None]
+
+_handlers: Dict[str, List[Handler]] = defaultdict(list)
+
+
+def handler(topic: str):
+    """Decorator registering a handler for a topic."""
+    def register(func: Handler):
+        _handlers[topic].append(func)
+        return func
+    return register
+
+
+def backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(BACKOFF_MAX_SECONDS, BACKOFF_SECONDS * 2 ** (attempts - 1)))
+
+
+def drain_once(db: Session, batch_size: int = BATCH_SIZE, handlers: Optional[Dict[str, List[Handler]]] = None):
+    """
+        Claim one batch of due events, run their handlers and commit the
+        outcome. Returns how many events were claimed.
+
+        FOR UPDATE SKIP LOCKED lets several workers drain the same table on
+        Postgres; other databases ignore it. handlers defaults to the
+        registered ones, tests pass their own.
+    """
+    handlers = _handlers if handlers is None else handlers
+    now = datetime.utcnow()
+    events = (
+        db.query(models.OutboxEvent)
+        .filter(models.OutboxEvent.status == "pending", models.OutboxEvent.available_at <= now)
+        .order_by(models.OutboxEvent.available_at, models.OutboxEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for event in events:
+        try:
+            for func in handlers.get(event.topic, ()):
+                func(event.payload)
+        except Exception as exc:
+            event.attempts += 1
+            event.last_error = repr(exc)[:500]
+            if event.attempts >= MAX_ATTEMPTS:
+                event.status = "failed"
+                logger.error("outbox event %s (%s) failed for good: %r", event.id, event.topic, exc)
+            else:
+                event.available_at = now + backoff(event.attempts)
+        else:
+            event.status = "done"
+            event.processed_at = now
+    db.commit()
+    return len(events)
+
+
+def drain_pending(session_factory=SessionLocal, batch_size: int = BATCH_SIZE):
+    """Drain batch after batch until nothing is due. Returns how many events were claimed."""
+    db = session_factory()
+    try:
+        total = 0
+        while True:
+            claimed = drain_once(db, batch_size=batch_size)
+            total += claimed
+            if claimed < batch_size:
+                return total
+    finally:
+        db.close()
+
+
+async def run_worker(session_factory=SessionLocal, poll_seconds: float = POLL_SECONDS):
+    while True:
+        try:
+            await run_in_threadpool(drain_pending, session_factory)
+        except Exception:
+            logger.exception("outbox worker iteration failed")
+        await asyncio.sleep(poll_seconds)
+
+
+"""
+    Default handlers, the real side effects (invoices, emails, stock alerts)
+    register theirs the same way
+"""
+@handler("order.created")
+@handler("order.updated")
+def log_order_event(payload: dict):
+    logger.info("order %s: status %s, total %s", payload["order_id"], payload["status"], payload["total_order_price"])
+
+
+@handler("product.low_stock")
+@handler("product.restocked")
+def log_stock_event(payload: dict):
+    logger.info("product %s: stock %s, reorder threshold %s",
+                payload["product_id"], payload["initial_stock"], payload["reorder_threshold"])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker())
@@ -0,0 +1,139 @@
+import logging
+import os
+import re
+from datetime import datetime
+
+from .database import engine
+
+
+"""
+    Monthly partitions of orders and order_items (PostgreSQL)
+
+    Once alembic revision e5a8c2d4f719 has partitioned the tables, this job
+    keeps partitions ready for the coming months (rows of a month without a
+    partition would pile up in the DEFAULT partition) and, when
+    ORDERS_RETENTION_MONTHS is set, detaches the partitions older than that
+    and moves them to the ORDERS_ARCHIVE_SCHEMA schema, where they can be
+    dumped and dropped without touching the live tables.
+
+    It runs at the startup and in the scheduler of every uvicorn worker:
+    each run holds a transaction-level advisory lock, so the workers take
+    turns and the next one finds the partitions already there instead of
+    failing on the same CREATE TABLE or DETACH PARTITION.
+
+    A month that got rows in the DEFAULT partition before its partition
+    existed (the job did not run for a while) has them moved into the new
+    partition, in the same transaction.
+
+    On other databases, or before the migration, it does nothing.
+"""
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("orders", "order_items")
+MONTHS_AHEAD = int(os.getenv("ORDERS_PARTITION_MONTHS_AHEAD", "3"))
+RETENTION_MONTHS = int(os.getenv("ORDERS_RETENTION_MONTHS", "0"))  # 0 keeps everything
+ARCHIVE_SCHEMA = os.getenv("ORDERS_ARCHIVE_SCHEMA", "archive")
+LOCK_KEY = 5170432  # pg_advisory_xact_lock key of this job
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_month(table: str, name: str):
+    match = re.fullmatch(rf"{table}_p(\d{{4}})(\d{{2}})", name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(conn, table: str) -> bool:
+    return conn.exec_driver_sql(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+        (table,),
+    ).first() is not None
+
+
+def list_partitions(conn, table: str):
+    return conn.exec_driver_sql(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+        (table,),
+    ).scalars().all()
+
+
+def ensure_partitions(conn, table: str, months_ahead: int = MONTHS_AHEAD, today: datetime = None):
+    """Create the partitions from this month to months_ahead months from now. Returns the new ones."""
+    month = month_start(today or datetime.utcnow())
+    existing = set(list_partitions(conn, table))
+    created = []
+    default = f"{table}_default"
+    for _ in range(months_ahead + 1):
+        name = partition_name(table, month)
+        if name not in existing:
+            bounds = f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+            if default in existing and in_default(conn, table, month):
+                # PARTITION OF would fail on the rows of the month in DEFAULT: move them first
+                conn.exec_driver_sql(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+                conn.exec_driver_sql(
+                    f"WITH moved AS (DELETE FROM {default} WHERE created_at >= %s AND created_at < %s RETURNING *) "
+                    f"INSERT INTO {name} SELECT * FROM moved",
+                    (month, add_months(month, 1)),
+                )
+                conn.exec_driver_sql(f"ALTER TABLE {table} ATTACH PARTITION {name} {bounds}")
+            else:
+                conn.exec_driver_sql(f"CREATE TABLE {name} PARTITION OF {table} {bounds}")
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def in_default(conn, table: str, month: datetime) -> bool:
+    return conn.exec_driver_sql(
+        f"SELECT 1 FROM {table}_default WHERE created_at >= %s AND created_at < %s LIMIT 1",
+        (month, add_months(month, 1)),
+    ).first() is not None
+
+
+def detach_old_partitions(conn, table: str, retention_months: int = RETENTION_MONTHS,
+                          archive_schema: str = ARCHIVE_SCHEMA, today: datetime = None):
+    """Detach the partitions entirely older than retention_months into archive_schema. Returns them."""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(today or datetime.utcnow()), -retention_months)
+    detached = []
+    for name in sorted(list_partitions(conn, table)):
+        month = partition_month(table, name)
+        if month is None or add_months(month, 1) > cutoff:
+            continue
+        conn.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+        # brief ACCESS EXCLUSIVE lock on the parent, no data is moved
+        conn.exec_driver_sql(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        conn.exec_driver_sql(f"ALTER TABLE {name} SET SCHEMA {archive_schema}")
+        detached.append(name)
+    return detached
+
+
+def maintain_partitions(bind=engine):
+    if bind.dialect.name != "postgresql":
+        return
+    for table in PARTITIONED_TABLES:
+        with bind.begin() as conn:
+            # one worker at a time, the others wait and then see its partitions
+            conn.exec_driver_sql("SELECT pg_advisory_xact_lock(%s)", (LOCK_KEY,))
+            if not is_partitioned(conn, table):
+                continue
+            created = ensure_partitions(conn, table)
+            detached = detach_old_partitions(conn, table)
+        if created or detached:
+            logger.info("%s partitions created: %s, detached: %s", table, created, detached)
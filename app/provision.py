@@ -0,0 +1,176 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Optional
+
+from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .crud import duplicate_user_message, pwd_context
+
+
+"""
+    BULK USER PROVISIONING - POST /users/bulk and the CLI
+
+        python -m app.provision cashiers.csv [--output report.json]
+
+    (CSV with a header: username,email,password.) Onboarding a chain means
+    hundreds of cashier accounts and every one of them is a bcrypt hash:
+    the hashes run in parallel in a pool of PASSWORD_HASH_WORKERS processes
+    (default: one per core, at most 8) and the users go in with one INSERT
+    per PROVISION_BATCH_SIZE, each batch committed on its own.
+
+    The pool is one per process, created on first use and shared by the
+    requests. Its processes come from a forkserver, never forked from the
+    uvicorn worker itself: a fork taken while one of its threads (scheduler,
+    broker listener, threadpool) holds a lock would inherit it locked.
+
+    A user whose username or email is taken (already registered or earlier
+    in the same list) is reported as a conflict with its position in the
+    list, the others are created anyway.
+"""
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or min(os.cpu_count() or 1, 8)
+BATCH_SIZE = int(os.getenv("PROVISION_BATCH_SIZE", "500"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def hashing_context(policy: str) -> CryptContext:
+    return CryptContext.from_string(policy)
+
+
+def hash_password(password: str, policy: str) -> str:
+    """Runs in the pool: policy is pwd_context.to_string() of the caller, so both hash alike."""
+    return hashing_context(policy).hash(password)
+
+
+def hash_pool(workers: int = HASH_WORKERS) -> ProcessPoolExecutor:
+    """The pool of this process, workers is its size when the first caller creates it."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+
+def hash_passwords(passwords: List[str], workers: int = HASH_WORKERS) -> List[str]:
+    """In order; bcrypt releases no GIL worth having, hence processes and not threads."""
+    if min(workers, len(passwords)) <= 1:
+        return [pwd_context.hash(password) for password in passwords]
+    pool = hash_pool(workers)
+    chunksize = max(1, len(passwords) // (workers * 4))
+    policy = pwd_context.to_string()
+    return list(pool.map(hash_password, passwords, [policy] * len(passwords), chunksize=chunksize))
+
+
+def new_user(user: schemas.UserCreate, hashed_password: str) -> models.User:
+    return models.User(username=user.username, email=user.email, hashed_password=hashed_password, role="regular")
+
+
+def conflict(index: int, user: schemas.UserCreate, detail: str) -> dict:
+    return {"index": index, "username": user.username, "email": user.email, "detail": detail}
+
+
+def provision_users(db: Session, users: List[schemas.UserCreate], batch_size: int = BATCH_SIZE,
+                    workers: int = HASH_WORKERS):
+    """Create users (all regular); returns {"created": [...], "conflicts": [...]}."""
+    conflicts, accepted = [], []
+    usernames, emails = set(), set()
+    for index, user in enumerate(users):
+        if user.username in usernames:
+            conflicts.append(conflict(index, user, "Username already registered"))
+        elif user.email in emails:
+            conflicts.append(conflict(index, user, "Email already registered"))
+        else:
+            usernames.add(user.username)
+            emails.add(user.email)
+            accepted.append((index, user))
+
+    # the ones taken already, two IN queries per batch
+    fresh = []
+    for start in range(0, len(accepted), batch_size):
+        batch = accepted[start:start + batch_size]
+        taken_usernames = set(db.scalars(select(models.User.username).where(
+            models.User.username.in_([user.username for _, user in batch]))))
+        taken_emails = set(db.scalars(select(models.User.email).where(
+            models.User.email.in_([user.email for _, user in batch]))))
+        for index, user in batch:
+            if user.username in taken_usernames:
+                conflicts.append(conflict(index, user, "Username already registered"))
+            elif user.email in taken_emails:
+                conflicts.append(conflict(index, user, "Email already registered"))
+            else:
+                fresh.append((index, user))
+
+    hashes = hash_passwords([user.password for _, user in fresh], workers)
+
+    created = []
+    for start in range(0, len(fresh), batch_size):
+        batch = list(zip(fresh[start:start + batch_size], hashes[start:start + batch_size]))
+        try:
+            with db.begin_nested():
+                inserted = [new_user(user, hashed) for (_, user), hashed in batch]
+                db.add_all(inserted)
+        except IntegrityError:
+            # somebody registered one of them meanwhile: one savepoint per user to find out who
+            inserted = []
+            for (index, user), hashed in batch:
+                try:
+                    with db.begin_nested():
+                        db_user = new_user(user, hashed)
+                        db.add(db_user)
+                    inserted.append(db_user)
+                except IntegrityError as exc:
+                    conflicts.append(conflict(index, user, duplicate_user_message(exc)))
+        created += schemas.list_adapter(schemas.User).validate_python(inserted)
+        db.commit()
+
+    conflicts.sort(key=lambda row: row["index"])
+    return {"created": created, "conflicts": conflicts}
+
+
+def read_csv(path: str) -> List[schemas.UserCreate]:
+    with open(path, newline="") as file:
+        return [schemas.UserCreate(**row) for row in csv.DictReader(file)]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Create many users at once from a CSV (username,email,password)")
+    parser.add_argument("csv")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="password hashing processes, 1 for none")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        result = provision_users(db, read_csv(args.csv), batch_size=args.batch_size, workers=args.workers)
+    finally:
+        db.close()
+
+    report = json.dumps({
+        "created": len(result["created"]),
+        "conflicts": result["conflicts"],
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+    return 1 if result["conflicts"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
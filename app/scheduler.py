@@ -0,0 +1,45 @@
+import asyncio
+import logging
+
+import sentry_sdk
+from starlette.concurrency import run_in_threadpool
+
+
+"""
+    Periodic maintenance jobs running inside the app process
+
+    Jobs are plain sync functions, run in the threadpool so they never block
+    the event loop. An interval of 0 (or less) disables a job.
+"""
+logger = logging.getLogger(__name__)
+
+_jobs = []
+_tasks = []
+
+
+def schedule(func, interval: float):
+    """Register func to run every interval seconds once the app starts."""
+    if interval > 0:
+        _jobs.append((func, interval))
+
+
+async def _run_periodically(func, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(func)
+        except Exception as exc:
+            logger.exception("periodic job %s failed", func.__name__)
+            sentry_sdk.capture_exception(exc)
+
+
+def start():
+    for func, interval in _jobs:
+        _tasks.append(asyncio.create_task(_run_periodically(func, interval)))
+
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -1,6 +1,16 @@
 from datetime import datetime
-from typing import List, Optional
-from pydantic import BaseModel, EmailStr, Field
+from decimal import Decimal
+from functools import lru_cache
+from typing import Annotated, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, PlainSerializer, TypeAdapter
+
+
+# exact 2-place decimal everywhere in Python, still a plain number in the JSON
+Money = Annotated[
+    Decimal,
+    Field(max_digits=12, decimal_places=2),
+    PlainSerializer(float, return_type=float, when_used="json"),
+]
 
 
 """
@@ -9,6 +19,16 @@ from pydantic import BaseModel, EmailStr, Field
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+class TokenData(BaseModel):
+    id: int
+    username: str
+    role: str
+    token_version: int = 0
 
 
 """
@@ -28,8 +48,20 @@ class User(BaseModel):
     email: EmailStr
     role: str
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class UserBulkCreate(BaseModel):
+    users: List[UserCreate] = Field(..., min_length=1, max_length=1000)
+
+class UserConflict(BaseModel):
+    index: int  # posição em users
+    username: str
+    email: str
+    detail: str
+
+class UserBulkResult(BaseModel):
+    created: List[User]
+    conflicts: List[UserConflict]
 
 
 """
@@ -53,8 +85,17 @@ class Client(BaseModel):
     cpf: str
     owner_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class ClientBatch(BaseModel):
+    clients: List[Client]
+    missing: List[int]
+
+class ClientChanges(BaseModel):
+    changes: List[Client]
+    deleted: List[int]
+    next: int
+    more: bool
 
 class ClientUpdate(BaseModel):
     name: Optional[str] = None
@@ -67,50 +108,82 @@ class ClientUpdate(BaseModel):
 """
 class ProductBase(BaseModel):
     description: Optional[str] = None
-    sale_price: Optional[float] = None
+    sale_price: Optional[Money] = None
     barcode: Optional[str] = None
     session: Optional[str] = None
     initial_stock: Optional[int] = None
     expiration_date: Optional[datetime] = None
     images: Optional[str] = None
     available: Optional[bool] = None
+    reorder_threshold: Optional[int] = Field(None, ge=0)
 
 class ProductCreate(ProductBase):
     description: str
-    sale_price: float
+    sale_price: Money
     barcode: str
     session: str
     initial_stock: int
+    reorder_threshold: int = Field(0, ge=0)
 
 class ProductUpdate(ProductBase):
     pass
 
 class Product(ProductBase):
     id: int
+    low_stock: bool = False
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
-"""
-    ORDER ITEM
-"""
+class ProductBatch(BaseModel):
+    products: List[Product]
+    missing: List[int]
 
-class OrderItemBase(BaseModel):
-    product_id: int
-    quantity: int
+class ProductChange(BaseModel):
+    """Product of the change feed, without stock: sales don't version the rows (see app/sync.py)."""
+    id: int
+    description: Optional[str] = None
+    sale_price: Optional[Money] = None
+    barcode: Optional[str] = None
+    session: Optional[str] = None
+    expiration_date: Optional[datetime] = None
+    images: Optional[str] = None
+    available: Optional[bool] = None
+    reorder_threshold: Optional[int] = None
 
-class OrderItemCreate(OrderItemBase):
-    pass
+    model_config = ConfigDict(from_attributes=True)
 
-class OrderItemUpdate(OrderItemBase):
-    quantity: Optional[int]
+class ProductChanges(BaseModel):
+    changes: List[ProductChange]
+    deleted: List[int]
+    next: int
+    more: bool
 
-class OrderItem(OrderItemBase):
+class BarcodeProduct(BaseModel):
+    id: int
+    barcode: str
+    description: Optional[str] = None
+    sale_price: Money
+    initial_stock: int
+    available: Optional[bool] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class BarcodeLookup(BaseModel):
+    barcodes: List[str] = Field(..., min_length=1, max_length=500)
+
+class BarcodeLookupResult(BaseModel):
+    products: List[BarcodeProduct]
+    missing: List[str]
+
+class StockEvent(BaseModel):
+    """A product crossing its reorder threshold, down (product.low_stock) or back up (product.restocked)."""
     id: int
-    subtotal: float
+    sequence: int  # pass the last one back as after
+    topic: str
+    payload: dict
+    created_at: datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 """
@@ -130,15 +203,12 @@ class OrderItemUpdate(BaseModel):
 class OrderItem(OrderItemBase):
     id: int
     order_id: int
-    product_id: int
     quantity: int
     created_at: Optional[datetime]
     updated_at: Optional[datetime]
-    total_price: float
-    
+    total_price: Money
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 """
     ORDERS
@@ -157,18 +227,54 @@ class OrderUpdate(BaseModel):
 
 class Order(OrderBase):
     id: int
-    client_id: int
-    status: str
     items: List[OrderItem] = []
-    total_order_price: float = Field(..., alias="total_order_price")
+    total_order_price: Money
+
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        orm_mode = True
+class OrderBatch(BaseModel):
+    orders: List[Order]
+    missing: List[int]
 
 class OrderInDB(Order):
-    total_order_price: float
     items: List[OrderItem]
 
-    class Config:
-        orm_mode = True
 
+"""
+    DASHBOARD
+"""
+class DashboardOrder(BaseModel):
+    id: int
+    client_id: Optional[int]
+    status: Optional[str]
+    total_order_price: Money
+    created_at: Optional[datetime]
+
+    model_config = ConfigDict(from_attributes=True)
+
+class DashboardProduct(BaseModel):
+    id: int
+    description: Optional[str]
+    initial_stock: int
+    reorder_threshold: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class Dashboard(BaseModel):
+    counts: Dict[str, int]
+    orders_by_status: Dict[str, int]
+    recent_orders: List[DashboardOrder]
+    low_stock: List[DashboardProduct]
+    revenue: Dict[str, Money]
+    generated_at: datetime
+
+
+"""
+    LIST ADAPTERS
+    A TypeAdapter builds its validator and serializer when it is created,
+    so there is one per schema for the whole process: the list endpoints
+    that render their own JSON validate and dump the page in one call.
+"""
+@lru_cache(maxsize=None)
+def list_adapter(schema) -> TypeAdapter:
+    return TypeAdapter(List[schema])
@@ -1,12 +1,14 @@
 import sentry_sdk
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 from dotenv import load_dotenv
+import os
 
 load_dotenv()
 
 # configuring sentry
+# SENTRY_DSN="" turns sentry off (benchmarks, tests)
 sentry_sdk.init(
-    dsn="https://7e3c537cc42659f5055f3523ca01c195@o4507461076647936.ingest.us.sentry.io/4507461079728128",
+    dsn=os.getenv("SENTRY_DSN", "https://7e3c537cc42659f5055f3523ca01c195@o4507461076647936.ingest.us.sentry.io/4507461079728128"),
     traces_sample_rate=1.0,
     profiles_sample_rate=1.0,
 )
@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+
+import uvicorn
+
+
+"""
+    Production entry point
+
+        python -m app.serve
+
+    Runs WEB_CONCURRENCY uvicorn worker processes behind one socket; the
+    parent restarts a worker that dies. Every knob comes from the environment:
+
+        WEB_CONCURRENCY             worker processes (default: one per core)
+        HOST / PORT                 bind address (0.0.0.0:80)
+        BACKLOG                     pending connections the kernel queues (2048)
+        KEEPALIVE_SECONDS           idle keep-alive before closing (5); keep it
+                                    above the load balancer's idle timeout
+        GRACEFUL_TIMEOUT_SECONDS    time given to in-flight requests on SIGTERM (30)
+        LIMIT_CONCURRENCY           connections per worker before answering 503 (unlimited)
+        MAX_REQUESTS                requests before a worker is recycled (unlimited)
+        UVICORN_LOOP / UVICORN_HTTP event loop and HTTP parser, "auto" picks
+                                    uvloop and httptools when they are installed
+
+    Each worker has its own database pool, see the pool budget in app/database.py.
+"""
+def optional_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def server_options():
+    return {
+        "host": os.getenv("HOST", "0.0.0.0"),
+        "port": int(os.getenv("PORT", "80")),
+        "workers": int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count()))),
+        "backlog": int(os.getenv("BACKLOG", "2048")),
+        "timeout_keep_alive": int(os.getenv("KEEPALIVE_SECONDS", "5")),
+        "timeout_graceful_shutdown": int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "30")),
+        "limit_concurrency": optional_int("LIMIT_CONCURRENCY"),
+        "limit_max_requests": optional_int("MAX_REQUESTS"),
+        "loop": os.getenv("UVICORN_LOOP", "auto"),
+        "http": os.getenv("UVICORN_HTTP", "auto"),
+        "proxy_headers": True,
+        "access_log": os.getenv("ACCESS_LOG", "false").lower() == "true",
+    }
+
+
+def main():
+    options = server_options()
+    # app/database.py splits DB_MAX_CONNECTIONS by it, in every worker
+    os.environ["WEB_CONCURRENCY"] = str(options["workers"])
+    uvicorn.run("app.main:app", **options)
+
+
+if __name__ == "__main__":
+    main()
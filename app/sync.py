@@ -0,0 +1,148 @@
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+"""
+    CHANGE FEEDS - GET /products/changes and GET /clients/changes
+
+    The POS terminals keep their own copy of the catalog and the clients.
+    Instead of downloading it again page by page they ask for what changed
+    after the last version they saw:
+
+        every write of a product or client stamps the row with the next
+        row_version of its table, every delete leaves a tombstone with one.
+
+    Versions come from row_versions with an UPDATE whose row lock is held
+    until commit, so the writers of a table commit in version order and a
+    terminal never steps over a version that was still being committed.
+
+    The stock sold by crud.create_order is a bulk UPDATE and is left out on
+    purpose: versioning it would serialize every checkout on that lock and
+    flood the feed. The server checks the stock of every order anyway.
+"""
+VERSIONED = {models.Product: "products", models.Client: "clients"}
+# counters of row_versions numbering something else than VERSIONED rows
+SEQUENCES = {"stock_events": models.OutboxEvent.sequence}
+
+
+def next_versions(db: Session, table: str, count: int) -> int:
+    """
+        Reserve count versions of table, returns the first one. With count 0
+        it only takes the lock, for writers that must hold it before locking
+        the rows they version (see crud.retire_unavailable_products).
+    """
+    connection = db.connection()
+    counter = models.RowVersion.__table__
+    reserved = connection.execute(
+        update(counter).where(counter.c.table_name == table).values(version=counter.c.version + count)
+    )
+    if reserved.rowcount == 0:
+        # a database created without the migration, start after what is already stamped
+        if table in SEQUENCES:
+            last = connection.scalar(select(func.coalesce(func.max(SEQUENCES[table]), 0)))
+        else:
+            model = next(model for model, name in VERSIONED.items() if name == table)
+            last = max(
+                connection.scalar(select(func.coalesce(func.max(model.row_version), 0))),
+                connection.scalar(select(func.coalesce(func.max(models.Tombstone.row_version), 0))
+                                  .where(models.Tombstone.table_name == table)),
+            )
+        connection.execute(insert(counter).values(table_name=table, version=last + count))
+        return last + 1
+    return connection.scalar(select(counter.c.version).where(counter.c.table_name == table)) - count + 1
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_row_versions(session, flush_context, instances):
+    written: Dict[str, List] = {}
+    deleted: Dict[str, List] = {}
+    for obj in list(session.new) + list(session.dirty):
+        table = VERSIONED.get(type(obj))
+        if not table or not (obj in session.new or session.is_modified(obj, include_collections=False)):
+            continue
+        # a soft delete is a delete for the terminals
+        (deleted if obj.deleted_at is not None else written).setdefault(table, []).append(obj)
+    for obj in session.deleted:
+        table = VERSIONED.get(type(obj))
+        if table:
+            deleted.setdefault(table, []).append(obj)
+
+    for table in set(written) | set(deleted):
+        version = next_versions(session, table, len(written.get(table, ())) + len(deleted.get(table, ())))
+        for obj in written.get(table, ()):
+            obj.row_version = version
+            version += 1
+        for obj in deleted.get(table, ()):
+            if obj not in session.deleted:
+                obj.row_version = version
+            session.add(models.Tombstone(table_name=table, row_id=obj.id, owner_id=getattr(obj, "owner_id", None),
+                                         row_version=version))
+            version += 1
+
+
+"""
+    The stock events of GET /products/low-stock/events are numbered the same
+    way, for the same reason: outbox ids come from a sequence at INSERT and
+    the transactions commit in any order, so a poller past id 12 would never
+    see an id 11 committed after it. Their sequence is taken in
+    before_commit, after a last flush: the counter is the last lock of the
+    transaction, whatever rows it locked before, and no writer waits for a
+    row while holding it.
+"""
+def stamp_stock_event(db: Session, db_event: models.OutboxEvent):
+    db.info.setdefault("stock_events", []).append(db_event)
+
+
+@event.listens_for(Session, "before_commit")
+def _stamp_stock_events(session):
+    if session.in_nested_transaction():
+        return  # a SAVEPOINT, the real commit comes later
+    pending = session.info.pop("stock_events", None)
+    if not pending:
+        return
+    session.flush()
+    sequence = next_versions(session, "stock_events", len(pending))
+    for db_event in pending:
+        db_event.sequence = sequence
+        sequence += 1
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_stock_events(session):
+    session.info.pop("stock_events", None)
+
+
+def get_changes(db: Session, model, since: int = 0, limit: int = 500, owner_id: Optional[int] = None):
+    """
+        Rows written and ids deleted after version since, in version order,
+        at most limit of them. Pass next back as since for the rest.
+        With owner_id, only that owner's rows (clients).
+    """
+    table = VERSIONED[model]
+    rows = db.query(model).filter(model.row_version > since)
+    tombstones = db.query(models.Tombstone.row_id, models.Tombstone.row_version).filter(
+        models.Tombstone.table_name == table, models.Tombstone.row_version > since
+    )
+    if owner_id is not None:
+        rows = rows.filter(model.owner_id == owner_id)
+        tombstones = tombstones.filter(models.Tombstone.owner_id == owner_id)
+    rows = rows.order_by(model.row_version).limit(limit + 1).all()
+    tombstones = tombstones.order_by(models.Tombstone.row_version).limit(limit + 1).all()
+
+    merged = sorted(
+        [(row.row_version, row, None) for row in rows] +
+        [(tombstone.row_version, None, tombstone.row_id) for tombstone in tombstones],
+        key=lambda change: change[0],
+    )
+    more = len(merged) > limit
+    merged = merged[:limit]
+    return {
+        "changes": [row for _, row, _ in merged if row is not None],
+        "deleted": [row_id for _, _, row_id in merged if row_id is not None],
+        "next": merged[-1][0] if merged else since,
+        "more": more,
+    }
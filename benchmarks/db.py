@@ -0,0 +1,83 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+
+"""
+    Throwaway database for the benchmarks
+
+    Order of preference:
+    1. BENCH_DATABASE_URL, when set (an existing server, never dropped)
+    2. a local Postgres cluster created with initdb/pg_ctl in a temp dir
+    3. a sqlite file in a temp dir
+"""
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_postgres():
+    """initdb + pg_ctl start in a temp dir; returns (url, datadir)."""
+    datadir = tempfile.mkdtemp(prefix="bench_pg_")
+    port = _free_port()
+    try:
+        subprocess.run(
+            ["initdb", "-D", datadir, "-U", "bench", "--auth=trust"],
+            check=True, capture_output=True,
+        )
+        subprocess.run(
+            ["pg_ctl", "-D", datadir, "-w", "-l", os.path.join(datadir, "server.log"),
+             "-o", f"-p {port} -k {datadir} -c listen_addresses=''", "start"],
+            check=True, capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(datadir, ignore_errors=True)
+        raise
+    return f"postgresql://bench@/postgres?host={datadir}&port={port}", datadir
+
+
+def _stop_postgres(datadir):
+    subprocess.run(["pg_ctl", "-D", datadir, "-m", "fast", "stop"], capture_output=True)
+    shutil.rmtree(datadir, ignore_errors=True)
+
+
+@contextmanager
+def _local_sqlite():
+    tmpdir = tempfile.mkdtemp(prefix="bench_sqlite_")
+    try:
+        yield f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+@contextmanager
+def local_database(backend: str = "auto"):
+    """Yield a database URL for the given backend: auto, postgres or sqlite."""
+    url = os.getenv("BENCH_DATABASE_URL")
+    if url:
+        yield url
+        return
+
+    if backend in ("auto", "postgres") and shutil.which("initdb") and shutil.which("pg_ctl"):
+        try:
+            url, datadir = _start_postgres()
+        except (OSError, subprocess.CalledProcessError):
+            # initdb refuses to run as root, among other things
+            if backend == "postgres":
+                raise
+        else:
+            try:
+                yield url
+            finally:
+                _stop_postgres(datadir)
+            return
+
+    if backend == "postgres":
+        raise RuntimeError("initdb/pg_ctl not found, set BENCH_DATABASE_URL instead")
+
+    with _local_sqlite() as url:
+        yield url
@@ -0,0 +1,251 @@
+"""
+    Load test for the real endpoints over a seeded database
+
+    Usage:
+        python -m benchmarks.load_test --products 100000 --orders 1000000 --items 5000000 \
+            --concurrency 32 --requests 2000 --output bench.json
+
+    Without --url the app runs in-process (httpx ASGI transport) on top of a
+    throwaway database, see benchmarks/db.py. With --url the requests go to
+    an already running server, whose database must have been seeded with the
+    same arguments first:
+        BENCH_DATABASE_URL=postgresql://... python -m benchmarks.load_test --seed-only ...
+    --url seeds nothing itself, the volumes come from the arguments.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from .db import local_database
+
+
+def percentile(sorted_values, pct):
+    """Linear interpolation between the closest ranks, like numpy's default."""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": ms(statistics.fmean(values)) if values else None,
+            "p50": ms(percentile(values, 50)),
+            "p90": ms(percentile(values, 90)),
+            "p95": ms(percentile(values, 95)),
+            "p99": ms(percentile(values, 99)),
+            "max": ms(values[-1] if values else None),
+        },
+    }
+
+
+async def run_scenario(client, make_request, concurrency, total_requests, rng):
+    latencies = []
+    errors = 0
+    pending = iter(range(total_requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in pending:
+            method, url, kwargs = make_request(rng)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def build_scenarios(volumes, headers, credentials):
+    from .seed import BASE_DATE, SECTIONS, STATUSES
+
+    def token(rng):
+        return "POST", "/token", {"data": credentials}
+
+    def list_orders(rng):
+        return "GET", "/", {"headers": headers, "params": {"skip": rng.randrange(100), "limit": 10}}
+
+    def filter_orders(rng):
+        start = BASE_DATE - timedelta(days=rng.randrange(1, 365))
+        params = {
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(days=7)).isoformat(),
+            "status": rng.choice(STATUSES),
+            "section": rng.choice(SECTIONS),
+            "limit": 10,
+        }
+        return "GET", "/", {"headers": headers, "params": params}
+
+    def create_order(rng):
+        items = [
+            {"product_id": product_id, "quantity": rng.randint(1, 3)}
+            for product_id in rng.sample(range(1, volumes["products"] + 1), min(3, volumes["products"]))
+        ]
+        body = {"client_id": rng.randint(1, volumes["clients"]), "status": "pending", "items": items}
+        return "POST", "/", {"headers": headers, "json": body}
+
+    def list_products(rng):
+        params = {"skip": rng.randrange(100), "limit": 10, "available": True}
+        return "GET", "/products/", {"headers": headers, "params": params}
+
+    def list_clients(rng):
+        return "GET", "/clients/", {"headers": headers, "params": {"skip": rng.randrange(100), "limit": 10}}
+
+    return {
+        "token": token,
+        "list_orders": list_orders,
+        "filter_orders": filter_orders,
+        "create_order": create_order,
+        "list_products": list_products,
+        "list_clients": list_clients,
+    }
+
+
+async def run_load(client, args, volumes):
+    from .seed import BENCH_PASSWORD, BENCH_USERNAME
+
+    credentials = {"username": BENCH_USERNAME, "password": BENCH_PASSWORD}
+    response = await client.post("/token", data=credentials)
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    scenarios = build_scenarios(volumes, headers, credentials)
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+
+    results = {}
+    for name in selected:
+        rng = random.Random(f"{args.seed}:{name}")
+        # bcrypt makes every login ~100x slower than the other endpoints
+        total = max(1, args.requests // 20) if name == "token" else args.requests
+        if args.warmup:
+            await run_scenario(client, scenarios[name], args.concurrency, args.warmup, rng)
+        results[name] = await run_scenario(client, scenarios[name], args.concurrency, total, rng)
+        print(f"{name}: {results[name]['throughput_rps']} req/s, "
+              f"p99 {results[name]['latency_ms']['p99']} ms", file=sys.stderr)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["auto", "postgres", "sqlite"], default="auto")
+    parser.add_argument("--url", help="base URL of a running server, default: in-process app")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="untimed requests per scenario")
+    parser.add_argument("--scenarios", help="comma separated subset, default: all")
+    parser.add_argument("--seed-only", action="store_true", help="seed the database and exit")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.url and not args.seed_only:
+        # the server's database was seeded with these same arguments (--seed-only),
+        # seeding here would only fill a database nobody reads
+        volumes = {"products": args.products, "clients": args.clients, "orders": args.orders, "items": args.items}
+        dialect = seed_seconds = None
+        # only the bench credentials come from .seed, its app import must not need a database
+        os.environ.setdefault("DATABASE_URL", "sqlite://")
+        os.environ.setdefault("SENTRY_DSN", "")
+
+        async def run():
+            async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+                return await run_load(client, args, volumes)
+
+        results = asyncio.run(run())
+    else:
+        with local_database(args.backend) as database_url:
+            # app.database reads DATABASE_URL at import time
+            os.environ["DATABASE_URL"] = database_url
+            os.environ.setdefault("SENTRY_DSN", "")
+            from sqlalchemy import create_engine
+            from .seed import seed_database
+
+            engine = create_engine(database_url)
+            started = time.perf_counter()
+            volumes = seed_database(
+                engine, products=args.products, clients=args.clients,
+                orders=args.orders, items=args.items, seed=args.seed,
+            )
+            seed_seconds = round(time.perf_counter() - started, 3)
+            dialect = engine.dialect.name
+            engine.dispose()
+            print(f"seeded {volumes} in {seed_seconds:.1f}s ({dialect})", file=sys.stderr)
+            if args.seed_only:
+                return
+
+            async def run():
+                from app.main import app
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                    return await run_load(client, args, volumes)
+
+            results = asyncio.run(run())
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": dialect,
+            "target": args.url or "in-process",
+            "seed": args.seed,
+            "seed_seconds": seed_seconds,
+            "volumes": volumes,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+    Date-range queries on orders/order_items, before and after partitioning
+
+    Usage:
+        python -m benchmarks.partitions --orders 10000000 --items 50000000 --days 1095 \
+            --output partitions.json
+
+    PostgreSQL only (BENCH_DATABASE_URL or a local initdb, see benchmarks/db.py).
+    Seeds plain tables, times the queries, partitions the tables with the
+    alembic migration e5a8c2d4f719 itself, times the same queries again and
+    reports both runs plus the partitions each plan touched.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+
+from .db import local_database
+from .load_test import git_revision, percentile
+from .seed import BASE_DATE, seed_database
+
+MIGRATION = Path(__file__).resolve().parent.parent / "alembic" / "versions" / "e5a8c2d4f719_partition_orders_by_month.py"
+
+
+def load_migration():
+    spec = importlib.util.spec_from_file_location("partition_migration", MIGRATION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_queries(days):
+    """The shapes the app runs for one month of a history of `days` days."""
+    end = BASE_DATE - timedelta(days=days // 2)
+    start = end - timedelta(days=30)
+    params = {"start": start, "end": end, "status": "pending"}
+    return params, {
+        "orders_in_month": "SELECT * FROM orders WHERE created_at >= :start AND created_at <= :end "
+                           "ORDER BY id LIMIT 100",
+        "total_in_month": "SELECT sum(total_order_price) FROM orders WHERE created_at >= :start AND created_at <= :end",
+        "status_in_month": "SELECT count(*) FROM orders WHERE status = :status "
+                           "AND created_at >= :start AND created_at <= :end",
+        "items_in_month": "SELECT count(*) FROM order_items WHERE created_at >= :start AND created_at <= :end",
+    }
+
+
+def partitions_scanned(conn, sql, params):
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+    found = set()
+
+    def walk(node):
+        if "Relation Name" in node:
+            found.add(node["Relation Name"])
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return sorted(found)
+
+
+def time_queries(engine, queries, params, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in queries.items():
+            conn.execute(text(sql), params).all()  # warm the cache
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(text(sql), params).all()
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            results[name] = {
+                "p50_ms": round(percentile(timings, 50) * 1000, 3),
+                "p95_ms": round(percentile(timings, 95) * 1000, 3),
+                "relations": partitions_scanned(conn, sql, params),
+            }
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--items", type=int, default=500000)
+    parser.add_argument("--days", type=int, default=1095, help="history length, one partition per month")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per query")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault("SENTRY_DSN", "")
+
+    with local_database("postgres") as database_url:
+        engine = create_engine(database_url)
+        volumes = seed_database(
+            engine, products=args.products, clients=args.clients,
+            orders=args.orders, items=args.items, days=args.days, seed=args.seed,
+        )
+        params, queries = build_queries(args.days)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+        print(f"seeded {volumes}, timing plain tables", file=sys.stderr)
+        plain = time_queries(engine, queries, params, args.repeat)
+
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            load_migration().partition_tables(conn)
+        migration_seconds = time.perf_counter() - started
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+        print(f"partitioned in {migration_seconds:.1f}s, timing partitioned tables", file=sys.stderr)
+        partitioned = time_queries(engine, queries, params, args.repeat)
+        engine.dispose()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "volumes": volumes,
+            "days": args.days,
+            "range": [params["start"].isoformat(), params["end"].isoformat()],
+            "migration_seconds": round(migration_seconds, 3),
+        },
+        "queries": {
+            name: {
+                "plain": plain[name],
+                "partitioned": partitioned[name],
+                "speedup_p50": round(plain[name]["p50_ms"] / partitioned[name]["p50_ms"], 2)
+                if partitioned[name]["p50_ms"] else None,
+            }
+            for name in queries
+        },
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
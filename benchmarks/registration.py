@@ -0,0 +1,136 @@
+"""
+    Cost of a signup (POST /users/) on a large users table
+
+    Usage:
+        python -m benchmarks.registration --users 1000000 --signups 500 --output registration.json
+
+    Seeds `--users` users, then registers `--signups` new ones twice: with
+    the previous path (count of the users table, lookup by username, lookup
+    by email, INSERT) and with crud.create_user (one INSERT, the unique
+    indexes reject duplicates). bcrypt runs at its minimum cost so the
+    numbers are the database part of a signup; in production the hash
+    (~250 ms at the default cost) comes on top of both.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault("SENTRY_DSN", "")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from .db import local_database  # noqa: E402
+from .load_test import git_revision, percentile  # noqa: E402
+
+
+def seed_users(engine, users, chunk_size=50000):
+    from app import models
+    from app.crud import pwd_context
+
+    models.Base.metadata.create_all(bind=engine)
+    hashed = pwd_context.hash("bench")
+    with engine.begin() as conn:
+        for start in range(1, users + 1, chunk_size):
+            conn.execute(models.User.__table__.insert(), [
+                {"id": n, "username": f"user{n}", "email": f"user{n}@example.com",
+                 "hashed_password": hashed, "role": "regular"}
+                for n in range(start, min(start + chunk_size, users + 1))
+            ])
+        conn.execute(models.BootstrapClaim.__table__.insert(), [{"name": "first_admin", "user_id": 1}])
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("ANALYZE users")
+
+
+def legacy_create_user(db, user):
+    """POST /users/ and crud.create_user before: three lookups and a count before the INSERT."""
+    from app import crud, models
+
+    if crud.get_user(db, username=user.username) or crud.get_user_by_email(db, email=user.email):
+        raise ValueError("already registered")
+    hashed_password = crud.pwd_context.hash(user.password)
+    role = "admin" if db.query(models.User).count() == 0 else "regular"
+    db_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password, role=role)
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
+def time_signups(session_factory, create, prefix, signups):
+    from app import schemas
+
+    timings = []
+    db = session_factory()
+    try:
+        for n in range(signups):
+            user = schemas.UserCreate(username=f"{prefix}{n}", email=f"{prefix}{n}@example.com", password="bench")
+            started = time.perf_counter()
+            create(db, user)
+            timings.append(time.perf_counter() - started)
+    finally:
+        db.close()
+    timings.sort()
+    return {
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["auto", "postgres", "sqlite"], default="auto")
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--signups", type=int, default=500)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    with local_database(args.backend) as database_url:
+        os.environ["DATABASE_URL"] = database_url
+        from app import crud
+
+        crud.pwd_context.update(bcrypt__rounds=4)
+        engine = create_engine(database_url)
+        started = time.perf_counter()
+        seed_users(engine, args.users)
+        print(f"seeded {args.users} users in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        session_factory = sessionmaker(bind=engine)
+        legacy = time_signups(session_factory, legacy_create_user, "legacy", args.signups)
+        current = time_signups(session_factory, crud.create_user, "current", args.signups)
+        dialect = engine.dialect.name
+        engine.dispose()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": dialect,
+            "users": args.users,
+            "signups": args.signups,
+        },
+        "legacy": legacy,
+        "single_insert": current,
+        "speedup_p50": round(legacy["p50_ms"] / current["p50_ms"], 2) if current["p50_ms"] else None,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
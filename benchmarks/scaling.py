@@ -0,0 +1,167 @@
+"""
+    Throughput of the production server (app/serve.py) by number of workers
+
+    Usage:
+        python -m benchmarks.scaling --workers 1,2,4,8 --concurrency 64 --output scaling.json
+
+    Seeds one database, then for every worker count starts
+    `python -m app.serve` on a free port, waits for /health/ready and runs
+    the read scenarios of benchmarks/load_test.py against it. The report has
+    the throughput per worker count and the scaling efficiency
+    (throughput / (workers x single worker throughput)).
+
+    The load generator is one asyncio process: check its own CPU usage
+    (or run it from another machine with load_test --url) before blaming
+    the server for a flat curve. Use Postgres (BENCH_DATABASE_URL or a local
+    initdb) for meaningful numbers, sqlite serializes the workers on its file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from .db import _free_port, local_database
+from .load_test import git_revision, run_load
+
+READ_SCENARIOS = "list_orders,filter_orders,list_products,list_clients"
+
+
+def start_server(database_url, workers, port):
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        SENTRY_DSN="",
+        WEB_CONCURRENCY=str(workers),
+        HOST="127.0.0.1",
+        PORT=str(port),
+    )
+    return subprocess.Popen([sys.executable, "-m", "app.serve"], env=env)
+
+
+def wait_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health/ready", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{base_url} not ready after {timeout}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["auto", "postgres", "sqlite"], default="auto")
+    parser.add_argument("--workers", default=None, help="comma separated worker counts, default: 1,2,4.. up to the cores")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=100, help="untimed requests per scenario")
+    parser.add_argument("--scenarios", default=READ_SCENARIOS)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def worker_counts(value):
+    if value:
+        return [int(count) for count in value.split(",")]
+    counts, count = [], 1
+    while count < (os.cpu_count() or 1):
+        counts.append(count)
+        count *= 2
+    return counts + [os.cpu_count() or 1]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    with local_database(args.backend) as database_url:
+        os.environ["DATABASE_URL"] = database_url
+        os.environ.setdefault("SENTRY_DSN", "")
+        from sqlalchemy import create_engine
+        from .seed import seed_database
+
+        engine = create_engine(database_url)
+        volumes = seed_database(
+            engine, products=args.products, clients=args.clients,
+            orders=args.orders, items=args.items, seed=args.seed,
+        )
+        dialect = engine.dialect.name
+        engine.dispose()
+
+        runs = {}
+        for workers in worker_counts(args.workers):
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            process = start_server(database_url, workers, port)
+            try:
+                wait_ready(base_url)
+                print(f"{workers} workers", file=sys.stderr)
+
+                async def run():
+                    limits = httpx.Limits(max_connections=args.concurrency)
+                    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+                        return await run_load(client, args, volumes)
+
+                runs[workers] = asyncio.run(run())
+            finally:
+                stop_server(process)
+
+    single = runs.get(1) or runs[min(runs)]
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": dialect,
+            "volumes": volumes,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+        },
+        "workers": {
+            str(workers): {
+                name: {
+                    "throughput_rps": result["throughput_rps"],
+                    "p99_ms": result["latency_ms"]["p99"],
+                    "efficiency": round(
+                        result["throughput_rps"] / (workers / min(runs) * single[name]["throughput_rps"]), 2
+                    ) if single[name]["throughput_rps"] else None,
+                }
+                for name, result in results.items()
+            }
+            for workers, results in runs.items()
+        },
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+    Validate/serialize throughput of the order schemas, 1000-order payloads
+
+    Usage:
+        python -m benchmarks.schemas --orders 1000 --items 5 --output schemas.json
+
+    Builds, without a database, ORM-like orders (attributes, not dicts) and
+    turns the whole list into a JSON body two ways:
+
+        per_model     Order.model_validate on each order, then
+                      jsonable_encoder + json.dumps (what render_json does)
+        list_adapter  one TypeAdapter(List[Order]), built once: validate_python
+                      of the list, then dump_json
+
+    Run it on two revisions to compare them, the report carries the git
+    revision.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SENTRY_DSN", "")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app import schemas  # noqa: E402
+
+from .load_test import git_revision, percentile  # noqa: E402
+
+STATUSES = ["pending", "paid", "shipped", "delivered", "cancelled"]
+
+
+def synthetic_orders(orders, items, seed):
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    result = []
+    for order_id in range(1, orders + 1):
+        created = start + timedelta(minutes=order_id)
+        lines = []
+        for line in range(items):
+            quantity = rng.randint(1, 10)
+            price = Decimal(rng.randrange(100, 100000)).scaleb(-2)
+            lines.append(SimpleNamespace(
+                id=order_id * items + line, order_id=order_id, product_id=rng.randint(1, 10000), quantity=quantity,
+                created_at=created, updated_at=created, total_price=price * quantity,
+            ))
+        result.append(SimpleNamespace(
+            id=order_id, client_id=rng.randint(1, 1000), status=rng.choice(STATUSES), items=lines,
+            total_order_price=sum(line.total_price for line in lines),
+        ))
+    return result
+
+
+def per_model(orders):
+    return json.dumps(jsonable_encoder([schemas.Order.model_validate(order, from_attributes=True) for order in orders]))
+
+
+def timed(render, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings
+
+
+def summary(timings, orders):
+    p50 = percentile(timings, 50)
+    return {
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(percentile(timings, 95) * 1000, 2),
+        "orders_per_second": round(orders / p50),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=5, help="items per order")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    orders = synthetic_orders(args.orders, args.items, args.seed)
+    adapter = TypeAdapter(List[schemas.Order])
+
+    def list_adapter():
+        return adapter.dump_json(adapter.validate_python(orders, from_attributes=True), by_alias=True)
+
+    # same body both ways
+    assert json.loads(per_model(orders)) == json.loads(list_adapter())
+    per_model_timings = timed(lambda: per_model(orders), args.repeat)
+    adapter_timings = timed(list_adapter, args.repeat)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "orders": args.orders,
+            "items_per_order": args.items,
+            "repeat": args.repeat,
+        },
+        "per_model": summary(per_model_timings, args.orders),
+        "list_adapter": summary(adapter_timings, args.orders),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
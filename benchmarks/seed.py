@@ -0,0 +1,149 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from app import models
+from app.crud import pwd_context, rebuild_order_sections
+
+
+SECTIONS = ["hortifruti", "padaria", "acougue", "bebidas", "limpeza", "frios", "mercearia", "higiene"]
+STATUSES = ["pending", "paid", "shipped", "delivered", "canceled"]
+
+# fixed anchor so that two runs with the same seed produce the same rows
+BASE_DATE = datetime(2024, 6, 1)
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench"
+
+
+def _insert(conn, table, rows):
+    if rows:
+        conn.execute(table.insert(), rows)
+        rows.clear()
+
+
+def _reset_sequences(conn, tables):
+    if conn.dialect.name != "postgresql":
+        return
+    for table in tables:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        ))
+
+
+def seed_database(
+    engine,
+    products: int = 1000,
+    clients: int = 100,
+    orders: int = 10000,
+    items: int = 50000,
+    days: int = 365,
+    seed: int = 42,
+    chunk_size: int = 10000,
+):
+    """
+        Fill an empty database with a reproducible dataset.
+
+        Rows get explicit ids and every random value comes from one seeded
+        generator, so the same arguments always produce the same database.
+        Orders and their items are streamed in chunks, so 1M orders / 5M
+        items never sit in memory at once.
+    """
+    if items < orders:
+        raise ValueError("items must be >= orders, every order gets at least one item")
+
+    rng = random.Random(seed)
+    models.Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{
+            "id": 1,
+            "username": BENCH_USERNAME,
+            "email": "bench@example.com",
+            "hashed_password": pwd_context.hash(BENCH_PASSWORD),
+            "role": "admin",
+        }])
+
+        rows = []
+        for client_id in range(1, clients + 1):
+            rows.append({
+                "id": client_id,
+                "name": f"Cliente {client_id}",
+                "email": f"cliente{client_id}@example.com",
+                "cpf": f"{rng.randrange(10 ** 11):011d}",
+                "owner_id": 1,
+            })
+            if len(rows) >= chunk_size:
+                _insert(conn, models.Client.__table__, rows)
+        _insert(conn, models.Client.__table__, rows)
+
+        prices = [Decimal(0)] * (products + 1)
+        for product_id in range(1, products + 1):
+            prices[product_id] = Decimal(rng.randint(100, 50000)) / 100
+            rows.append({
+                "id": product_id,
+                "description": f"Produto {product_id}",
+                "sale_price": prices[product_id],
+                "barcode": f"789{product_id:010d}",
+                "session": rng.choice(SECTIONS),
+                "initial_stock": rng.randint(10 ** 6, 10 ** 7),
+                "expiration_date": BASE_DATE + timedelta(days=rng.randint(1, 720)),
+                "images": None,
+                "available": True,
+                "owner_id": 1,
+            })
+            if len(rows) >= chunk_size:
+                _insert(conn, models.Product.__table__, rows)
+        _insert(conn, models.Product.__table__, rows)
+
+        # spread the items over the orders, every order gets at least one
+        item_rows = []
+        item_id = 0
+        remaining = items
+        for order_id in range(1, orders + 1):
+            orders_left = orders - order_id + 1
+            if order_id == orders:
+                count = remaining
+            else:
+                average = remaining / orders_left
+                count = max(1, min(remaining - (orders_left - 1), int(rng.expovariate(1 / average)) + 1))
+            remaining -= count
+
+            created_at = BASE_DATE - timedelta(seconds=rng.randrange(days * 86400))
+            total = Decimal(0)
+            for _ in range(count):
+                item_id += 1
+                product_id = rng.randint(1, products)
+                quantity = rng.randint(1, 5)
+                subtotal = quantity * prices[product_id]
+                total += subtotal
+                item_rows.append({
+                    "id": item_id,
+                    "order_id": order_id,
+                    "product_id": product_id,
+                    "quantity": quantity,
+                    "subtotal": subtotal,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                })
+            rows.append({
+                "id": order_id,
+                "client_id": rng.randint(1, clients),
+                "status": rng.choice(STATUSES),
+                "total_order_price": total,
+                "subtotal": total,
+                "created_at": created_at,
+            })
+            if len(item_rows) >= chunk_size:
+                _insert(conn, models.Order.__table__, rows)
+                _insert(conn, models.OrderItem.__table__, item_rows)
+        _insert(conn, models.Order.__table__, rows)
+        _insert(conn, models.OrderItem.__table__, item_rows)
+        rebuild_order_sections(conn)
+
+        _reset_sequences(conn, ["users", "clients", "products", "orders", "order_items"])
+
+    return {"products": products, "clients": clients, "orders": orders, "items": item_id}
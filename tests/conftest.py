@@ -1,9 +1,120 @@
+import os
 from typing import Generator
-from fastapi.testclient import TestClient
+
+# Hermetic by default: every pytest(-xdist) worker process gets its own
+# in-memory database, whatever DATABASE_URL says in .env or the shell.
+# Set TEST_DATABASE_URL to run the suite against a throwaway Postgres.
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", "sqlite://")
+os.environ["SENTRY_DSN"] = ""
+
 import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import SessionLocal, engine, get_db
+
+if engine.dialect.name == "sqlite":
+    # pysqlite emits its own BEGIN lazily and breaks SAVEPOINT, let
+    # SQLAlchemy own the transaction instead (must run before the first connect)
+    @event.listens_for(engine, "connect")
+    def _sqlite_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _sqlite_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+from app import catalog, crud, dashboard, dependencies, main
 from app.main import app
+from . import factories
+
+# bcrypt at the default cost dominates the runtime of the suite
+for context in (crud.pwd_context, main.pwd_context):
+    context.update(bcrypt__rounds=4)
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    # ids are reused once a test transaction is rolled back
+    dependencies._token_versions.clear()
+    dashboard.cache.clear()
+    catalog.barcodes.clear()
+    crud.first_admin.claimed = False
+
+
+@pytest.fixture(scope="function")
+def db_session() -> Generator:
+    """
+        Session bound to a connection whose outer transaction is rolled back
+        at teardown. Commits done by the app only release a SAVEPOINT, so
+        nothing a test writes survives it.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = SessionLocal(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
 
 @pytest.fixture(scope="function")
-def client() -> Generator:
-    with TestClient(app) as c:
-        yield c
\ No newline at end of file
+def client(db_session) -> Generator:
+    def override_get_db():
+        yield db_session
+
+    app.dependency_overrides[get_db] = override_get_db
+    # not used as a context manager: the startup hooks open their own sessions
+    # outside of the test transaction
+    c = TestClient(app)
+    try:
+        yield c
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.fixture
+def user_factory(db_session):
+    return lambda **kwargs: factories.create_user(db_session, **kwargs)
+
+
+@pytest.fixture
+def client_factory(db_session):
+    return lambda **kwargs: factories.create_client(db_session, **kwargs)
+
+
+@pytest.fixture
+def product_factory(db_session):
+    return lambda **kwargs: factories.create_product(db_session, **kwargs)
+
+
+@pytest.fixture
+def order_factory(db_session):
+    return lambda **kwargs: factories.create_order(db_session, **kwargs)
+
+
+@pytest.fixture
+def user(user_factory):
+    return user_factory()
+
+
+@pytest.fixture
+def admin_user(user_factory):
+    return user_factory(role="admin")
+
+
+def auth_headers_for(user):
+    token = dependencies.create_user_access_token(user)
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def auth_headers(user):
+    return auth_headers_for(user)
+
+
+@pytest.fixture
+def admin_headers(admin_user):
+    return auth_headers_for(admin_user)
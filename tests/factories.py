@@ -0,0 +1,89 @@
+import itertools
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+
+from app import crud, models
+
+
+"""
+    Factories for the hermetic test database
+
+    Every factory flushes (never commits) into the session it receives, so
+    the rows live inside the per-test transaction from conftest.py.
+"""
+_sequence = itertools.count(1)
+
+
+@lru_cache(maxsize=None)
+def password_hash(password: str) -> str:
+    return crud.pwd_context.hash(password)
+
+
+def create_user(db, username=None, email=None, password="secret", role="regular"):
+    n = next(_sequence)
+    user = models.User(
+        username=username or f"user{n}",
+        email=email or f"user{n}@example.com",
+        hashed_password=password_hash(password),
+        role=role,
+    )
+    db.add(user)
+    db.flush()
+    return user
+
+
+def create_client(db, owner=None, name=None, email=None, cpf=None):
+    n = next(_sequence)
+    owner = owner or create_user(db)
+    client = models.Client(
+        name=name or f"Cliente {n}",
+        email=email or f"cliente{n}@example.com",
+        cpf=cpf or f"{n:011d}",
+        owner_id=owner.id,
+    )
+    db.add(client)
+    db.flush()
+    return client
+
+
+def create_product(db, description=None, sale_price=Decimal("10.00"), barcode=None, session="mercearia",
+                   initial_stock=100, expiration_date=None, available=True, owner=None, reorder_threshold=0):
+    n = next(_sequence)
+    product = models.Product(
+        description=description or f"Produto {n}",
+        sale_price=sale_price,
+        barcode=barcode or f"789{n:010d}",
+        session=session,
+        initial_stock=initial_stock,
+        expiration_date=expiration_date,
+        available=available,
+        owner_id=owner.id if owner else None,
+        reorder_threshold=reorder_threshold,
+        low_stock=initial_stock <= reorder_threshold,
+    )
+    db.add(product)
+    db.flush()
+    return product
+
+
+def create_order(db, client=None, items=None, status="pending", created_at=None):
+    """items: list of (product, quantity), one default product when omitted."""
+    client = client or create_client(db)
+    items = items if items is not None else [(create_product(db), 1)]
+    order = models.Order(client_id=client.id, status=status, created_at=created_at or datetime.utcnow())
+    db.add(order)
+    db.flush()
+    for product, quantity in items:
+        db.add(models.OrderItem(
+            order_id=order.id,
+            product_id=product.id,
+            quantity=quantity,
+            subtotal=quantity * Decimal(str(product.sale_price)),
+        ))
+    db.flush()
+    db.refresh(order)
+    order.update_total_order_price()
+    order.update_sections()
+    db.flush()
+    return order
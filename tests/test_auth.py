@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import event
+
+from app import crud, models
+from app.database import engine
+from app.dependencies import ALGORITHM, SECRET_KEY, create_access_token
+
+
+def test_token_carries_uid_role_and_version(client: TestClient, user_factory):
+    user = user_factory(username="caixa", password="caixa", role="admin")
+
+    response = client.post("/token", data={"username": "caixa", "password": "caixa"})
+
+    payload = jwt.decode(response.json()["access_token"], SECRET_KEY, algorithms=[ALGORITHM])
+    assert payload["sub"] == "caixa"
+    assert payload["uid"] == user.id
+    assert payload["role"] == "admin"
+    assert payload["ver"] == 0
+
+
+def test_authorized_request_skips_the_users_table(client: TestClient, auth_headers):
+    # first request loads the token_version into the cache
+    assert client.get("/products/", headers=auth_headers).status_code == 200
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert client.get("/products/", headers=auth_headers).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert statements
+    assert not [s for s in statements if "FROM users" in s]
+
+
+def test_read_users_requires_admin_claim(client: TestClient, auth_headers, admin_headers):
+    assert client.get("/users/", headers=auth_headers).status_code == 403
+    assert client.get("/users/", headers=admin_headers).status_code == 200
+
+
+def test_role_change_revokes_old_tokens(client: TestClient, user, auth_headers, admin_headers):
+    response = client.put(f"/users/{user.id}/role/", params={"new_role": "admin"}, headers=admin_headers)
+    assert response.status_code == 200
+
+    # the old token still says role=regular, it must not be accepted anymore
+    assert client.get("/products/", headers=auth_headers).status_code == 401
+
+
+def test_legacy_token_without_claims_is_still_accepted(client: TestClient, user):
+    token = create_access_token(data={"sub": user.username})
+
+    response = client.get("/products/", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+
+
+def login(client, user_factory):
+    user_factory(username="caixa", password="caixa")
+    return client.post("/token", data={"username": "caixa", "password": "caixa"}).json()
+
+
+def test_refresh_rotates_without_hashing(client: TestClient, user_factory, monkeypatch):
+    tokens = login(client, user_factory)
+    from app import main
+    monkeypatch.setattr(main.pwd_context, "verify", lambda *args: pytest.fail("bcrypt on refresh"))
+
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    headers = {"Authorization": f"Bearer {refreshed['access_token']}"}
+    assert client.get("/products/", headers=headers).status_code == 200
+
+
+def test_reused_refresh_token_revokes_the_family(client: TestClient, user_factory):
+    tokens = login(client, user_factory)
+    rotated = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    # replaying the rotated token looks like theft
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+    response = client.post("/token/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == 401
+
+
+def test_concurrent_refreshes_with_the_same_token(client: TestClient, user_factory, monkeypatch):
+    tokens = login(client, user_factory)
+    read_before_rotation = crud.get_refresh_token
+    stale = {}
+
+    def get_refresh_token(db, jti):
+        # the second request read the row before the first one revoked it
+        db_token = read_before_rotation(db, jti)
+        stale.setdefault(jti, SimpleNamespace(jti=db_token.jti, family_id=db_token.family_id,
+                                              user_id=db_token.user_id, revoked_at=db_token.revoked_at))
+        return stale[jti]
+
+    monkeypatch.setattr(crud, "get_refresh_token", get_refresh_token)
+    first = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    second = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    monkeypatch.undo()
+
+    assert first.status_code == 200 and second.status_code == 401
+    response = client.post("/token/refresh", json={"refresh_token": first.json()["refresh_token"]})
+    assert response.status_code == 401
+
+
+def test_revoked_refresh_token_is_rejected(client: TestClient, user_factory):
+    tokens = login(client, user_factory)
+
+    assert client.post("/token/revoke", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+
+def test_refresh_token_is_not_an_access_token(client: TestClient, user_factory):
+    tokens = login(client, user_factory)
+
+    response = client.get("/products/", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+
+    assert response.status_code == 401
+
+
+def test_purge_expired_refresh_tokens(db_session, user):
+    now = datetime.utcnow()
+    for days in (-2, -1, 1):
+        crud.create_refresh_token(db_session, user_id=user.id, family_id="f", expires_at=now + timedelta(days=days))
+    db_session.flush()
+
+    assert crud.purge_expired_refresh_tokens(db_session, batch_size=1) == 2
+    assert db_session.query(models.RefreshToken).count() == 1
@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+from app import catalog, crud, schemas
+
+
+def test_scan_one_barcode(client: TestClient, auth_headers, product_factory):
+    product = product_factory(barcode="7891000100103", sale_price=Decimal("25.90"), initial_stock=40)
+
+    response = client.get("/products/by-barcode/7891000100103", headers=auth_headers)
+
+    assert response.json() == {
+        "id": product.id, "barcode": "7891000100103", "description": product.description,
+        "sale_price": 25.9, "initial_stock": 40, "available": True,
+    }
+    assert client.get("/products/by-barcode/0000", headers=auth_headers).status_code == 404
+
+
+def test_scan_a_basket_keeps_the_order_and_reports_missing(client: TestClient, auth_headers, product_factory):
+    first, second = product_factory(barcode="111"), product_factory(barcode="222")
+
+    response = client.post("/products/by-barcode", headers=auth_headers,
+                           json={"barcodes": ["222", "999", "111", "222"]})
+
+    body = response.json()
+    assert [product["id"] for product in body["products"]] == [second.id, first.id, second.id]
+    assert body["missing"] == ["999"]
+
+
+def test_index_answers_without_the_database(db_session, product_factory):
+    product_factory(barcode="333", initial_stock=7)
+    catalog.barcodes.load(db_session)
+
+    class NoDatabase:
+        def query(self, *args):
+            raise AssertionError("the index should have answered")
+
+    assert catalog.barcodes.lookup(NoDatabase(), ["333"])["333"].initial_stock == 7
+
+
+def test_committed_product_writes_update_the_index(db_session, product_factory, admin_user):
+    product = product_factory(barcode="444", initial_stock=10)
+    catalog.barcodes.load(db_session)
+
+    crud.update_product(db_session, product.id, schemas.ProductUpdate(barcode="555", initial_stock=3))
+
+    assert "444" not in catalog.barcodes.lookup(db_session, ["444"])
+    assert catalog.barcodes._by_barcode["555"].initial_stock == 3
+
+    crud.delete_product(db_session, product.id)
+
+    assert len(catalog.barcodes) == 0
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app import catalog, models
+
+
+def order(client, headers, customer, lines):
+    return client.post("/", headers=headers, json={
+        "client_id": customer.id, "status": "pending",
+        "items": [{"product_id": product.id, "quantity": quantity} for product, quantity in lines],
+    })
+
+
+def test_basket_lines_are_checked_together(client: TestClient, auth_headers, db_session,
+                                           client_factory, product_factory):
+    customer = client_factory()
+    product = product_factory(sale_price=Decimal("2.50"), initial_stock=6)
+
+    response = order(client, auth_headers, customer, [(product, 3), (product, 2)])
+    assert response.status_code == 200
+    assert response.json()["total_order_price"] == 12.5
+    db_session.expire_all()
+    assert db_session.get(models.Product, product.id).initial_stock == 1
+
+    # 1 + 1 is more than the stock left even if each line alone fits
+    response = order(client, auth_headers, customer, [(product, 1), (product, 1)])
+    assert response.json() == {"message": f"Not enough stock available for product with id {product.id}"}
+
+
+def test_orders_are_priced_from_the_locked_rows(client: TestClient, auth_headers, db_session,
+                                               client_factory, product_factory):
+    customer = client_factory()
+    product = product_factory(sale_price=Decimal("10.00"), initial_stock=10, barcode="789")
+    catalog.barcodes.load(db_session)
+
+    # changed by another worker: the barcode index of this one still says 10.00
+    db_session.execute(update(models.Product).where(models.Product.id == product.id)
+                       .values(sale_price=Decimal("12.00")))
+    db_session.commit()
+    assert catalog.barcodes.lookup(db_session, ["789"])["789"].sale_price == Decimal("10.00")
+
+    response = order(client, auth_headers, customer, [(product, 2)])
+
+    assert response.json()["total_order_price"] == 24.0
+    # the committed stock reaches the index
+    assert catalog.barcodes.lookup(db_session, ["789"])["789"].initial_stock == 8
@@ -0,0 +1,42 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import crud, models
+
+
+def test_sellers_only_reach_their_own_clients(client: TestClient, user, auth_headers, admin_headers,
+                                              user_factory, client_factory):
+    mine = client_factory(owner=user)
+    other = client_factory(owner=user_factory())
+
+    assert [row["id"] for row in client.get("/clients/", headers=auth_headers).json()] == [mine.id]
+    assert client.get(f"/clients/{other.id}", headers=auth_headers).status_code == 404
+    assert client.put(f"/clients/{other.id}", headers=auth_headers, json={"name": "x"}).status_code == 404
+    assert client.get("/clients/batch", headers=auth_headers,
+                      params={"ids": f"{other.id},{mine.id}"}).json()["missing"] == [other.id]
+    feed = client.get("/clients/changes", headers=auth_headers).json()
+    assert [row["id"] for row in feed["changes"]] == [mine.id]
+
+    response = client.put(f"/clients/{mine.id}", headers=auth_headers, json={"name": "Novo nome"})
+    assert response.json()["name"] == "Novo nome"
+    assert {row["id"] for row in client.get("/clients/", headers=admin_headers).json()} >= {mine.id, other.id}
+
+
+def test_updating_a_client_needs_a_login(client: TestClient, client_factory):
+    assert client.put(f"/clients/{client_factory().id}", json={"name": "x"}).status_code == 401
+
+
+def test_owner_lookups_use_the_tenant_indexes(db_session, user, client_factory):
+    if db_session.get_bind().dialect.name != "sqlite":
+        pytest.skip("sqlite plan")
+    client_factory(owner=user)
+    # the session adds deleted_at IS NULL when it runs the query, compiling doesn't
+    query = crud.scope_clients(db_session.query(models.Client), user.id).filter(
+        models.Client.cpf == "1", models.Client.deleted_at.is_(None)
+    )
+    sql = str(query.statement.compile(db_session.get_bind(), compile_kwargs={"literal_binds": True}))
+
+    plan = " ".join(row[-1] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+    assert "ix_clients_owner_id_cpf" in plan
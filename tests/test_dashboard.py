@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from app import dashboard, dependencies, models
+from app.cache import TTLCache
+from app.database import Base, SessionLocal
+
+
+def test_dashboard_in_one_request(client: TestClient, auth_headers, order_factory, product_factory):
+    scarce = product_factory(initial_stock=2, reorder_threshold=5, sale_price=Decimal("5.25"))
+    product_factory(initial_stock=500)
+    first = order_factory(items=[(scarce, 2)], status="delivered")
+    last = order_factory(items=[(scarce, 1)])
+    old = order_factory(items=[(scarce, 1)], created_at=datetime.utcnow() - timedelta(days=400))
+
+    response = client.get("/dashboard", headers=auth_headers)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["counts"]["orders"] == 3
+    assert body["orders_by_status"] == {"delivered": 1, "pending": 2}
+    assert [order["id"] for order in body["recent_orders"]] == [old.id, last.id, first.id]
+    assert [product["id"] for product in body["low_stock"]] == [scarce.id]
+    assert body["revenue"]["year_to_date"] == 15.75
+
+
+def test_client_count_is_scoped_to_the_seller(client: TestClient, user, auth_headers, admin_headers,
+                                              user_factory, client_factory):
+    client_factory(owner=user)
+    client_factory(owner=user_factory())
+
+    assert client.get("/dashboard", headers=auth_headers).json()["counts"]["clients"] == 1
+    assert client.get("/dashboard", headers=admin_headers).json()["counts"]["clients"] == 2
+
+
+def test_dashboard_is_cached_per_scope(client: TestClient, user, auth_headers, admin_headers, user_factory,
+                                       order_factory):
+    other_admin = {"Authorization": f"Bearer {dependencies.create_user_access_token(user_factory(role='admin'))}"}
+    order_factory()
+    assert client.get("/dashboard", headers=auth_headers).json()["counts"]["orders"] == 1
+    assert client.get("/dashboard", headers=admin_headers).json()["counts"]["orders"] == 1
+
+    order_factory()
+
+    # the admins share one entry, the seller has their own
+    assert client.get("/dashboard", headers=other_admin).json()["counts"]["orders"] == 1
+    assert client.get("/dashboard", headers=auth_headers).json()["counts"]["orders"] == 1
+    assert dashboard.cache.get(("owner", None)) and dashboard.cache.get(("owner", user.id))
+    dashboard.cache.clear()
+    assert client.get("/dashboard", headers=auth_headers).json()["counts"]["orders"] == 2
+
+
+def test_widgets_run_on_their_own_sessions_with_an_engine(monkeypatch):
+    used = []
+
+    def widget(result):
+        return lambda db, **scope: used.append(db) or result
+
+    monkeypatch.setattr(dashboard, "WIDGETS", {
+        "counts": widget({}), "orders_by_status": widget({}), "recent_orders": widget([]),
+        "low_stock": widget([]), "revenue": widget({}),
+    })
+
+    result = asyncio.run(dashboard.build_dashboard(SessionLocal()))
+
+    assert result.counts == {}
+    assert len(set(map(id, used))) == 5
+
+
+def test_engine_bound_fan_out_is_capped(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dashboard.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with Session(engine) as setup:
+        setup.add(models.Product(description="Arroz", sale_price=Decimal("5.00"), barcode="1", session="mercearia",
+                                 initial_stock=1, reorder_threshold=5, low_stock=True))
+        setup.commit()
+    checked_out, peak = [0], [0]
+
+    def checkout(*args):
+        checked_out[0] += 1
+        peak[0] = max(peak[0], checked_out[0])
+
+    def checkin(*args):
+        checked_out[0] -= 1
+
+    event.listen(engine, "checkout", checkout)
+    event.listen(engine, "checkin", checkin)
+    monkeypatch.setattr(dashboard, "connections", threading.BoundedSemaphore(2))
+    request_session = Session(engine)
+    request_session.execute(text("SELECT 1"))  # as get_token_data on a token_version cache miss
+
+    result = asyncio.run(dashboard.build_dashboard(request_session))
+
+    assert result.counts["products"] == 1 and [product.description for product in result.low_stock] == ["Arroz"]
+    assert peak[0] <= 2 and checked_out[0] == 0
+    engine.dispose()
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(ttl=0.01, max_entries=2)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.get("c") == 3 and cache.get("a") is None
+    asyncio.run(asyncio.sleep(0.02))
+    assert cache.get("c") is None
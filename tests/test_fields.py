@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import engine
+
+
+@contextmanager
+def captured_sql():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_order_fields_narrow_the_select_and_skip_the_items(client: TestClient, auth_headers, order_factory):
+    orders = [order_factory(), order_factory()]
+
+    with captured_sql() as statements:
+        response = client.get("/", params={"fields": "id,status,total_order_price"}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": order.id, "status": "pending", "total_order_price": 10.0} for order in orders
+    ]
+    selects = [sql for sql in statements if "FROM orders" in sql]
+    assert len(selects) == 1 and "created_at" not in selects[0] and "client_id" not in selects[0]
+    assert not [sql for sql in statements if "FROM order_items" in sql]
+
+
+def test_order_items_come_in_one_query_for_the_page(client: TestClient, auth_headers, order_factory):
+    for _ in range(3):
+        order_factory()
+
+    with captured_sql() as statements:
+        response = client.get("/", params={"fields": "id,items"}, headers=auth_headers)
+
+    body = response.json()
+    assert [sorted(order) for order in body] == [["id", "items"]] * 3
+    assert body[0]["items"][0]["total_price"] == 10.0
+    assert len([sql for sql in statements if "FROM order_items" in sql]) == 1
+
+
+def test_product_fields(client: TestClient, auth_headers, product_factory):
+    product = product_factory(description="Arroz")
+
+    response = client.get("/products/", params={"fields": "description,id"}, headers=auth_headers)
+
+    assert response.json() == [{"id": product.id, "description": "Arroz"}]
+
+
+def test_unknown_field_is_rejected(client: TestClient, auth_headers):
+    response = client.get("/products/", params={"fields": "id,hashed_password"}, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert "hashed_password" in response.json()["message"]
+
+
+def test_large_responses_are_compressed(client: TestClient, auth_headers, product_factory):
+    for _ in range(20):
+        product_factory()
+
+    big = client.get("/products/", params={"limit": 20}, headers={**auth_headers, "Accept-Encoding": "gzip"})
+    small = client.get("/health/live", headers={"Accept-Encoding": "gzip"})
+
+    assert big.headers["content-encoding"] in ("gzip", "br")
+    assert len(big.json()) == 20
+    assert "content-encoding" not in small.headers
@@ -0,0 +1,79 @@
+from fastapi.testclient import TestClient
+
+from app import crud, models
+
+
+def order(client, headers, customer, product, quantity):
+    return client.post("/", headers=headers, json={
+        "client_id": customer.id, "status": "pending", "items": [{"product_id": product.id, "quantity": quantity}],
+    })
+
+
+def test_orders_crossing_the_threshold_flag_the_product(client: TestClient, auth_headers, db_session,
+                                                        client_factory, product_factory):
+    customer = client_factory()
+    product = product_factory(initial_stock=12, reorder_threshold=5)
+    product_factory(initial_stock=100, reorder_threshold=5)
+
+    assert order(client, auth_headers, customer, product, 5).status_code == 200
+    assert client.get("/products/low-stock", headers=auth_headers).json() == []
+
+    assert order(client, auth_headers, customer, product, 2).status_code == 200
+    assert order(client, auth_headers, customer, product, 1).status_code == 200
+
+    low = client.get("/products/low-stock", headers=auth_headers).json()
+    assert [(row["id"], row["initial_stock"], row["low_stock"]) for row in low] == [(product.id, 4, True)]
+    events = client.get("/products/low-stock/events", headers=auth_headers).json()
+    assert [(event["topic"], event["payload"]["initial_stock"]) for event in events] == [("product.low_stock", 5)]
+
+
+def test_restocking_emits_one_event(client: TestClient, auth_headers, product_factory):
+    product = product_factory(initial_stock=1, reorder_threshold=5)
+
+    response = client.put(f"/products/{product.id}", headers=auth_headers, json={"initial_stock": 50})
+
+    assert response.json()["low_stock"] is False
+    events = client.get("/products/low-stock/events", headers=auth_headers).json()
+    assert [event["topic"] for event in events] == ["product.restocked"]
+    after = client.get("/products/low-stock/events", params={"after": events[-1]["sequence"]}, headers=auth_headers)
+    assert after.json() == []
+
+
+def test_low_stock_pages_by_id(client: TestClient, auth_headers, product_factory):
+    products = [product_factory(initial_stock=0, reorder_threshold=1) for _ in range(3)]
+
+    first = client.get("/products/low-stock", params={"limit": 2}, headers=auth_headers).json()
+    second = client.get("/products/low-stock", params={"after_id": first[-1]["id"]}, headers=auth_headers).json()
+
+    assert [row["id"] for row in first + second] == [product.id for product in products]
+
+
+def test_new_product_below_its_threshold(client: TestClient, admin_headers, db_session):
+    response = client.post("/products/", headers=admin_headers, json={
+        "description": "Feijão", "sale_price": "8.90", "barcode": "7891000000001", "session": "mercearia",
+        "initial_stock": 3, "reorder_threshold": 10,
+    })
+
+    assert response.status_code == 200, response.text
+    assert response.json()["low_stock"] is True
+    assert db_session.query(models.OutboxEvent).filter_by(topic="product.low_stock").count() == 1
+
+
+def test_event_committed_after_a_newer_id_is_not_skipped(client: TestClient, auth_headers, db_session,
+                                                         product_factory):
+    product = product_factory(initial_stock=0, reorder_threshold=5)
+    db_session.commit()
+
+    def crossing(event_id):
+        crud.low_stock_crossing(db_session, product.id, 0, 5, False)
+        next(obj for obj in db_session.new if isinstance(obj, models.OutboxEvent)).id = event_id
+        db_session.commit()
+
+    crossing(12)
+    seen = client.get("/products/low-stock/events", headers=auth_headers).json()
+    # id 11 was inserted earlier but its transaction commits only now
+    crossing(11)
+    later = client.get("/products/low-stock/events", params={"after": seen[-1]["sequence"]},
+                       headers=auth_headers).json()
+
+    assert [event["id"] for event in seen + later] == [12, 11]
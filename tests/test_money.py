@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+from app import crud, models
+
+
+def test_order_total_is_exact(client: TestClient, auth_headers, client_factory, product_factory):
+    customer = client_factory()
+    # 3 x 0.10 + 0.20 is 0.5000000000000001 in binary floating point
+    dime = product_factory(sale_price=Decimal("0.10"))
+    twenty = product_factory(sale_price=Decimal("0.20"))
+    body = {
+        "client_id": customer.id,
+        "status": "pending",
+        "items": [{"product_id": dime.id, "quantity": 3}, {"product_id": twenty.id, "quantity": 1}],
+    }
+
+    order = client.post("/", json=body, headers=auth_headers).json()
+
+    # still a JSON number
+    assert order["total_order_price"] == 0.5
+    assert sorted(item["total_price"] for item in order["items"]) == [0.2, 0.3]
+
+
+def test_order_keeps_the_price_it_was_sold_at(client: TestClient, auth_headers, db_session, order_factory,
+                                              product_factory):
+    product = product_factory(sale_price=Decimal("4.99"))
+    order = order_factory(items=[(product, 2)])
+
+    product.sale_price = Decimal("7.00")
+    db_session.flush()
+
+    response = client.get(f"/{order.id}", headers=auth_headers)
+    assert response.json()["total_order_price"] == 9.98
+
+
+def test_update_order_reprices_changed_lines(client: TestClient, auth_headers, order_factory, product_factory):
+    product = product_factory(sale_price=Decimal("1.25"))
+    order = order_factory(items=[(product, 1)])
+
+    body = {"items": [{"product_id": product.id, "quantity": 3}]}
+    response = client.put(f"/{order.id}", json=body, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.json()["total_order_price"] == 3.75
+
+
+def test_orders_total_is_summed_in_sql(db_session, order_factory, product_factory):
+    product = product_factory(sale_price=Decimal("0.10"))
+    old = datetime.utcnow() - timedelta(days=30)
+    order_factory(items=[(product, 1)], created_at=old)
+    order_factory(items=[(product, 2)])
+    order_factory(items=[(product, 4)])
+
+    assert crud.get_orders_total(db_session) == Decimal("0.70")
+    assert crud.get_orders_total(db_session, start_date=old + timedelta(days=1)) == Decimal("0.60")
+
+
+def test_total_of_an_order_not_in_a_session_yet():
+    order = models.Order(items=[models.OrderItem(quantity=3, subtotal=Decimal("0.30")),
+                                models.OrderItem(quantity=1, subtotal=Decimal("0.20"))])
+
+    order.update_total_order_price()
+
+    assert order.total_order_price == order.subtotal == Decimal("0.50")
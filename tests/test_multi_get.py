@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import engine
+
+
+def test_products_in_the_order_asked(client: TestClient, auth_headers, product_factory):
+    first, second = product_factory(), product_factory()
+
+    response = client.get("/products/batch", headers=auth_headers, params={"ids": f"{second.id},999,{first.id}"})
+
+    body = response.json()
+    assert [product["id"] for product in body["products"]] == [second.id, first.id]
+    assert body["missing"] == [999]
+
+
+def test_clients_batch(client: TestClient, user, auth_headers, client_factory):
+    customer = client_factory(owner=user)
+
+    body = client.get("/clients/batch", headers=auth_headers, params={"ids": f"{customer.id}"}).json()
+
+    assert [row["id"] for row in body["clients"]] == [customer.id]
+    assert body["missing"] == []
+
+
+def test_orders_and_items_in_two_queries(client: TestClient, auth_headers, order_factory, product_factory):
+    orders = [order_factory(items=[(product_factory(), 1), (product_factory(), 2)]) for _ in range(5)]
+    ids = ",".join(str(order.id) for order in reversed(orders))
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "order" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        body = client.get("/batch", headers=auth_headers, params={"ids": ids}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert [order["id"] for order in body["orders"]] == [order.id for order in reversed(orders)]
+    assert all(len(order["items"]) == 2 for order in body["orders"])
+    assert len(statements) == 2
+
+
+def test_bad_ids(client: TestClient, auth_headers):
+    assert client.get("/products/batch", headers=auth_headers, params={"ids": "1,a"}).status_code == 400
+    too_many = ",".join(str(n) for n in range(1, 102))
+    assert client.get("/batch", headers=auth_headers, params={"ids": too_many}).status_code == 400
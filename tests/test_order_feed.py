@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import broker
+
+
+def create_order(client, headers, customer, product):
+    response = client.post("/", headers=headers, json={
+        "client_id": customer.id, "status": "pending", "items": [{"product_id": product.id, "quantity": 1}],
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_websocket_receives_created_and_updated_orders(client: TestClient, user, auth_headers,
+                                                       client_factory, product_factory):
+    customer, product = client_factory(), product_factory()
+    token = auth_headers["Authorization"].split()[1]
+
+    with client.websocket_connect(f"/ws/orders?token={token}&client_id={customer.id}") as websocket:
+        assert websocket.receive_json() == {"type": "subscribed"}
+        other = client_factory()
+        create_order(client, headers=auth_headers, customer=other, product=product)
+        order = create_order(client, headers=auth_headers, customer=customer, product=product)
+        client.put(f"/{order['id']}", headers=auth_headers, json={"status": "shipped", "items": []})
+
+        created = websocket.receive_json()
+        updated = websocket.receive_json()
+
+    assert (created["type"], created["order_id"], created["status"]) == ("order.created", order["id"], "pending")
+    assert (updated["type"], updated["status"], updated["previous_status"]) == ("order.updated", "shipped", "pending")
+
+
+def test_websocket_rejects_bad_tokens(client: TestClient):
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect("/ws/orders?token=garbage") as websocket:
+            websocket.receive_json()
+    assert error.value.code == 1008
+
+
+def test_only_committed_messages_are_published(db_session):
+    async def scenario():
+        subscription = broker.broker.subscribe()
+        try:
+            broker.publish_after_commit(db_session, {"type": "order.created", "order_id": 1})
+            db_session.rollback()
+            db_session.commit()
+            broker.publish_after_commit(db_session, {"type": "order.created", "order_id": 2})
+            db_session.commit()
+            await asyncio.sleep(0)
+            return [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+        finally:
+            broker.broker.unsubscribe(subscription)
+
+    assert asyncio.run(scenario()) == [{"type": "order.created", "order_id": 2}]
+
+
+def test_slow_consumers_lose_the_oldest_messages():
+    async def scenario():
+        feed = broker.Broker(queue_size=2)
+        subscription = feed.subscribe()
+        for n in range(5):
+            feed.publish({"type": "order.updated", "order_id": n})
+        await asyncio.sleep(0)
+        return [await subscription.get(), await subscription.get()]
+
+    first, second = asyncio.run(scenario())
+    assert (first["order_id"], first["dropped"]) == (3, 3)
+    assert second == {"type": "order.updated", "order_id": 4}
+
+
+def test_sse_format():
+    assert broker.format_sse({"type": "order.created", "order_id": 1}) == \
+        'event: order.created\ndata: {"type": "order.created", "order_id": 1}\n\n'
@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+from app import models
+
+
+def sections_of(db_session, order):
+    db_session.expire_all()
+    return sorted(row.section for row in db_session.get(models.Order, order.id).sections)
+
+
+def test_section_filter_returns_full_pages_without_duplicates(client: TestClient, auth_headers,
+                                                               order_factory, product_factory):
+    bread, cake = product_factory(session="padaria"), product_factory(session="padaria")
+    soap = product_factory(session="limpeza")
+    orders = [order_factory(items=[(bread, 1), (cake, 2)]) for _ in range(3)]
+    order_factory(items=[(soap, 1)])
+
+    response = client.get("/", params={"section": "padaria", "limit": 2}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert [order["id"] for order in response.json()] == [orders[0].id, orders[1].id]
+
+
+def test_sections_follow_the_order_items(client: TestClient, auth_headers, db_session,
+                                         order_factory, product_factory):
+    bread = product_factory(session="padaria")
+    soap = product_factory(session="limpeza")
+    order = order_factory(items=[(bread, 1)])
+    assert sections_of(db_session, order) == ["padaria"]
+
+    response = client.put(f"/{order.id}", headers=auth_headers, json={
+        "client_id": order.client_id, "status": "pending", "items": [{"product_id": soap.id, "quantity": 1}],
+    })
+
+    assert response.status_code == 200, response.text
+    assert sections_of(db_session, order) == ["limpeza"]
+
+
+def test_moving_a_product_moves_its_orders(client: TestClient, auth_headers, db_session,
+                                           order_factory, product_factory):
+    product = product_factory(session="padaria")
+    order = order_factory(items=[(product, 1)])
+
+    response = client.put(f"/products/{product.id}", headers=auth_headers, json={"session": "frios"})
+
+    assert response.status_code == 200, response.text
+    assert sections_of(db_session, order) == ["frios"]
+    found = client.get("/", params={"section": "frios"}, headers=auth_headers).json()
+    assert [row["id"] for row in found] == [order.id]
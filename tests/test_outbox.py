@@ -0,0 +1,91 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import models, outbox
+
+
+def events(db, topic=None):
+    query = db.query(models.OutboxEvent).order_by(models.OutboxEvent.id)
+    if topic:
+        query = query.filter(models.OutboxEvent.topic == topic)
+    return query.all()
+
+
+def test_create_order_writes_event_in_the_same_transaction(client: TestClient, auth_headers, db_session,
+                                                            client_factory, product_factory):
+    customer = client_factory()
+    product = product_factory(sale_price=2.5, initial_stock=10)
+
+    body = {"client_id": customer.id, "status": "pending", "items": [{"product_id": product.id, "quantity": 4}]}
+    response = client.post("/", json=body, headers=auth_headers)
+
+    assert response.status_code == 200
+    [event] = events(db_session, "order.created")
+    assert event.status == "pending"
+    assert event.payload["order_id"] == response.json()["id"]
+    db_session.refresh(product)
+    assert product.initial_stock == 6
+
+
+def test_failed_order_leaves_no_order_and_no_event(client: TestClient, auth_headers, db_session,
+                                                   client_factory, product_factory):
+    customer = client_factory()
+    product = product_factory(initial_stock=1)
+
+    body = {"client_id": customer.id, "status": "pending", "items": [{"product_id": product.id, "quantity": 5}]}
+    response = client.post("/", json=body, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert db_session.query(models.Order).count() == 0
+    assert events(db_session) == []
+
+
+def test_update_order_writes_event(client: TestClient, auth_headers, db_session, order_factory):
+    order = order_factory()
+    item = order.items[0]
+
+    body = {"status": "paid", "items": [{"product_id": item.product_id, "quantity": 2}]}
+    response = client.put(f"/{order.id}", json=body, headers=auth_headers)
+
+    assert response.status_code == 200
+    [event] = events(db_session, "order.updated")
+    assert event.payload["status"] == "paid"
+    assert event.payload["previous_status"] == "pending"
+
+
+def test_drain_runs_handlers_and_marks_done(db_session):
+    for n in range(3):
+        db_session.add(models.OutboxEvent(topic="order.created", payload={"n": n}))
+    db_session.flush()
+    seen = []
+
+    assert outbox.drain_once(db_session, batch_size=2, handlers={"order.created": [seen.append]}) == 2
+    assert outbox.drain_once(db_session, batch_size=2, handlers={"order.created": [seen.append]}) == 1
+
+    assert seen == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert {event.status for event in events(db_session)} == {"done"}
+
+
+def test_failing_handler_backs_off_then_gives_up(db_session, monkeypatch):
+    monkeypatch.setattr(outbox, "MAX_ATTEMPTS", 2)
+    db_session.add(models.OutboxEvent(topic="order.created", payload={}))
+    db_session.flush()
+
+    def broken(payload):
+        raise RuntimeError("smtp down")
+
+    outbox.drain_once(db_session, handlers={"order.created": [broken]})
+    [event] = events(db_session)
+    assert event.status == "pending"
+    assert event.attempts == 1
+    assert event.available_at > datetime.utcnow()
+    assert "smtp down" in event.last_error
+
+    # not due yet
+    assert outbox.drain_once(db_session, handlers={"order.created": [broken]}) == 0
+
+    event.available_at = datetime.utcnow()
+    db_session.flush()
+    outbox.drain_once(db_session, handlers={"order.created": [broken]})
+    assert event.status == "failed"
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from app import models, partitions
+from app.database import engine
+
+
+def test_add_months_crosses_years():
+    assert partitions.add_months(datetime(2024, 11, 1), 3) == datetime(2025, 2, 1)
+    assert partitions.add_months(datetime(2024, 1, 1), -1) == datetime(2023, 12, 1)
+    assert partitions.add_months(datetime(2024, 12, 1), -12) == datetime(2023, 12, 1)
+
+
+def test_partition_names_round_trip():
+    name = partitions.partition_name("order_items", datetime(2024, 6, 1))
+    assert name == "order_items_p202406"
+    assert partitions.partition_month("order_items", name) == datetime(2024, 6, 1)
+    assert partitions.partition_month("orders", "order_items_p202406") is None
+    assert partitions.partition_month("orders", "orders_default") is None
+
+
+def test_maintenance_is_a_noop_outside_postgres():
+    if engine.dialect.name == "postgresql":
+        return
+    partitions.maintain_partitions()
+
+
+def test_order_items_share_the_order_timestamp(client, auth_headers, client_factory, product_factory, db_session):
+    customer = client_factory()
+    product = product_factory()
+    response = client.post("/", headers=auth_headers, json={
+        "client_id": customer.id, "status": "pending", "items": [{"product_id": product.id, "quantity": 2}],
+    })
+    assert response.status_code == 200, response.text
+    order = db_session.get(models.Order, response.json()["id"])
+    assert [item.created_at for item in order.items] == [order.created_at]
+
+
+class RecordingConnection:
+    def __init__(self, default_rows):
+        self.default_rows = default_rows
+        self.statements = []
+
+    def exec_driver_sql(self, statement, parameters=None):
+        self.statements.append(statement)
+        return self
+
+    def first(self):
+        return (1,) if self.default_rows else None
+
+
+def test_rows_of_the_month_in_default_are_moved_into_the_new_partition(monkeypatch):
+    monkeypatch.setattr(partitions, "list_partitions", lambda conn, table: ["orders_default"])
+    conn = RecordingConnection(default_rows=True)
+
+    created = partitions.ensure_partitions(conn, "orders", months_ahead=0, today=datetime(2024, 6, 15))
+
+    assert created == ["orders_p202406"]
+    create, move, attach = conn.statements[1:]
+    assert create == "CREATE TABLE orders_p202406 (LIKE orders INCLUDING DEFAULTS)"
+    assert move.startswith("WITH moved AS (DELETE FROM orders_default")
+    assert attach.startswith("ALTER TABLE orders ATTACH PARTITION orders_p202406 FOR VALUES FROM ('2024-06-01')")
+
+
+def test_new_month_without_rows_in_default(monkeypatch):
+    monkeypatch.setattr(partitions, "list_partitions", lambda conn, table: ["orders_default"])
+    conn = RecordingConnection(default_rows=False)
+
+    partitions.ensure_partitions(conn, "orders", months_ahead=0, today=datetime(2024, 6, 15))
+
+    assert conn.statements[-1].startswith("CREATE TABLE orders_p202406 PARTITION OF orders")
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text, update
+
+from app import crud, models
+
+
+def test_expired_and_out_of_stock_products_leave_the_catalog(db_session, product_factory):
+    now = datetime(2024, 6, 1)
+    expired = [product_factory(expiration_date=now - timedelta(days=n)) for n in range(1, 4)]
+    sold_out = product_factory(initial_stock=0)
+    fresh = product_factory(expiration_date=now + timedelta(days=1))
+    no_date = product_factory(expiration_date=None)
+
+    retired = crud.retire_unavailable_products(db_session, now=now, batch_size=2)
+
+    assert retired == 4
+    db_session.expire_all()
+    assert [product.available for product in expired + [sold_out]] == [False] * 4
+    assert fresh.available and no_date.available
+    assert crud.retire_unavailable_products(db_session, now=now) == 0
+
+
+def test_restocked_products_come_back(client, auth_headers, db_session, product_factory):
+    now = datetime(2024, 6, 1)
+    restocked = product_factory(initial_stock=0, expiration_date=now + timedelta(days=30))
+    expired_meanwhile = product_factory(initial_stock=0, expiration_date=now + timedelta(days=1))
+    hidden = product_factory(initial_stock=0)
+    client.put(f"/products/{hidden.id}", headers=auth_headers, json={"available": False})
+    assert crud.retire_unavailable_products(db_session, now=now) == 2
+
+    db_session.execute(update(models.Product).values(initial_stock=5))
+    db_session.commit()
+    assert crud.retire_unavailable_products(db_session, now=now + timedelta(days=2)) == 1
+
+    db_session.expire_all()
+    assert (restocked.available, restocked.retired_reason) == (True, None)
+    assert not expired_meanwhile.available
+    assert (hidden.available, hidden.retired_reason) == (False, None)
+
+
+def test_sweep_walks_the_partial_indexes(db_session):
+    if db_session.get_bind().dialect.name != "sqlite":
+        return
+    for condition, index in (
+        (models.Product.expiration_date <= datetime(2024, 6, 1), "ix_products_available_expiration_date"),
+        (models.Product.initial_stock <= 0, "ix_products_available_initial_stock"),
+    ):
+        query = select(models.Product.id).where(models.Product.available == True, condition)
+        sql = str(query.compile(dialect=db_session.get_bind().dialect, compile_kwargs={"literal_binds": True}))
+        plan = [row[-1] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        assert plan == [f"SEARCH products USING INDEX {index} ({condition.left.name}<?)"]
+
+    query = select(models.Product.id).where(models.Product.retired_reason == "out_of_stock",
+                                            models.Product.initial_stock > 0)
+    sql = str(query.compile(dialect=db_session.get_bind().dialect, compile_kwargs={"literal_binds": True}))
+    plan = [row[-1] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    assert plan == ["SCAN products USING INDEX ix_products_out_of_stock_id"]
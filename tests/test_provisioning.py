@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+
+from app import provision, schemas
+from app.crud import pwd_context
+
+
+def payload(*users):
+    return {"users": [{"username": name, "email": f"{name}@example.com", "password": "secret"} for name in users]}
+
+
+def test_creates_the_users_and_reports_the_conflicts(client: TestClient, admin_user, admin_headers):
+    body = payload("caixa1", admin_user.username, "caixa2", "caixa1")
+
+    result = client.post("/users/bulk", headers=admin_headers, json=body).json()
+
+    assert [(user["username"], user["role"]) for user in result["created"]] == [
+        ("caixa1", "regular"), ("caixa2", "regular")
+    ]
+    assert [(row["index"], row["detail"]) for row in result["conflicts"]] == [
+        (1, "Username already registered"), (3, "Username already registered")
+    ]
+
+
+def test_only_admins(client: TestClient, auth_headers):
+    assert client.post("/users/bulk", headers=auth_headers, json=payload("caixa1")).status_code == 403
+
+
+def test_hashes_in_a_process_pool_and_inserts_in_batches(db_session, user):
+    users = [schemas.UserCreate(**row) for row in payload("a", "b", "c", "d", "e")["users"]]
+    users.append(schemas.UserCreate(username="f", email=user.email, password="secret"))
+
+    result = provision.provision_users(db_session, users, batch_size=2, workers=2)
+
+    assert [created.username for created in result["created"]] == ["a", "b", "c", "d", "e"]
+    assert result["conflicts"] == [{"index": 5, "username": "f", "email": user.email,
+                                    "detail": "Email already registered"}]
+    hashes = provision.hash_passwords(["one", "two"], workers=2)
+    assert pwd_context.verify("one", hashes[0]) and pwd_context.verify("two", hashes[1])
+    # same cost as this process, and one pool for every call
+    assert pwd_context.identify(hashes[0]) == "bcrypt" and "$04$" in hashes[0]
+    assert provision.hash_pool() is provision.hash_pool(2)
+
+
+def test_cli_reads_a_csv(tmp_path, monkeypatch, db_session):
+    path = tmp_path / "users.csv"
+    path.write_text("username,email,password\ncaixa1,caixa1@example.com,secret\n")
+    monkeypatch.setattr("app.database.SessionLocal", lambda: db_session)
+    report = tmp_path / "report.json"
+
+    assert provision.main([str(path), "--workers", "1", "--output", str(report)]) == 0
+    assert '"created": 1' in report.read_text()
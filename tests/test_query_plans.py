@@ -0,0 +1,118 @@
+import itertools
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, text
+
+from app import crud, models
+from app.database import SessionLocal, engine
+
+
+"""
+    Query plan regression suite for the order filters
+
+    Seeds enough rows for the planner to care, then EXPLAINs
+    crud.build_orders_query for every combination of filters and fails if
+    one of the large tables is read in full. The filter values are
+    selective, as in real use (last week's orders, pending orders, one
+    client), which is where a full scan hurts.
+"""
+LARGE_TABLES = {"orders", "order_items", "order_sections", "products"}
+
+ORDERS = 5000
+ITEMS_PER_ORDER = 3
+PRODUCTS = 1000
+CLIENTS = 500
+SECTIONS = [f"secao{n}" for n in range(50)]
+FIRST_DAY = datetime(2022, 1, 1)
+DAYS = 1000
+
+FILTERS = {
+    "start_date": FIRST_DAY + timedelta(days=DAYS - 7),
+    "end_date": FIRST_DAY + timedelta(days=7),
+    "section": "secao7",
+    "order_id": 42,
+    "status": "pending",
+    "client_id": 7,
+}
+COMBINATIONS = [
+    combination
+    for size in range(0, len(FILTERS) + 1)
+    for combination in itertools.combinations(FILTERS, size)
+]
+# Without sqlite_stat4 sqlite can't tell a rare status or a short open-ended
+# date range apart, so for these it walks orders in rowid order and stops at
+# the LIMIT (what Postgres reports as an Index Scan on orders_pkey). They are
+# pinned to exactly that plan on sqlite; any other combination scanning
+# orders fails.
+SQLITE_ROWID_WALK = {(), ("start_date",), ("end_date",), ("status",)}
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    """Seeded once for the module, in a transaction of its own rolled back at the end."""
+    connection = engine.connect()
+    transaction = connection.begin()
+    db_session = SessionLocal(bind=connection, join_transaction_mode="create_savepoint")
+    rng = random.Random(7)
+    db_session.execute(insert(models.User), [{"id": 1, "username": "seed", "email": "seed@example.com"}])
+    db_session.execute(insert(models.Client), [
+        {"id": n, "name": f"c{n}", "email": f"c{n}@example.com", "cpf": str(n), "owner_id": 1}
+        for n in range(1, CLIENTS + 1)
+    ])
+    db_session.execute(insert(models.Product), [
+        {"id": n, "description": f"p{n}", "sale_price": 1, "barcode": str(n),
+         "session": rng.choice(SECTIONS), "initial_stock": 10}
+        for n in range(1, PRODUCTS + 1)
+    ])
+    db_session.execute(insert(models.Order), [
+        {"id": n, "client_id": rng.randint(1, CLIENTS), "subtotal": 0, "total_order_price": 0,
+         # pending is the rare status, most orders are history
+         "status": "pending" if rng.random() < 0.02 else "delivered",
+         "created_at": FIRST_DAY + timedelta(minutes=rng.randrange(DAYS * 1440))}
+        for n in range(1, ORDERS + 1)
+    ])
+    db_session.execute(insert(models.OrderItem), [
+        {"order_id": n, "product_id": rng.randint(1, PRODUCTS), "quantity": 1, "subtotal": 1}
+        for n in range(1, ORDERS + 1)
+        for _ in range(ITEMS_PER_ORDER)
+    ])
+    crud.rebuild_order_sections(db_session)
+    db_session.execute(text("ANALYZE"))
+    try:
+        yield db_session
+    finally:
+        db_session.close()
+        transaction.rollback()
+        connection.close()
+
+
+def full_scans(db, query):
+    """Large tables the plan reads in full."""
+    dialect = db.get_bind().dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "sqlite":
+        plan = [row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        # "SCAN t", "SCAN t USING INDEX i" and "SCAN t USING COVERING INDEX i" all read every row
+        pattern = re.compile(r"^SCAN (\w+)")
+    elif dialect.name == "postgresql":
+        plan = [row[0] for row in db.execute(text(f"EXPLAIN {sql}"))]
+        pattern = re.compile(r"Seq Scan on (\w+)")
+    else:
+        pytest.skip(f"no plan parser for {dialect.name}")
+    scanned = {match.group(1) for line in plan for match in [pattern.search(line.strip())] if match}
+    return scanned & LARGE_TABLES, plan
+
+
+@pytest.mark.parametrize("combination", COMBINATIONS, ids=lambda combination: "+".join(combination) or "none")
+def test_order_filters_use_indexes(seeded, combination):
+    query = crud.build_orders_query(seeded, **{name: FILTERS[name] for name in combination})
+
+    scanned, plan = full_scans(seeded, query)
+
+    if seeded.get_bind().dialect.name == "sqlite" and combination in SQLITE_ROWID_WALK:
+        assert plan == ["SCAN orders"], "\n".join(plan)
+        return
+    assert not scanned, f"full scan of {sorted(scanned)}:\n" + "\n".join(plan)
@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import engine
+
+
+def register(client, username, email):
+    return client.post("/users/", json={"username": username, "email": email, "password": "secret"})
+
+
+def test_first_user_is_admin_and_the_next_ones_are_not(client: TestClient):
+    assert register(client, "first", "first@example.com").json()["role"] == "admin"
+    assert register(client, "second", "second@example.com").json()["role"] == "regular"
+
+
+def test_users_registered_before_the_claim_promote_nobody(client: TestClient, user):
+    assert register(client, "late", "late@example.com").json()["role"] == "regular"
+
+
+def test_duplicate_username(client: TestClient, user):
+    assert register(client, user.username, "new@example.com").json() == {"message": "Username already registered"}
+
+
+def test_duplicate_email(client: TestClient, user):
+    assert register(client, "new", user.email).json() == {"message": "Email already registered"}
+
+
+def test_registration_never_counts_the_users(client: TestClient, user):
+    register(client, "warmup", "warmup@example.com")  # this process learns first_admin is taken
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert register(client, "counted", "counted@example.com").status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert not [statement for statement in statements if "count(" in statement.lower()]
+    assert [statement.split()[0] for statement in statements if "users" in statement] == ["INSERT", "SELECT"]
@@ -1,7 +1,9 @@
 from fastapi.testclient import TestClient
 
-def test_auth_header(client: TestClient):
+
+def test_auth_header(client: TestClient, user_factory):
     # 1. Set user data for authentication
+    user_factory(username="mrdigital", password="mrdigital")
     auth_data = {
         "username": "mrdigital",
         "password": "mrdigital"
@@ -13,18 +15,25 @@ def test_auth_header(client: TestClient):
     # 3. Check if the request was successful
     assert response.status_code == 200
 
-    # 4. Get the access token from the response body
-    token = response.json()["access_token"]
+    # 4. Check the access token in the response body
+    assert response.json()["token_type"] == "bearer"
+    assert response.json()["access_token"]
 
-    # 5. Return the authorization header to be used in tests
-    return {"Authorization": f"Bearer {token}"}
 
-def test_read_clients_authenticated(client: TestClient):
-    # 1. Set user data for authentication
-    headers = test_auth_header(client)
+def test_auth_header_wrong_password(client: TestClient, user_factory):
+    user_factory(username="mrdigital", password="mrdigital")
+
+    response = client.post("/token", data={"username": "mrdigital", "password": "wrong"})
+
+    assert response.status_code == 401
+
+
+def test_read_clients_authenticated(client: TestClient, user, auth_headers, client_factory):
+    # 1. Create a client to be listed
+    client_factory(owner=user)
 
     # 2. Make a GET request to the protected endpoint
-    response = client.get("/clients/", headers=headers)
+    response = client.get("/clients/", headers=auth_headers)
 
     # 3. Verify that the request was successful
     assert response.status_code == 200
@@ -36,12 +45,12 @@ def test_read_clients_authenticated(client: TestClient):
     assert len(clients) > 0
 
 
-def test_read_products_authenticated(client: TestClient):
-    # 1. Get authorization header using token
-    headers = test_auth_header(client)
+def test_read_products_authenticated(client: TestClient, auth_headers, product_factory):
+    # 1. Create a product to be listed
+    product_factory()
 
     # 2. Make a GET request to the protected endpoint
-    response = client.get("/products/", headers=headers)
+    response = client.get("/products/", headers=auth_headers)
 
     # 3. Verify that the request was successful
     assert response.status_code == 200
@@ -53,12 +62,12 @@ def test_read_products_authenticated(client: TestClient):
     assert len(products) > 0
 
 
-def test_read_orders_authenticated(client: TestClient):
-    # 1. Get authorization header using token
-    headers = test_auth_header(client)
+def test_read_orders_authenticated(client: TestClient, auth_headers, order_factory):
+    # 1. Create an order to be listed
+    order_factory()
 
     # 2. Make a GET request to the protected endpoint
-    response = client.get("/", headers=headers)
+    response = client.get("/", headers=auth_headers)
 
     # 3. Verify that the request was successful
     assert response.status_code == 200
@@ -71,3 +80,26 @@ def test_read_orders_authenticated(client: TestClient):
     assert len(orders) > 0
 
 
+def test_requires_authentication(client: TestClient):
+    response = client.get("/clients/")
+
+    assert response.status_code == 401
+
+
+def test_each_test_starts_with_an_empty_database(db_session):
+    from app import models
+
+    # rows created by the other tests were rolled back
+    assert db_session.query(models.Order).count() == 0
+    assert db_session.query(models.User).count() == 0
+
+
+def test_create_client_commits_inside_the_test_transaction(client: TestClient, auth_headers):
+    body = {"name": "Maria", "email": "maria@example.com", "cpf": "12345678900"}
+
+    response = client.post("/clients/", json=body, headers=auth_headers)
+    assert response.status_code == 200
+
+    # the app committed, the row is visible for the rest of this test only
+    response = client.post("/clients/", json=body, headers=auth_headers)
+    assert response.status_code == 400
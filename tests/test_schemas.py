@@ -0,0 +1,26 @@
+import warnings
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from app import schemas
+
+
+def test_list_adapter_is_built_once_per_schema():
+    assert schemas.list_adapter(schemas.Order) is schemas.list_adapter(schemas.Order)
+    assert schemas.list_adapter(schemas.Order) is not schemas.list_adapter(schemas.Product)
+
+
+def test_orders_from_attributes_without_deprecation_warnings():
+    item = SimpleNamespace(id=1, order_id=1, product_id=2, quantity=3, created_at=datetime(2026, 1, 1),
+                           updated_at=None, total_price=Decimal("29.97"))
+    order = SimpleNamespace(id=1, client_id=4, status="paid", items=[item], total_order_price=Decimal("29.97"))
+    adapter = schemas.list_adapter(schemas.Order)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        body = adapter.dump_json(adapter.validate_python([order]), by_alias=True)
+
+    assert body == (b'[{"client_id":4,"status":"paid","id":1,"items":[{"product_id":2,"quantity":3,"id":1,'
+                    b'"order_id":1,"created_at":"2026-01-01T00:00:00","updated_at":null,"total_price":29.97}],'
+                    b'"total_order_price":29.97}]')
@@ -0,0 +1,44 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+
+from app import serve
+from app.database import get_db, pool_budget
+from app.main import app
+
+
+def test_pool_budget_splits_the_connections_between_workers():
+    assert pool_budget(100, workers=4, reserved=10) == (11, 11)
+    assert pool_budget(10, workers=3) == (2, 1)
+    with pytest.raises(ValueError):
+        pool_budget(8, workers=4, reserved=6)
+
+
+def test_server_options_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("KEEPALIVE_SECONDS", "75")
+    monkeypatch.setenv("MAX_REQUESTS", "10000")
+
+    options = serve.server_options()
+
+    assert options["workers"] == 3
+    assert options["timeout_keep_alive"] == 75
+    assert options["limit_max_requests"] == 10000
+    assert options["limit_concurrency"] is None
+
+
+def test_health_needs_no_authentication(client: TestClient):
+    assert client.get("/health/live").json() == {"status": "ok"}
+    assert client.get("/health/ready").json() == {"status": "ok"}
+
+
+def test_readiness_fails_without_database(client: TestClient):
+    class BrokenSession:
+        def execute(self, statement):
+            raise OperationalError(str(statement), {}, Exception("connection refused"))
+
+    app.dependency_overrides[get_db] = lambda: BrokenSession()
+    response = client.get("/health/ready")
+
+    assert response.status_code == 503
+    assert response.json() == {"message": "Database unavailable"}
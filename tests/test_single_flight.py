@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.cache import SingleFlight
+
+
+def wait_for_requests(flights, name, count):
+    deadline = time.monotonic() + 5
+    while flights.stats().get(name, {}).get("requests", 0) < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    executions = []
+
+    def slow():
+        executions.append(1)
+        started.set()
+        release.wait(5)
+        return b"[]"
+
+    with ThreadPoolExecutor(8) as pool:
+        leader = pool.submit(flights.do, "products", "key", slow)
+        started.wait(5)
+        followers = [pool.submit(flights.do, "products", "key", slow) for _ in range(7)]
+        wait_for_requests(flights, "products", 8)
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert results == [b"[]"] * 8
+    assert len(executions) == 1
+    assert flights.stats() == {"products": {"requests": 8, "executions": 1, "collapse_ratio": 0.875}}
+    # nothing is kept once the flight lands
+    assert flights.do("products", "key", lambda: b"{}") == b"{}"
+
+
+def test_followers_get_the_leader_error():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise LookupError("gone")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flights.do, "product", 1, failing)
+        started.wait(5)
+        follower = pool.submit(flights.do, "product", 1, failing)
+        wait_for_requests(flights, "product", 2)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(LookupError):
+                future.result()
+
+
+def test_product_reads_go_through_the_flights(client: TestClient, auth_headers, product_factory):
+    main.reads.reset()
+    product = product_factory()
+
+    assert client.get(f"/products/{product.id}", headers=auth_headers).json()["id"] == product.id
+    assert client.get("/products/999999", headers=auth_headers).status_code == 404
+    assert client.get("/products/", headers=auth_headers, params={"fields": "id"}).json() == [{"id": product.id}]
+
+    stats = client.get("/metrics/single-flight", headers=auth_headers).json()
+    assert stats["product"]["requests"] == 2 and stats["products"]["requests"] == 1
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app import crud, models
+
+
+def test_deleted_products_leave_every_default_query(client: TestClient, auth_headers, admin_headers,
+                                                    db_session, product_factory, order_factory):
+    product = product_factory(barcode="789")
+    order = order_factory(items=[(product, 1)])
+
+    assert client.delete(f"/products/{product.id}", headers=admin_headers).status_code == 200
+
+    assert client.get(f"/products/{product.id}", headers=auth_headers).status_code == 404
+    assert client.get("/products/", headers=auth_headers).json() == []
+    assert client.get("/products/by-barcode/789", headers=auth_headers).status_code == 404
+    assert client.get("/dashboard", headers=admin_headers).json()["counts"]["products"] == 0
+    # the order still has its item and the item its product
+    db_session.expire_all()
+    assert db_session.get(models.Order, order.id).items[0].product.id == product.id
+    # and the barcode can be given to a new product
+    assert product_factory(barcode="789").id != product.id
+
+
+def test_order_sections_keep_deleted_products(db_session, product_factory, order_factory):
+    deleted, kept = product_factory(session="bebidas"), product_factory(session="mercearia")
+    order = order_factory(items=[(deleted, 1), (kept, 1)])
+    crud.delete_product(db_session, deleted.id)
+
+    order.update_sections()  # what editing the order does
+    db_session.flush()
+
+    assert sorted(row.section for row in order.sections) == ["bebidas", "mercearia"]
+    crud.rebuild_order_sections(db_session, product_id=kept.id)
+    db_session.expire_all()
+    assert sorted(row.section for row in db_session.get(models.Order, order.id).sections) == ["bebidas", "mercearia"]
+
+
+def test_deleted_clients_are_hidden_but_kept(db_session, client_factory):
+    customer = client_factory()
+
+    assert crud.delete_client(db_session, customer.id)
+
+    assert crud.get_client_by_id(db_session, customer.id) is None
+    kept = db_session.scalars(
+        select(models.Client).where(models.Client.id == customer.id).execution_options(include_deleted=True)
+    ).one()
+    assert kept.deleted_at is not None
+
+
+def test_purge_archives_only_old_unreferenced_rows(db_session, product_factory, order_factory):
+    ordered, unordered, recent = product_factory(), product_factory(), product_factory()
+    ids = ordered.id, unordered.id, recent.id
+    order_factory(items=[(ordered, 1)])
+    for product in (ordered, unordered, recent):
+        crud.delete_product(db_session, product.id)
+    for product in (ordered, unordered):
+        product.deleted_at = datetime.utcnow() - timedelta(days=100)
+    db_session.commit()
+
+    moved = crud.purge_deleted(db_session, models.Product, datetime.utcnow() - timedelta(days=90), batch_size=1)
+
+    assert moved == 1
+    assert db_session.execute(select(models.products_archive.c.id)).scalars().all() == [ids[1]]
+    remaining = db_session.scalars(
+        select(models.Product.id).order_by(models.Product.id).execution_options(include_deleted=True)
+    ).all()
+    assert remaining == [ids[0], ids[2]]
@@ -0,0 +1,95 @@
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import crud, schemas
+from app.database import engine
+
+
+def changes(client, headers, path, since, limit=500):
+    return client.get(path, headers=headers, params={"since": since, "limit": limit}).json()
+
+
+def test_product_feed_returns_writes_and_deletes_in_order(client: TestClient, auth_headers, db_session,
+                                                          product_factory):
+    first, second, third = product_factory(), product_factory(), product_factory()
+    db_session.commit()
+
+    feed = changes(client, auth_headers, "/products/changes", 0)
+    assert [product["id"] for product in feed["changes"]] == [first.id, second.id, third.id]
+    assert feed["deleted"] == [] and feed["more"] is False
+    since = feed["next"]
+
+    crud.update_product(db_session, first.id, schemas.ProductUpdate(sale_price=Decimal("9.99")))
+    crud.delete_product(db_session, second.id)
+
+    feed = changes(client, auth_headers, "/products/changes", since)
+    assert [(product["id"], product["sale_price"]) for product in feed["changes"]] == [(first.id, 9.99)]
+    assert feed["deleted"] == [second.id]
+    assert changes(client, auth_headers, "/products/changes", feed["next"])["changes"] == []
+
+
+def test_feed_comes_in_batches(client: TestClient, auth_headers, db_session, product_factory):
+    ids = [product_factory().id for _ in range(5)]
+    db_session.commit()
+
+    seen, since, more = [], 0, True
+    while more:
+        feed = changes(client, auth_headers, "/products/changes", since, limit=2)
+        seen += [product["id"] for product in feed["changes"]]
+        since, more = feed["next"], feed["more"]
+
+    assert seen == ids
+
+
+def test_unchanged_save_and_retired_products(client: TestClient, auth_headers, db_session, product_factory):
+    product = product_factory(initial_stock=0)
+    db_session.commit()
+    since = changes(client, auth_headers, "/products/changes", 0)["next"]
+
+    crud.update_product(db_session, product.id, schemas.ProductUpdate())
+    assert changes(client, auth_headers, "/products/changes", since)["changes"] == []
+
+    crud.retire_unavailable_products(db_session)
+    feed = changes(client, auth_headers, "/products/changes", since)
+    assert [(row["id"], row["available"]) for row in feed["changes"]] == [(product.id, False)]
+
+
+def test_client_feed(client: TestClient, user, auth_headers, db_session, client_factory):
+    kept, removed = client_factory(owner=user), client_factory(owner=user)
+    db_session.commit()
+    since = changes(client, auth_headers, "/clients/changes", 0)["next"]
+
+    crud.update_client(db_session, kept.id, schemas.ClientUpdate(name="Novo nome"))
+    crud.delete_client(db_session, removed.id)
+
+    feed = changes(client, auth_headers, "/clients/changes", since)
+    assert [(row["id"], row["name"]) for row in feed["changes"]] == [(kept.id, "Novo nome")]
+    assert feed["deleted"] == [removed.id]
+
+
+def test_retire_locks_the_version_counter_before_the_products(db_session, product_factory):
+    product_factory(initial_stock=0)
+    db_session.commit()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.split()[:3]))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert crud.retire_unavailable_products(db_session) == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert statements.index("UPDATE row_versions SET") < statements.index("SELECT products.id FROM")
+
+
+def test_feed_leaves_the_stock_out(client: TestClient, auth_headers, db_session, product_factory):
+    product_factory()
+    db_session.commit()
+
+    product = changes(client, auth_headers, "/products/changes", 0)["changes"][0]
+
+    assert "initial_stock" not in product and "low_stock" not in product